@@ -1,12 +1,20 @@
+import asyncio
 import json
 import re
-from typing import Any, Dict, List, Optional
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 
 from ..api.dependencies import get_current_user_id, get_database
+from ..api.sse import format_sse, sse_response
+from ..llm_adapters.base import LLMAdapter
 from ..llm_adapters.factory import adapter_factory
+from ..llm_adapters.resilience import CircuitOpenError
 from ..schemas import (
+    ChatContextReport,
     ChatMessagePayload,
     ChatMessageRecord,
     ChatMessageResponse,
@@ -14,7 +22,19 @@ from ..schemas import (
     ChatSessionHistoryResponse,
     ChatSessionRead,
 )
-from ..services import chat_service, provider_credentials_service
+from ..services import (
+    chat_context,
+    chat_service,
+    chat_summarizer,
+    patching,
+    provider_credentials_service,
+    rate_limiter,
+    revision_service,
+    single_flight,
+    task_service,
+    usage_service,
+)
+from ..services.tokens import with_cached_tokens
 from ..config import get_settings
 import difflib
 
@@ -31,6 +51,9 @@ When replying, use the same language as the latest user message unless explicitl
 """.strip()
 
 
+_PYTHON_BLOCK = re.compile(r"```(?:python|py)[ \t]*\n(.*?)```", re.DOTALL)
+
+
 def _serialize_message(message: Dict[str, Any]) -> str:
     content = message.get("content")
     if isinstance(content, list):
@@ -157,28 +180,170 @@ def _try_build_patch_from_json_patches(raw_text: str, base_code: Optional[str])
     return patch_text if patch_text.strip() else None
 
 
-def _augment_user_content(message: ChatMessagePayload, context: Optional[dict]) -> str:
-    content = message.content
-    if context:
-        fragments: List[str] = [content, "\n\n--- Context Snapshot ---"]
-        if context.get("code_snapshot"):
-            fragments.append("Current code:\n" + context["code_snapshot"])
-        if context.get("stdout"):
-            fragments.append("Last stdout:\n" + context["stdout"])
-        if context.get("stderr"):
-            fragments.append("Last stderr:\n" + context["stderr"])
-        content = "\n\n".join(fragments)
-    return content
+@dataclass
+class _ChatTurn:
+    session_id: int
+    user_id: int
+    model: str
+    adapter: LLMAdapter
+    messages: List[Dict[str, str]]
+    model_param: Optional[str]
+    base_code: Optional[str]
+    reservation: rate_limiter.Reservation
+    context_report: ChatContextReport
+    revision_id: Optional[int] = None
+
+    @property
+    def prompt_cache_key(self) -> str:
+        return f"chat-session-{self.session_id}"
+
+
+def _build_prompt_messages(
+    messages: List[ChatMessagePayload],
+    context: Optional[Dict[str, Any]],
+    generated_code: Optional[str],
+    *,
+    model: str,
+    summary: Optional[str] = None,
+) -> Tuple[List[Dict[str, str]], ChatContextReport]:
+    """Build the provider messages for a turn within the model's chat token budget.
+
+    Messages run from most to least stable so provider prefix caches keep hitting:
+    instructions and the task script, the session summary standing in for the turns it
+    covers, then the history, then the latest user turn (the only one carrying the code
+    snapshot and run output) and per-turn directives.
+    """
+    latest = messages[-1]
+    head = [{"role": "system", "content": SYSTEM_INSTRUCTIONS}]
+    history = [{"role": message.role, "content": message.content} for message in messages[:-1]]
 
+    script_message = None
+    if generated_code:
+        script_message = {
+            "role": "system",
+            "content": (
+                "Here is the current Python script that the user is working with."
+                " When responding, reference and modify this code only via diff patches.\n\n"
+                f"```python\n{generated_code}\n```"
+            ),
+        }
+        head.append(script_message)
+    summary_message = None
+    if summary:
+        summary_message = {
+            "role": "system",
+            "content": f"Summary of the earlier conversation (not repeated below):\n{summary}",
+        }
+        head.append(summary_message)
+
+    turn_context = context
+    unchanged = "(unchanged from the current script above)"
+    if (
+        script_message
+        and context
+        and context.get("code_snapshot") == generated_code
+        and len(generated_code) > len(unchanged)
+    ):
+        # Do not repeat the script the prefix already carries.
+        turn_context = {**context, "code_snapshot": unchanged}
+    latest_content, truncated_outputs = chat_context.render_turn_context(latest.content, turn_context)
 
-@router.post("/send", response_model=ChatMessageResponse)
-async def send_chat(
-    payload: ChatSendRequest,
-    db=Depends(get_database),
-    user_id: int = Depends(get_current_user_id),
-) -> ChatMessageResponse:
+    # Language steering based on the last user message
+    if _detect_lang(latest.content) == "zh":
+        language_message = {
+            "role": "system",
+            "content": (
+                "For this turn, reply strictly in Simplified Chinese (zh-CN). "
+                "All fields in the JSON ('reply' and 'reasoning') must be Chinese."
+            ),
+        }
+    else:
+        language_message = {
+            "role": "system",
+            "content": (
+                "For this turn, reply strictly in English. "
+                "All fields in the JSON ('reply' and 'reasoning') must be English."
+            ),
+        }
+    tail = [{"role": "user", "content": latest_content}, language_message]
+
+    _, budget = chat_context.resolve_chat_budget(model)
+    fitted, dropped = chat_context.fit_messages(head, history, tail, budget=budget)
+
+    # Unbudgeted cost for comparison, the prompt as it was built before budgeting: every
+    # user turn carried the full context and the task script was always attached. The
+    # summary stays, standing in for the turns it covers, which ``messages`` lacks.
+    unbudgeted = [
+        {"role": "system", "content": SYSTEM_INSTRUCTIONS},
+        *([summary_message] if summary_message else []),
+        *(
+            {
+                "role": message.role,
+                "content": (
+                    chat_context.render_full_context(message.content, context)
+                    if message.role == "user"
+                    else message.content
+                ),
+            }
+            for message in messages
+        ),
+        *([script_message] if script_message else []),
+        language_message,
+    ]
+    report = ChatContextReport(
+        budget=budget,
+        tokens_before=chat_context.estimate_messages(unbudgeted),
+        tokens_after=chat_context.estimate_messages(fitted),
+        dropped_messages=dropped,
+        truncated_outputs=truncated_outputs,
+    )
+    chat_context.record(report)
+    return fitted, report
+
+
+async def _load_turn_rows(
+    db, payload: ChatSendRequest, user_id: int, revision_id: Optional[int]
+) -> Tuple[Dict[str, Any], Optional[Any], Optional[Any], Optional[Tuple[Dict[str, Any], str]]]:
+    """Credentials, session, task and requested revision of a turn, read concurrently."""
+
+    async def _none() -> None:
+        return None
+
+    return await asyncio.gather(
+        provider_credentials_service.get_credentials_map(db, user_id),
+        chat_service.get_session(db, payload.session_id, user_id) if payload.session_id else _none(),
+        task_service.get_task(db, payload.task_id, user_id) if payload.task_id else _none(),
+        revision_service.get_revision(db, revision_id, user_id=user_id, task_id=payload.task_id)
+        if payload.task_id and revision_id
+        else _none(),
+    )
+
+
+async def _matches_stored_tail(
+    db, session_id: int, through_id: int, resent: List[ChatMessagePayload]
+) -> bool:
+    """Whether the turns a client resent after the summarized prefix are the stored ones.
+
+    Only then does dropping the prefix in favour of the summary lose nothing; a client
+    that edited or trimmed its transcript is sent in full instead.
+    """
+    stored = await chat_service.load_history(db, session_id, after_id=through_id)
+    if len(stored) >= get_settings().chat_history_max_messages:
+        # The stored history is windowed, so only its most recent turns can be compared.
+        resent = resent[-len(stored):]
+    elif len(resent) != len(stored):
+        return False
+    return [(m.role, m.content) for m in resent] == [(m.role, m.content) for m in stored]
+
+
+async def _prepare_chat_turn(payload: ChatSendRequest, db, user_id: int) -> _ChatTurn:
+    """Validate the request, persist the user message and build the provider messages."""
     provider, _, variant = payload.model.partition(":")
-    stored_map = await provider_credentials_service.get_credentials_map(db, user_id)
+    context_payload = payload.context.model_dump() if payload.context else None
+    requested_revision = context_payload.get("revision_id") if context_payload else None
+    stored_map, session, task, found_revision = await _load_turn_rows(
+        db, payload, user_id, requested_revision
+    )
     stored_overrides = provider_credentials_service.credential_payloads_to_overrides(stored_map)
     request_override = (payload.provider_overrides or {}).get(provider)
     override = provider_credentials_service.merge_overrides(
@@ -196,136 +361,297 @@ async def send_chat(
         forced = settings.openai_default_models[0] if settings.openai_default_models else "gpt-4o"
         effective_model_str = f"openai:{forced}"
 
-    session_id = await chat_service.ensure_session(
-        db,
-        session_id=payload.session_id,
-        task_id=payload.task_id,
-        model=effective_model_str,
-        user_id=user_id,
-    )
-
-    # Persist incoming user message (assume last message is most recent user turn)
-    if not payload.messages:
+    # Validate before touching the session (assume last message is most recent user turn)
+    summary = session["summary"] if session else None
+    if payload.message is not None:
+        if payload.messages:
+            raise HTTPException(status_code=400, detail="Send either messages or message, not both.")
+        if not payload.session_id:
+            raise HTTPException(status_code=400, detail="session_id is required when sending only message.")
+        if not session:
+            raise HTTPException(status_code=404, detail="Chat session not found")
+        history = await chat_service.load_history(
+            db, payload.session_id, after_id=session["summary_through_id"] if summary else None
+        )
+        messages = [*history, ChatMessagePayload(role="user", content=payload.message)]
+    else:
+        messages = payload.messages
+        folded = session["summary_message_count"] if summary else 0
+        if folded and len(messages) > folded and await _matches_stored_tail(
+            db, payload.session_id, session["summary_through_id"], messages[folded:-1]
+        ):
+            # The client resent the whole transcript; the summary stands in for its start.
+            messages = messages[folded:]
+        else:
+            summary = None
+    if not messages:
         raise HTTPException(status_code=400, detail="Chat messages cannot be empty.")
 
-    latest = payload.messages[-1]
+    latest = messages[-1]
     if latest.role != "user":
         raise HTTPException(status_code=400, detail="Last message must be from the user.")
 
-    context_payload = payload.context.model_dump() if payload.context else None
-    await chat_service.append_message(
-        db,
-        session_id=session_id,
-        role="user",
-        content=latest.content,
-        metadata=context_payload,
-    )
+    generated_code = (task.generated_code or None) if task else None
+    revision_id = None
+    if payload.task_id and requested_revision:
+        if found_revision is None:
+            raise HTTPException(status_code=404, detail="Code revision not found")
+        revision_id = found_revision[0]["id"]
+        context_payload["code_snapshot"] = found_revision[1]
 
-    system_message = {"role": "system", "content": SYSTEM_INSTRUCTIONS}
-    serialized_messages: List[Dict[str, str]] = [system_message]
-    for message in payload.messages:
-        if message.role == "user":
-            content = _augment_user_content(message, context_payload)
-        else:
-            content = message.content
-        serialized_messages.append({"role": message.role, "content": content})
+    serialized_messages, context_report = _build_prompt_messages(
+        messages, context_payload, generated_code, model=effective_model_str, summary=summary
+    )
 
-    generated_code = None
-    if payload.task_id:
-        latest_task = await chat_service.get_latest_task_code(db, payload.task_id, user_id)
-        if latest_task:
-            generated_code = latest_task
+    # Admit the turn before anything is persisted so a rejected request leaves no trace.
+    reservation = await rate_limiter.acquire(
+        user_id,
+        adapter.name,
+        estimated_tokens=context_report.tokens_after + get_settings().rate_limit_completion_token_estimate,
+    )
 
-    if generated_code:
-        serialized_messages.append(
-            {
-                "role": "system",
-                "content": (
-                    "Here is the current Python script that the user is working with."
-                    " When responding, reference and modify this code only via diff patches.\n\n"
-                    f"```python\n{generated_code}\n```"
-                ),
-            }
+    # Until the turn is persisted, a failure hands the reservation back.
+    with reservation.released_on_error():
+        stored_context = context_payload
+        if payload.task_id and context_payload and context_payload.get("code_snapshot"):
+            if revision_id is None and task is not None:
+                revision = await revision_service.record_revision(
+                    db,
+                    payload.task_id,
+                    user_id=user_id,
+                    code=context_payload["code_snapshot"],
+                    source="chat",
+                )
+                revision_id = revision["id"]
+            if revision_id is not None:
+                # Store a reference to the script rather than another copy of it.
+                stored_context = {
+                    **context_payload,
+                    "code_snapshot": None,
+                    "revision_id": revision_id,
+                }
+
+        # Persist the session and the incoming user message together.
+        session_id = await chat_service.start_turn(
+            db,
+            session=session,
+            task_id=payload.task_id,
+            model=effective_model_str,
+            user_id=user_id,
+            content=latest.content,
+            metadata=stored_context,
         )
 
-    # Language steering based on the last user message
-    user_lang = _detect_lang(latest.content)
-    if user_lang == "zh":
-        serialized_messages.append(
-            {
-                "role": "system",
-                "content": (
-                    "For this turn, reply strictly in Simplified Chinese (zh-CN). "
-                    "All fields in the JSON ('reply' and 'reasoning') must be Chinese."
-                ),
-            }
-        )
-    else:
-        serialized_messages.append(
-            {
-                "role": "system",
-                "content": (
-                    "For this turn, reply strictly in English. "
-                    "All fields in the JSON ('reply' and 'reasoning') must be English."
-                ),
-            }
-        )
+    # When using Default Model for OpenAI, force backend default (e.g., GPT-4o)
+    model_param: Optional[str] = variant or None
+    if provider == "openai" and not variant:
+        settings = get_settings()
+        model_param = settings.openai_default_models[0] if settings.openai_default_models else "gpt-4o"
+
+    return _ChatTurn(
+        session_id=session_id,
+        user_id=user_id,
+        model=effective_model_str,
+        adapter=adapter,
+        messages=serialized_messages,
+        model_param=model_param,
+        base_code=(context_payload.get("code_snapshot") if context_payload else None) or generated_code,
+        reservation=reservation,
+        context_report=context_report,
+        revision_id=revision_id,
+    )
 
-    try:
-        # When using Default Model for OpenAI, force backend default (e.g., GPT-4o)
-        model_param: Optional[str] = variant or None
-        if provider == "openai" and not variant:
-            settings = get_settings()
-            model_param = settings.openai_default_models[0] if settings.openai_default_models else "gpt-4o"
-        result = await adapter.chat(
-            serialized_messages,
-            model=model_param,
-            response_format={"type": "json_object"},
-        )
-    except NotImplementedError:
-        raise HTTPException(status_code=400, detail="Selected model does not support chat.")
-    except Exception as exc:  # pragma: no cover
-        raise HTTPException(status_code=502, detail=f"LLM provider error: {exc}") from exc
 
-    message_payload = result.get("message", {})
+async def _finalize_chat_turn(
+    db,
+    turn: _ChatTurn,
+    message_payload: Dict[str, Any],
+    usage: Optional[dict],
+    *,
+    endpoint: str,
+    latency_ms: float,
+    shared: bool = False,
+) -> ChatMessageResponse:
+    """Parse the assistant reply, normalize its patch and persist it.
+
+    ``shared`` replies came from an identical call another request made, so this turn
+    is not charged: its token reservation is returned and no usage is recorded.
+    """
+    usage = with_cached_tokens(usage)
+    if shared:
+        turn.reservation.release()
+    else:
+        turn.reservation.settle(usage)
+        chat_context.record_usage(usage)
+        usage_service.record(
+            user_id=turn.user_id,
+            provider=turn.adapter.name,
+            model=turn.model,
+            endpoint=endpoint,
+            usage=usage,
+            latency_ms=latency_ms,
+        )
     structured = _parse_structured_response(message_payload)
-    # Try to ensure patch is unified diff. Prefer provider-provided patch; otherwise convert.
-    base_code = (context_payload.get("code_snapshot") if context_payload else None) or generated_code
+    base_code = turn.base_code
+    patch = structured.get("patch")
+    outcome: Optional[patching.PatchOutcome] = None
     if base_code:
-        # Case 1: structured.patch exists but isn't a diff; interpret as full new code and diff it.
-        if structured.get("patch") and not _is_diff_patch(structured.get("patch")):
-            candidate_new = _strip_code_fence(structured["patch"] or "")
-            if candidate_new.strip():
-                patch_text = _build_unified_diff(base_code, candidate_new)
-                if patch_text.strip():
-                    structured["patch"] = patch_text
-        # Case 2: No patch at all – try RFC6902-like patches on top of current code.
-        if structured.get("patch") is None:
-            maybe_patch = _try_build_patch_from_json_patches(_serialize_message(message_payload), base_code)
-            if maybe_patch:
-                structured["patch"] = maybe_patch
-
-    await chat_service.append_message(
+        if not patch:
+            # RFC6902-like patches on top of the current code.
+            patch = _try_build_patch_from_json_patches(_serialize_message(message_payload), base_code)
+        if patch:
+            # Apply the diff here so a hunk that misses surfaces now rather than in the editor.
+            # Full scripts (a patch that is not a diff, python blocks in the reply) are the
+            # fallback and get diffed against the base instead.
+            is_diff = _is_diff_patch(patch)
+            candidates = [] if is_diff else [_strip_code_fence(patch)]
+            candidates.extend(
+                block
+                for block in _PYTHON_BLOCK.findall(structured["reply"] or "")
+                if patching.keeps_most_of(base_code, block)
+            )
+            outcome = patching.resolve_patch(
+                base_code,
+                patch if is_diff else None,
+                model=turn.model,
+                candidates=candidates,
+                build_diff=_build_unified_diff,
+                fuzz=get_settings().chat_patch_fuzz_lines,
+            )
+            patch = outcome.patch or patch
+    structured["patch"] = patch
+    patch_status = outcome.status if outcome else None
+
+    await chat_service.queue_message(
         db,
-        session_id=session_id,
+        session_id=turn.session_id,
         role="assistant",
         content=structured["reply"] or "",
         metadata={
             "patch": structured.get("patch"),
+            "patch_status": patch_status,
             "reasoning": structured.get("reasoning"),
-            "usage": result.get("usage"),
+            "usage": usage,
         },
     )
+    chat_summarizer.schedule(turn.session_id, turn.user_id)
 
     return ChatMessageResponse(
-        session_id=session_id,
+        session_id=turn.session_id,
         message=ChatMessagePayload(role="assistant", content=structured["reply"] or ""),
         reasoning=structured.get("reasoning"),
         patch=structured.get("patch"),
-        usage=result.get("usage"),
+        patched_code=outcome.code if outcome else None,
+        patch_status=patch_status,
+        usage=usage,
+        context=turn.context_report,
+        revision_id=turn.revision_id,
+    )
+
+
+@router.post("/send", response_model=ChatMessageResponse)
+async def send_chat(
+    payload: ChatSendRequest,
+    db=Depends(get_database),
+    user_id: int = Depends(get_current_user_id),
+) -> ChatMessageResponse:
+    turn = await _prepare_chat_turn(payload, db, user_id)
+    response_format = {"type": "json_object"}
+    # The prompt cache key only routes the request, so turns from different sessions
+    # with the same messages still share a call.
+    flight_key = single_flight.build_key(
+        "chat",
+        user_id=user_id,
+        model=turn.model,
+        payload=turn.messages,
+        params={"model": turn.model_param, "response_format": response_format},
+    )
+    started = time.perf_counter()
+    try:
+        with turn.reservation.released_on_error():
+            result, shared = await single_flight.run(
+                flight_key,
+                lambda: turn.adapter.chat(
+                    turn.messages,
+                    model=turn.model_param,
+                    response_format=response_format,
+                    prompt_cache_key=turn.prompt_cache_key,
+                ),
+            )
+    except NotImplementedError:
+        raise HTTPException(status_code=400, detail="Selected model does not support chat.")
+    except CircuitOpenError as exc:
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
+    except Exception as exc:  # pragma: no cover
+        raise HTTPException(status_code=502, detail=f"LLM provider error: {exc}") from exc
+
+    return await _finalize_chat_turn(
+        db,
+        turn,
+        result.get("message", {}),
+        result.get("usage"),
+        endpoint="chat.send",
+        latency_ms=(time.perf_counter() - started) * 1000,
+        shared=shared,
     )
 
 
+@router.post("/send/stream")
+async def send_chat_stream(
+    payload: ChatSendRequest,
+    db=Depends(get_database),
+    user_id: int = Depends(get_current_user_id),
+) -> StreamingResponse:
+    """Server-sent events variant of ``/send``.
+
+    Emits ``delta`` events with the raw reply text as it arrives, then a ``result`` event
+    with the parsed ``ChatMessageResponse`` once the assistant message is persisted.
+    Failures after the stream has started are reported as an ``error`` event.
+    """
+    turn = await _prepare_chat_turn(payload, db, user_id)
+
+    async def events() -> AsyncIterator[str]:
+        chunks: list[str] = []
+        usage: Optional[dict] = None
+        started = time.perf_counter()
+        yield format_sse("session", {"session_id": turn.session_id})
+        try:
+            # Also covers a client that disconnects mid-stream.
+            with turn.reservation.released_on_error():
+                async for event in turn.adapter.stream_chat(
+                    turn.messages,
+                    model=turn.model_param,
+                    response_format={"type": "json_object"},
+                    prompt_cache_key=turn.prompt_cache_key,
+                ):
+                    if event["type"] == "delta":
+                        chunks.append(event["text"])
+                        yield format_sse("delta", {"text": event["text"]})
+                    elif event["type"] == "usage":
+                        usage = event["usage"] or usage
+        except NotImplementedError:
+            yield format_sse("error", {"detail": "Selected model does not support chat."})
+            return
+        except CircuitOpenError as exc:
+            yield format_sse("error", {"detail": str(exc)})
+            return
+        except Exception as exc:  # pragma: no cover
+            yield format_sse("error", {"detail": f"LLM provider error: {exc}"})
+            return
+        message_payload = {"role": "assistant", "content": "".join(chunks)}
+        response = await _finalize_chat_turn(
+            db,
+            turn,
+            message_payload,
+            usage,
+            endpoint="chat.send.stream",
+            latency_ms=(time.perf_counter() - started) * 1000,
+        )
+        yield format_sse("result", response.model_dump())
+
+    return sse_response(events(), on_close=turn.reservation.release_unsettled)
+
+
 @router.get("/sessions", response_model=list[ChatSessionRead])
 async def list_chat_sessions(
     task_id: Optional[int] = None,
@@ -340,6 +666,7 @@ async def list_chat_sessions(
             task_id=row["task_id"],
             model=row["model"],
             title=row["title"],
+            summary=row["summary"],
             created_at=row["created_at"],
             updated_at=row["updated_at"],
         )
@@ -381,6 +708,7 @@ async def get_chat_session(
             task_id=session["task_id"],
             model=session["model"],
             title=session["title"],
+            summary=session["summary"],
             created_at=session["created_at"],
             updated_at=session["updated_at"],
         ),
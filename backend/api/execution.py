@@ -1,3 +1,4 @@
+import contextlib
 from pathlib import Path
 
 from fastapi import APIRouter, Depends, HTTPException
@@ -7,7 +8,8 @@ from ..api.dependencies import get_current_user_id, get_database
 from ..config import get_settings
 from ..sandbox.runner import CodeExecutionError, run_python_code
 from ..schemas import CodeExecutionRequest, CodeExecutionResult
-from ..services import task_service
+from ..services import dataset_service, revision_service, storage_service, task_service
+from ..services.dataset_service import DatasetIngestError
 
 router = APIRouter(prefix="/analysis", tags=["analysis"])
 settings = get_settings()
@@ -19,6 +21,12 @@ async def run_analysis(
     db=Depends(get_database),
     user_id: int = Depends(get_current_user_id),
 ) -> CodeExecutionResult:
+    if payload.dataset_filename:
+        with contextlib.suppress(DatasetIngestError):
+            source = dataset_service.resolve_user_dataset(payload.dataset_filename, user_id)
+            if source is not None:
+                storage_service.touch(source)
+
     async def _execute_and_persist():
         try:
             result = await run_python_code(
@@ -40,7 +48,7 @@ async def run_analysis(
             raise HTTPException(status_code=500, detail=str(exc)) from exc
 
         if payload.task_id:
-            await task_service.update_task(
+            task = await task_service.update_task(
                 db,
                 payload.task_id,
                 user_id=user_id,
@@ -48,6 +56,10 @@ async def run_analysis(
                 execution_stderr=result["stderr"],
                 status="succeeded" if result["returncode"] == 0 else "failed",
             )
+            if task is not None:
+                await revision_service.record_revision(
+                    db, payload.task_id, user_id=user_id, code=payload.code, source="run"
+                )
         return result
 
     result = await _execute_and_persist()
@@ -65,4 +77,5 @@ async def get_artifact(artifact_folder: str, filename: str):
     target = (base_path / artifact_folder / filename).resolve()
     if base_path not in target.parents or not target.is_file():
         raise HTTPException(status_code=404, detail="Artifact not found")
+    storage_service.touch(target.parent)
     return FileResponse(target)
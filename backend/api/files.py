@@ -1,27 +1,20 @@
+import asyncio
 from pathlib import Path
 from typing import Optional
 from uuid import uuid4
 
 import openpyxl
 import pandas as pd
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from fastapi import APIRouter, BackgroundTasks, Depends, File, HTTPException, UploadFile
 
 from ..api.dependencies import get_current_user_id
 from ..config import get_settings
+from ..services import dataset_service, storage_service
+from ..services.dataset_service import DatasetIngestError
 
 router = APIRouter(prefix="/datasets", tags=["datasets"])
 
 
-def _count_csv_rows(path: Path) -> Optional[int]:
-    try:
-        with path.open("r", encoding="utf-8", errors="ignore") as fh:
-            total = sum(1 for _ in fh)
-        # subtract header row if present (at least one row read)
-        return max(total - 1, 0)
-    except OSError:
-        return None
-
-
 def _count_excel_rows(path: Path) -> Optional[int]:
     try:
         workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
@@ -35,6 +28,7 @@ def _count_excel_rows(path: Path) -> Optional[int]:
 
 @router.post("/upload")
 async def upload_dataset(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     user_id: int = Depends(get_current_user_id),
 ) -> dict:
@@ -42,38 +36,57 @@ async def upload_dataset(
     if not file.filename:
         raise HTTPException(status_code=400, detail="Dataset must include a filename.")
 
-    extension = Path(file.filename).suffix.lower().lstrip(".")
-    if extension not in settings.allowed_upload_extensions:
+    extension = dataset_service.detect_extension(file.filename, settings.allowed_upload_extensions)
+    if extension is None:
         raise HTTPException(status_code=400, detail="Unsupported file type.")
 
-    safe_name = f"{uuid4().hex}_{Path(file.filename).name}"
+    safe_name = f"{uuid4().hex}_{dataset_service.stored_filename(file.filename, extension)}"
     user_dir = settings.upload_dir / f"user_{user_id}"
     user_dir.mkdir(parents=True, exist_ok=True)
     destination = user_dir / safe_name
-    content = await file.read()
-    destination.write_bytes(content)
 
     try:
-        if extension == "csv":
-            df = pd.read_csv(destination, nrows=500)
-            total_rows = _count_csv_rows(destination)
-        else:
-            df = pd.read_excel(destination, nrows=500)
+        total_rows = await dataset_service.store_upload(file, destination, extension)
+        schema_preview: Optional[dict] = None
+        if extension == "parquet":
+            df, schema_preview, total_rows = dataset_service.inspect_parquet(destination)
+        elif extension == "feather":
+            df, schema_preview, total_rows = dataset_service.inspect_feather(destination)
+        elif extension in dataset_service.EXCEL_EXTENSIONS:
+            df = pd.read_excel(destination, nrows=dataset_service.PREVIEW_ROWS)
             total_rows = _count_excel_rows(destination)
+        else:
+            df = pd.read_csv(destination, nrows=dataset_service.PREVIEW_ROWS)
+    except DatasetIngestError as exc:
+        destination.unlink(missing_ok=True)
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
     except Exception as exc:
         destination.unlink(missing_ok=True)
         raise HTTPException(status_code=400, detail=f"Failed to parse dataset: {exc}") from exc
 
+    # Only a dataset that parsed may evict the user's older files to make room for it.
+    try:
+        await asyncio.to_thread(storage_service.enforce_user_quota, user_id, protect=destination)
+    except storage_service.StorageQuotaExceeded as exc:
+        destination.unlink(missing_ok=True)
+        raise HTTPException(status_code=413, detail=str(exc)) from exc
+    except BaseException:
+        destination.unlink(missing_ok=True)
+        raise
+
     preview = df.head(20).to_dict(orient="records")
-    schema_preview = {col: str(dtype) for col, dtype in df.dtypes.items()}
+    if schema_preview is None:
+        schema_preview = {col: str(dtype) for col, dtype in df.dtypes.items()}
     row_count = total_rows if total_rows is not None else len(df)
 
     relative_name = destination.relative_to(settings.upload_dir)
+    # Precompute column statistics and the sample used for server-side prompt context.
+    background_tasks.add_task(dataset_service.load_profile, destination)
 
     return {
         "filename": str(relative_name),
         "original_filename": file.filename,
-        "columns": list(df.columns),
+        "columns": list(schema_preview.keys()),
         "schema": schema_preview,
         "preview": preview,
         "rows": row_count,
@@ -1,8 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException
 
 from ..api.dependencies import get_current_user_id, get_database
-from ..schemas import AnalysisTaskCreate, AnalysisTaskRead
-from ..services import task_service
+from ..schemas import (
+    AnalysisTaskCreate,
+    AnalysisTaskRead,
+    CodeRevisionCreate,
+    CodeRevisionDetail,
+    CodeRevisionRead,
+)
+from ..services import revision_service, task_service
 
 router = APIRouter(prefix="/history", tags=["history"])
 
@@ -23,6 +29,10 @@ async def create_task(
     task = await task_service.create_task(db, payload, user_id=user_id)
     if task is None:
         raise HTTPException(status_code=500, detail="Failed to create task")
+    if task.generated_code:
+        await revision_service.record_revision(
+            db, task.id, user_id=user_id, code=task.generated_code, source="generate"
+        )
     return task
 
 
@@ -36,3 +46,50 @@ async def get_task(
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     return task
+
+
+async def _require_task(db, task_id: int, user_id: int) -> AnalysisTaskRead:
+    task = await task_service.get_task(db, task_id, user_id=user_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return task
+
+
+@router.get("/tasks/{task_id}/revisions", response_model=list[CodeRevisionRead])
+async def list_revisions(
+    task_id: int,
+    db=Depends(get_database),
+    user_id: int = Depends(get_current_user_id),
+) -> list[CodeRevisionRead]:
+    await _require_task(db, task_id, user_id)
+    rows = await revision_service.list_revisions(db, task_id, user_id)
+    return [CodeRevisionRead(**row) for row in rows]
+
+
+@router.post("/tasks/{task_id}/revisions", response_model=CodeRevisionRead)
+async def create_revision(
+    task_id: int,
+    payload: CodeRevisionCreate,
+    db=Depends(get_database),
+    user_id: int = Depends(get_current_user_id),
+) -> CodeRevisionRead:
+    """Record the task's current script; an unchanged script returns the latest revision."""
+    await _require_task(db, task_id, user_id)
+    row = await revision_service.record_revision(
+        db, task_id, user_id=user_id, code=payload.code, source=payload.source
+    )
+    return CodeRevisionRead(**row)
+
+
+@router.get("/tasks/{task_id}/revisions/{revision_id}", response_model=CodeRevisionDetail)
+async def get_revision(
+    task_id: int,
+    revision_id: int,
+    db=Depends(get_database),
+    user_id: int = Depends(get_current_user_id),
+) -> CodeRevisionDetail:
+    found = await revision_service.get_revision(db, revision_id, user_id=user_id, task_id=task_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Code revision not found")
+    row, code = found
+    return CodeRevisionDetail(**row, code=code)
@@ -1,31 +1,52 @@
-import json
+import asyncio
 import re
-import ast
-from typing import Any, Dict, Tuple
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Literal, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 
 from ..api.dependencies import get_current_user_id, get_database
+from ..api.sse import format_sse, sse_response
+from ..llm_adapters.base import LLMAdapter
 from ..llm_adapters.factory import adapter_factory
-from ..schemas import LLMGenerateRequest, LLMGenerateResponse, LLMProviderInfo
-from ..services import provider_credentials_service
+from ..llm_adapters.resilience import CircuitOpenError
+from ..sandbox.runner import CodeExecutionError, run_python_code
+from ..schemas import (
+    CodeExecutionResult,
+    LLMBatchItemResult,
+    LLMBatchJob,
+    LLMBatchRequest,
+    LLMBatchResults,
+    LLMCandidateReport,
+    LLMCompareRequest,
+    LLMCompareResult,
+    LLMGenerateRequest,
+    LLMGenerateResponse,
+    LLMProviderInfo,
+)
+from ..services import (
+    batch_service,
+    code_screening,
+    dataset_context,
+    llm_cache_service,
+    provider_credentials_service,
+    rate_limiter,
+    similarity_cache,
+    single_flight,
+    usage_service,
+)
 from ..config import get_settings
+from ..services.dataset_service import DatasetIngestError
+from ..services.json_fields import JsonFieldStream
 from ..services.prompt_builder import build_analysis_prompt
+from ..services.rate_limiter import RateLimitExceeded
 
 router = APIRouter(prefix="/llm", tags=["llm"])
 
 
-def _strip_code_fence(text: str) -> str:
-    stripped = text.strip()
-    if not stripped.startswith("```"):
-        return text
-    lines = stripped.splitlines()
-    if not lines:
-        return text
-    lines = lines[1:]  # drop opening fence (with optional language)
-    if lines and lines[-1].strip() == "```":
-        lines = lines[:-1]
-    return "\n".join(lines)
+_PYTHON_FENCE = re.compile(r"```python\n(?P<code>.*?)```", re.DOTALL)
 
 
 def _normalize_code(text: str) -> str:
@@ -35,73 +56,24 @@ def _normalize_code(text: str) -> str:
     return text
 
 
-def _extract_code_from_payload(payload: Dict[str, Any]) -> Tuple[str, str | None]:
-    candidates = [
-        (payload.get("code"), payload.get("reasoning")),
-        (payload.get("output", {}).get("code"), payload.get("output", {}).get("reasoning")),
-        (
-            payload.get("result", {}).get("code"),
-            payload.get("result", {}).get("reasoning"),
-        ),
-    ]
-    for code, reasoning in candidates:
-        if isinstance(code, str) and code.strip():
-            return _normalize_code(code), reasoning if isinstance(reasoning, str) else None
-    return "", None
-
-
-def _extract_from_json_like(raw_text: str) -> Tuple[str, str | None]:
-    code_match = re.search(r'"code"\s*:\s*"', raw_text)
-    if not code_match:
-        return "", None
-    idx = code_match.end()
-    buffer: list[str] = []
-    escaped = False
-    while idx < len(raw_text):
-        ch = raw_text[idx]
-        if escaped:
-            buffer.append(ch)
-            escaped = False
-        elif ch == "\\":
-            buffer.append(ch)
-            escaped = True
-        elif ch == '"':
-            break
-        else:
-            buffer.append(ch)
-        idx += 1
-    code_literal = "".join(buffer)
-    try:
-        code_str = json.loads(f'"{code_literal}"')
-    except json.JSONDecodeError:
-        code_str = code_literal.replace("\\r\\n", "\n").replace("\\n", "\n")
-    return _normalize_code(code_str), None
-
+def _extract_code_and_reasoning(
+    raw_text: str, parsed: Optional[JsonFieldStream] = None
+) -> Tuple[str, str | None]:
+    """Extract Python code from mixed content responses.
 
-def _extract_code_and_reasoning(raw_text: str) -> Tuple[str, str | None]:
-    """Extract Python code from mixed content responses."""
-    cleaned = _strip_code_fence(raw_text)
-    parse_attempts = []
-    try:
-        parse_attempts.append(json.loads(cleaned))
-    except json.JSONDecodeError:
-        try:
-            parse_attempts.append(ast.literal_eval(cleaned))
-        except (ValueError, SyntaxError):
-            pass
-
-    for payload in parse_attempts:
-        if isinstance(payload, dict):
-            code, reasoning = _extract_code_from_payload(payload)
-            if code:
-                return code, reasoning
-
-    code, reasoning = _extract_from_json_like(cleaned)
-    if code:
-        return code, reasoning
-
-    pattern = re.compile(r"```python\n(?P<code>.*?)```", re.DOTALL)
-    match = pattern.search(raw_text)
+    JSON answers (fenced or not, including ``output``/``result`` wrappers) are read in a
+    single pass; streaming callers pass the ``JsonFieldStream`` they already fed so the
+    text is not scanned again. Otherwise the first ```python block, or the whole text,
+    is the code.
+    """
+    if parsed is None:
+        parsed = JsonFieldStream()
+        parsed.feed(raw_text)
+        parsed.finish()
+    code = parsed.value("code")
+    if code and code.strip():
+        return _normalize_code(code), parsed.value("reasoning")
+    match = _PYTHON_FENCE.search(raw_text)
     if match:
         return _normalize_code(match.group("code").strip()), None
     return _normalize_code(raw_text.strip()), None
@@ -119,16 +91,24 @@ async def list_providers(
     return [LLMProviderInfo(**provider) for provider in providers]
 
 
-@router.post("/generate", response_model=LLMGenerateResponse)
-async def generate_code(
-    payload: LLMGenerateRequest,
-    user_id: int = Depends(get_current_user_id),
-    db=Depends(get_database),
-) -> LLMGenerateResponse:
+async def _prepare_generation(
+    payload: LLMGenerateRequest, user_id: int, db
+) -> Tuple[LLMAdapter, str, Dict[str, Any], str]:
+    """Resolve the adapter, prompt, adapter kwargs and effective model string for a request."""
+    context_text = payload.dataset_context
+    if payload.dataset_filename:
+        try:
+            built_context = await dataset_context.get_dataset_context(
+                payload.dataset_filename, user_id=user_id, model=payload.model
+            )
+        except DatasetIngestError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        if built_context:
+            context_text = built_context
     prompt = build_analysis_prompt(
         task_description=payload.prompt,
         task_type=payload.task_type,
-        dataset_context=payload.dataset_context,
+        dataset_context=context_text,
     )
     provider, _, variant = payload.model.partition(":")
     stored_map = await provider_credentials_service.get_credentials_map(db, user_id)
@@ -139,28 +119,692 @@ async def generate_code(
     )
     try:
         adapter = adapter_factory.get(provider, override=override)
-        # Force backend default for OpenAI when user selected "Default Model" (no variant)
-        forced_kwargs: Dict[str, Any] = {}
-        effective_model_str = payload.model
-        if provider == "openai" and not variant:
-            settings = get_settings()
-            forced_model = (settings.openai_default_models[0] if settings.openai_default_models else "gpt-4o")
-            forced_kwargs["model"] = forced_model
-            effective_model_str = f"openai:{forced_model}"
-        elif variant:
-            forced_kwargs["model"] = variant
-            effective_model_str = payload.model
-        result = await adapter.generate_code(prompt, **forced_kwargs)
     except KeyError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
-    except Exception as exc:  # pragma: no cover - upstream API failures
-        raise HTTPException(status_code=502, detail=f"LLM provider error: {exc}") from exc
+    # Force backend default for OpenAI when user selected "Default Model" (no variant)
+    forced_kwargs: Dict[str, Any] = {}
+    effective_model_str = payload.model
+    if provider == "openai" and not variant:
+        settings = get_settings()
+        forced_model = (settings.openai_default_models[0] if settings.openai_default_models else "gpt-4o")
+        forced_kwargs["model"] = forced_model
+        effective_model_str = f"openai:{forced_model}"
+    elif variant:
+        forced_kwargs["model"] = variant
+    return adapter, prompt, forced_kwargs, effective_model_str
 
-    code, reasoning = _extract_code_and_reasoning(result.get("code", ""))
+
+def _build_generate_response(
+    payload: LLMGenerateRequest,
+    raw_text: str,
+    usage: Optional[dict],
+    effective_model_str: str,
+    *,
+    cached: bool = False,
+    parsed: Optional[JsonFieldStream] = None,
+) -> LLMGenerateResponse:
+    code, reasoning = _extract_code_and_reasoning(raw_text, parsed)
     return LLMGenerateResponse(
         code=code,
         model=effective_model_str,
         prompt=payload.prompt,
         reasoning=reasoning,
+        usage=usage,
+        cached=cached,
+    )
+
+
+@dataclass
+class _CacheKeys:
+    exact: Optional[str] = None
+    similarity_scope: Optional[str] = None
+
+
+async def _generation_cache_keys(
+    payload: LLMGenerateRequest,
+    prompt: str,
+    forced_kwargs: Dict[str, Any],
+    effective_model_str: str,
+    user_id: int,
+) -> _CacheKeys:
+    """Exact and near-duplicate cache keys for this request; empty when caching is off.
+
+    Best-of requests are never cached: a hit would skip the screening and candidate
+    reports they ask for, and their winner, sampled at ``llm_candidate_temperature``,
+    is not what a single-shot request for the same prompt would get.
+    """
+    settings = get_settings()
+    keys = _CacheKeys()
+    if payload.bypass_cache or payload.candidates > 1:
+        llm_cache_service.record_bypass()
+        return keys
+    if settings.llm_cache_enabled:
+        params = {key: value for key, value in forced_kwargs.items() if key != "model"}
+        keys.exact = llm_cache_service.build_cache_key(
+            prompt=prompt, model=effective_model_str, params=params, user_id=user_id
+        )
+    if settings.llm_similarity_cache_enabled:
+        fingerprint = await dataset_context.get_schema_fingerprint(
+            payload.dataset_filename, user_id=user_id, dataset_context=payload.dataset_context
+        )
+        keys.similarity_scope = similarity_cache.build_scope(
+            schema_fingerprint=fingerprint,
+            model=effective_model_str,
+            task_type=payload.task_type,
+            user_id=user_id,
+        )
+    return keys
+
+
+async def _lookup_cached(
+    db, keys: _CacheKeys, payload: LLMGenerateRequest
+) -> Optional[Dict[str, Any]]:
+    if keys.exact:
+        cached = await llm_cache_service.lookup(db, keys.exact)
+        if cached is not None:
+            return cached
+    if keys.similarity_scope:
+        return similarity_cache.lookup(keys.similarity_scope, payload.prompt)
+    return None
+
+
+async def _remember_result(
+    db,
+    keys: _CacheKeys,
+    payload: LLMGenerateRequest,
+    result: Dict[str, Any],
+    *,
+    user_id: int,
+    model: str,
+    latency_ms: float,
+) -> None:
+    if not result.get("code"):
+        return
+    if keys.exact:
+        await llm_cache_service.store(
+            db, keys.exact, user_id=user_id, model=model, result=result, latency_ms=latency_ms
+        )
+    if keys.similarity_scope:
+        similarity_cache.store(keys.similarity_scope, payload.prompt, result)
+
+
+@dataclass
+class _Candidate:
+    index: int
+    result: Optional[Dict[str, Any]] = None
+    report: Optional[LLMCandidateReport] = None
+    error: Optional[BaseException] = None
+
+
+async def _screen_candidate(
+    payload: LLMGenerateRequest, candidate: _Candidate, *, user_id: int, started: float
+) -> _Candidate:
+    code, _ = _extract_code_and_reasoning((candidate.result or {}).get("code", ""))
+    problems = code_screening.screen_code(code, expects_dataset=bool(payload.dataset_filename))
+    if not problems and payload.dry_run and payload.dataset_filename:
+        error = await code_screening.dry_run(
+            code, dataset_filename=payload.dataset_filename, user_id=user_id
+        )
+        if error:
+            problems.append(f"Dry run failed: {error}")
+    candidate.report = LLMCandidateReport(
+        index=candidate.index,
+        valid=not problems,
+        problems=problems,
+        latency_ms=round((time.perf_counter() - started) * 1000, 1),
+    )
+    return candidate
+
+
+async def _generate_best_of(
+    payload: LLMGenerateRequest,
+    adapter: LLMAdapter,
+    prompt: str,
+    forced_kwargs: Dict[str, Any],
+    effective_model_str: str,
+    *,
+    user_id: int,
+) -> Tuple[Dict[str, Any], list[LLMCandidateReport]]:
+    """Race ``payload.candidates`` generations and return the first that screens clean.
+
+    Providers with an ``n`` parameter produce every candidate in one request, otherwise
+    each candidate is its own call. Screening runs as each candidate lands and the
+    remaining work is cancelled once one passes. When none passes, the candidate with
+    the fewest problems is returned; the reports say what was wrong with each.
+    """
+    settings = get_settings()
+    n = payload.candidates
+    kwargs = {**forced_kwargs, "temperature": settings.llm_candidate_temperature}
+    code_screening.record_request(n)
+    started = time.perf_counter()
+
+    async def call(count: int) -> list[Dict[str, Any]]:
+        reservation = await rate_limiter.acquire(
+            user_id, adapter.name, estimated_tokens=rate_limiter.estimate_request_tokens(prompt)
+        )
+        call_started = time.perf_counter()
+        with reservation.released_on_error():
+            if count == 1:
+                results = [await adapter.generate_code(prompt, **kwargs)]
+            else:
+                results = await adapter.generate_candidates(prompt, count, **kwargs)
+        usage = results[0].get("usage") if results else None
+        reservation.settle(usage)
+        usage_service.record(
+            user_id=user_id,
+            provider=adapter.name,
+            model=effective_model_str,
+            endpoint="llm.generate.candidates",
+            usage=usage,
+            latency_ms=(time.perf_counter() - call_started) * 1000,
+        )
+        return results
+
+    async def generate_and_screen(index: int) -> _Candidate:
+        candidate = _Candidate(index=index)
+        try:
+            candidate.result = (await call(1))[0]
+        except Exception as exc:
+            candidate.error = exc
+            return candidate
+        return await _screen_candidate(payload, candidate, user_id=user_id, started=started)
+
+    if getattr(adapter, "supports_n", False):
+        try:
+            results = await call(n)
+        except CircuitOpenError as exc:
+            raise HTTPException(status_code=503, detail=str(exc)) from exc
+        except RateLimitExceeded:
+            raise
+        except Exception as exc:  # pragma: no cover - upstream API failures
+            raise HTTPException(status_code=502, detail=f"LLM provider error: {exc}") from exc
+        pending = {
+            asyncio.create_task(
+                _screen_candidate(
+                    payload, _Candidate(index=index, result=result), user_id=user_id, started=started
+                )
+            )
+            for index, result in enumerate(results)
+        }
+    else:
+        pending = {asyncio.create_task(generate_and_screen(index)) for index in range(n)}
+
+    finished: list[_Candidate] = []
+    winner: Optional[_Candidate] = None
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                candidate = task.result()
+                finished.append(candidate)
+                if winner is None and candidate.report is not None and candidate.report.valid:
+                    winner = candidate
+    finally:
+        for task in pending:
+            task.cancel()
+        # Wait for the cancelled dry runs to kill their sandbox processes.
+        await asyncio.gather(*pending, return_exceptions=True)
+    code_screening.record_outcome(winner.index if winner else None, cancelled=len(pending))
+
+    generated = [candidate for candidate in finished if candidate.report is not None]
+    if not generated:
+        error = finished[0].error
+        if isinstance(error, (RateLimitExceeded, HTTPException)):
+            raise error
+        if isinstance(error, CircuitOpenError):
+            raise HTTPException(status_code=503, detail=str(error)) from error
+        raise HTTPException(status_code=502, detail=f"LLM provider error: {error}") from error
+    if winner is None:
+        winner = min(generated, key=lambda candidate: (len(candidate.report.problems), candidate.index))
+    reports = sorted((candidate.report for candidate in generated), key=lambda report: report.index)
+    return winner.result, reports
+
+
+@router.post("/generate", response_model=LLMGenerateResponse)
+async def generate_code(
+    payload: LLMGenerateRequest,
+    user_id: int = Depends(get_current_user_id),
+    db=Depends(get_database),
+) -> LLMGenerateResponse:
+    max_candidates = get_settings().llm_candidates_max
+    if payload.candidates > max_candidates:
+        raise HTTPException(
+            status_code=400, detail=f"At most {max_candidates} candidates can be requested."
+        )
+    adapter, prompt, forced_kwargs, effective_model_str = await _prepare_generation(
+        payload, user_id, db
+    )
+    keys = await _generation_cache_keys(payload, prompt, forced_kwargs, effective_model_str, user_id)
+    cached = await _lookup_cached(db, keys, payload)
+    if cached is not None:
+        return _build_generate_response(
+            payload, cached["code"], cached.get("usage"), effective_model_str, cached=True
+        )
+
+    if payload.candidates > 1:
+        started = time.perf_counter()
+        result, reports = await _generate_best_of(
+            payload, adapter, prompt, forced_kwargs, effective_model_str, user_id=user_id
+        )
+        response = _build_generate_response(
+            payload, result.get("code", ""), result.get("usage"), effective_model_str
+        )
+        response.candidates = reports
+        if any(report.valid for report in reports):
+            await _remember_result(
+                db,
+                keys,
+                payload,
+                result,
+                user_id=user_id,
+                model=effective_model_str,
+                latency_ms=(time.perf_counter() - started) * 1000,
+            )
+        return response
+
+    async def call() -> Tuple[Dict[str, Any], float]:
+        reservation = await rate_limiter.acquire(
+            user_id, adapter.name, estimated_tokens=rate_limiter.estimate_request_tokens(prompt)
+        )
+        started = time.perf_counter()
+        with reservation.released_on_error():
+            result = await adapter.generate_code(prompt, **forced_kwargs)
+        latency_ms = (time.perf_counter() - started) * 1000
+        reservation.settle(result.get("usage"))
+        usage_service.record(
+            user_id=user_id,
+            provider=adapter.name,
+            model=effective_model_str,
+            endpoint="llm.generate",
+            usage=result.get("usage"),
+            latency_ms=latency_ms,
+        )
+        return result, latency_ms
+
+    flight_key = single_flight.build_key(
+        "generate", user_id=user_id, model=effective_model_str, payload=prompt, params=forced_kwargs
+    )
+    try:
+        (result, latency_ms), shared = await single_flight.run(flight_key, call)
+    except RateLimitExceeded:
+        raise
+    except CircuitOpenError as exc:
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
+    except Exception as exc:  # pragma: no cover - upstream API failures
+        raise HTTPException(status_code=502, detail=f"LLM provider error: {exc}") from exc
+
+    if not shared:
+        await _remember_result(
+            db,
+            keys,
+            payload,
+            result,
+            user_id=user_id,
+            model=effective_model_str,
+            latency_ms=latency_ms,
+        )
+    return _build_generate_response(
+        payload, result.get("code", ""), result.get("usage"), effective_model_str
+    )
+
+
+@router.post("/generate/stream")
+async def generate_code_stream(
+    payload: LLMGenerateRequest,
+    user_id: int = Depends(get_current_user_id),
+    db=Depends(get_database),
+) -> StreamingResponse:
+    """Server-sent events variant of ``/generate``.
+
+    Emits ``delta`` events with raw model text as it arrives, ``field`` events
+    (``{"name": "code" | "reasoning", "text": ...}``) with the decoded JSON field text
+    as it is parsed, then a single ``result`` event carrying the parsed
+    ``LLMGenerateResponse``. Provider failures after the stream has started are reported
+    as an ``error`` event.
+    """
+    if payload.candidates > 1:
+        raise HTTPException(status_code=400, detail="Multiple candidates are only supported on /llm/generate.")
+    adapter, prompt, forced_kwargs, effective_model_str = await _prepare_generation(
+        payload, user_id, db
+    )
+    keys = await _generation_cache_keys(payload, prompt, forced_kwargs, effective_model_str, user_id)
+    cached = await _lookup_cached(db, keys, payload)
+    reservation = None
+    if cached is None:
+        reservation = await rate_limiter.acquire(
+            user_id, adapter.name, estimated_tokens=rate_limiter.estimate_request_tokens(prompt)
+        )
+
+    def field_events(fields: JsonFieldStream, text: Optional[str]) -> list[str]:
+        deltas = fields.feed(text) if text is not None else fields.finish()
+        return [format_sse("field", {"name": name, "text": value}) for name, value in deltas.items()]
+
+    async def events() -> AsyncIterator[str]:
+        fields = JsonFieldStream()
+        if cached is not None:
+            yield format_sse("delta", {"text": cached["code"]})
+            for event in field_events(fields, cached["code"]):
+                yield event
+            response = _build_generate_response(
+                payload, cached["code"], cached.get("usage"), effective_model_str, cached=True
+            )
+            yield format_sse("result", response.model_dump())
+            return
+        chunks: list[str] = []
+        usage: Optional[dict] = None
+        started = time.perf_counter()
+        try:
+            # Also covers a client that disconnects mid-stream.
+            with reservation.released_on_error():
+                async for event in adapter.stream_generate_code(prompt, **forced_kwargs):
+                    if event["type"] == "delta":
+                        chunks.append(event["text"])
+                        yield format_sse("delta", {"text": event["text"]})
+                        for field_event in field_events(fields, event["text"]):
+                            yield field_event
+                    elif event["type"] == "usage":
+                        usage = event["usage"] or usage
+        except CircuitOpenError as exc:
+            yield format_sse("error", {"detail": str(exc)})
+            return
+        except Exception as exc:  # pragma: no cover - upstream API failures
+            yield format_sse("error", {"detail": f"LLM provider error: {exc}"})
+            return
+        raw_text = "".join(chunks)
+        latency_ms = (time.perf_counter() - started) * 1000
+        if reservation is not None:
+            reservation.settle(usage)
+        usage_service.record(
+            user_id=user_id,
+            provider=adapter.name,
+            model=effective_model_str,
+            endpoint="llm.generate.stream",
+            usage=usage,
+            latency_ms=latency_ms,
+        )
+        await _remember_result(
+            db,
+            keys,
+            payload,
+            {"code": raw_text, "usage": usage},
+            user_id=user_id,
+            model=effective_model_str,
+            latency_ms=latency_ms,
+        )
+        for field_event in field_events(fields, None):
+            yield field_event
+        response = _build_generate_response(
+            payload, raw_text, usage, effective_model_str, parsed=fields
+        )
+        yield format_sse("result", response.model_dump())
+
+    return sse_response(
+        events(), on_close=reservation.release_unsettled if reservation is not None else None
+    )
+
+
+async def _compare_target(
+    payload: LLMCompareRequest,
+    target: str,
+    *,
+    user_id: int,
+    db,
+    generation_slots: asyncio.Semaphore,
+    execution_slots: asyncio.Semaphore,
+) -> LLMCompareResult:
+    request = LLMGenerateRequest(
+        prompt=payload.prompt,
+        model=target,
+        task_type=payload.task_type,
+        dataset_context=payload.dataset_context,
+        dataset_filename=payload.dataset_filename,
+        provider_overrides=payload.provider_overrides,
+        bypass_cache=True,
+    )
+    started = time.perf_counter()
+    try:
+        async with generation_slots:
+            adapter, prompt, forced_kwargs, effective_model_str = await _prepare_generation(
+                request, user_id, db
+            )
+            reservation = await rate_limiter.acquire(
+                user_id, adapter.name, estimated_tokens=rate_limiter.estimate_request_tokens(prompt)
+            )
+            started = time.perf_counter()
+            with reservation.released_on_error():
+                result = await adapter.generate_code(prompt, **forced_kwargs)
+            reservation.settle(result.get("usage"))
+    except HTTPException as exc:
+        return LLMCompareResult(model=target, success=False, latency_ms=0.0, error=str(exc.detail))
+    except RateLimitExceeded as exc:
+        return LLMCompareResult(model=target, success=False, latency_ms=0.0, error=str(exc))
+    except Exception as exc:  # pragma: no cover - upstream API failures
+        return LLMCompareResult(
+            model=target,
+            success=False,
+            latency_ms=round((time.perf_counter() - started) * 1000, 1),
+            error=f"LLM provider error: {exc}",
+        )
+    latency_ms = round((time.perf_counter() - started) * 1000, 1)
+    usage_service.record(
+        user_id=user_id,
+        provider=adapter.name,
+        model=effective_model_str,
+        endpoint="llm.compare",
+        usage=result.get("usage"),
+        latency_ms=latency_ms,
+    )
+    code, reasoning = _extract_code_and_reasoning(result.get("code", ""))
+    comparison = LLMCompareResult(
+        model=effective_model_str,
+        success=bool(code.strip()),
+        latency_ms=latency_ms,
         usage=result.get("usage"),
+        code=code,
+        reasoning=reasoning,
+        error=None if code.strip() else "Provider returned no code.",
     )
+    if not payload.execute or not comparison.success:
+        return comparison
+
+    run_started = time.perf_counter()
+    try:
+        async with execution_slots:
+            run = await run_python_code(
+                code, dataset_filename=payload.dataset_filename, user_id=user_id
+            )
+    except CodeExecutionError as exc:
+        comparison.execution = CodeExecutionResult(stdout="", stderr=str(exc), status="failed")
+    else:
+        comparison.execution = CodeExecutionResult(
+            stdout=run["stdout"],
+            stderr=run.get("stderr") or None,
+            status="succeeded" if run["returncode"] == 0 else "failed",
+            artifacts=run.get("artifacts", []),
+        )
+    comparison.execution_ms = round((time.perf_counter() - run_started) * 1000, 1)
+    comparison.success = comparison.execution.status == "succeeded"
+    return comparison
+
+
+@router.post("/compare")
+async def compare_models(
+    payload: LLMCompareRequest,
+    user_id: int = Depends(get_current_user_id),
+    db=Depends(get_database),
+) -> StreamingResponse:
+    """Fan one prompt out to several models at once and stream each result as it lands.
+
+    Emits one ``result`` event (``LLMCompareResult``) per target in completion order,
+    then a ``done`` event summarizing the run.
+    """
+    settings = get_settings()
+    targets = list(dict.fromkeys(target.strip() for target in payload.targets if target.strip()))
+    if not targets:
+        raise HTTPException(status_code=400, detail="At least one target model is required.")
+    if len(targets) > settings.llm_compare_max_targets:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.llm_compare_max_targets} models can be compared at once.",
+        )
+    concurrency = min(
+        payload.max_concurrency or settings.llm_compare_max_concurrency,
+        settings.llm_compare_max_concurrency,
+    )
+    generation_slots = asyncio.Semaphore(concurrency)
+    execution_slots = asyncio.Semaphore(concurrency)
+
+    async def events() -> AsyncIterator[str]:
+        started = time.perf_counter()
+        tasks = [
+            asyncio.create_task(
+                _compare_target(
+                    payload,
+                    target,
+                    user_id=user_id,
+                    db=db,
+                    generation_slots=generation_slots,
+                    execution_slots=execution_slots,
+                )
+            )
+            for target in targets
+        ]
+        succeeded = 0
+        try:
+            for finished in asyncio.as_completed(tasks):
+                comparison = await finished
+                succeeded += comparison.success
+                yield format_sse("result", comparison.model_dump())
+        finally:
+            # The client went away: stop paying for the remaining provider calls, and wait
+            # for their sandbox runs to be killed.
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        yield format_sse(
+            "done",
+            {
+                "targets": len(targets),
+                "succeeded": succeeded,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            },
+        )
+
+    return sse_response(events())
+
+
+def _batch_job(job: Dict[str, Any]) -> LLMBatchJob:
+    return LLMBatchJob(**{field: job[field] for field in LLMBatchJob.model_fields})
+
+
+@router.post("/batches", response_model=LLMBatchJob, status_code=202)
+async def create_batch(
+    payload: LLMBatchRequest,
+    user_id: int = Depends(get_current_user_id),
+    db=Depends(get_database),
+) -> LLMBatchJob:
+    """Queue many generate requests for one model and return the job to poll.
+
+    Goes through the provider's batch API (cheaper, results within its completion
+    window) when it has one, otherwise a background worker makes throttled calls.
+    """
+    settings = get_settings()
+    if len(payload.items) > settings.llm_batch_max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.llm_batch_max_items} items can be submitted in one batch.",
+        )
+    custom_ids = [item.custom_id or str(index) for index, item in enumerate(payload.items)]
+    if len(set(custom_ids)) != len(custom_ids):
+        raise HTTPException(status_code=400, detail="Batch item custom_id values must be unique.")
+
+    prompts: list[Tuple[str, str]] = []
+    for custom_id, item in zip(custom_ids, payload.items):
+        request = LLMGenerateRequest(
+            prompt=item.prompt,
+            model=payload.model,
+            task_type=payload.task_type,
+            dataset_context=payload.dataset_context,
+            dataset_filename=item.dataset_filename or payload.dataset_filename,
+            provider_overrides=payload.provider_overrides,
+        )
+        adapter, prompt, forced_kwargs, effective_model_str = await _prepare_generation(
+            request, user_id, db
+        )
+        prompts.append((custom_id, prompt))
+
+    has_batch_api = batch_service.supports_provider_batch(adapter)
+    if payload.mode == "provider" and not has_batch_api:
+        raise HTTPException(
+            status_code=400, detail=f"Provider '{adapter.name}' does not offer a batch API."
+        )
+    mode = "provider" if payload.mode != "worker" and has_batch_api else "worker"
+    job_id = await batch_service.create_job(
+        db,
+        user_id=user_id,
+        model=effective_model_str,
+        mode=mode,
+        request_kwargs=forced_kwargs,
+        items=prompts,
+        override=(payload.provider_overrides or {}).get(adapter.name),
+    )
+    return _batch_job(await batch_service.get_job(db, job_id, user_id=user_id))
+
+
+@router.get("/batches", response_model=list[LLMBatchJob])
+async def list_batches(
+    db=Depends(get_database), user_id: int = Depends(get_current_user_id)
+) -> list[LLMBatchJob]:
+    return [_batch_job(job) for job in await batch_service.list_jobs(db, user_id=user_id)]
+
+
+async def _require_batch(db, job_id: int, user_id: int) -> Dict[str, Any]:
+    job = await batch_service.get_job(db, job_id, user_id=user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return job
+
+
+@router.get("/batches/{job_id}", response_model=LLMBatchJob)
+async def get_batch(
+    job_id: int, db=Depends(get_database), user_id: int = Depends(get_current_user_id)
+) -> LLMBatchJob:
+    return _batch_job(await _require_batch(db, job_id, user_id))
+
+
+@router.get("/batches/{job_id}/results", response_model=LLMBatchResults)
+async def get_batch_results(
+    job_id: int,
+    status: Optional[Literal["pending", "completed", "failed", "cancelled"]] = None,
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=100, ge=1, le=1000),
+    db=Depends(get_database),
+    user_id: int = Depends(get_current_user_id),
+) -> LLMBatchResults:
+    job = await _require_batch(db, job_id, user_id)
+    items = await batch_service.list_items(db, job_id, status=status, offset=offset, limit=limit)
+    results = []
+    for item in items:
+        code, reasoning = (
+            _extract_code_and_reasoning(item["content"]) if item["content"] is not None else (None, None)
+        )
+        results.append(
+            LLMBatchItemResult(
+                custom_id=item["custom_id"],
+                status=item["status"],
+                code=code,
+                reasoning=reasoning,
+                usage=item["usage"],
+                error=item["error"],
+                latency_ms=item["latency_ms"],
+            )
+        )
+    return LLMBatchResults(job=_batch_job(job), items=results)
+
+
+@router.post("/batches/{job_id}/cancel", response_model=LLMBatchJob)
+async def cancel_batch(
+    job_id: int, db=Depends(get_database), user_id: int = Depends(get_current_user_id)
+) -> LLMBatchJob:
+    await _require_batch(db, job_id, user_id)
+    return _batch_job(await batch_service.cancel_job(db, job_id, user_id=user_id))
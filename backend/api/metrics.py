@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Depends
+
+from ..api.dependencies import get_current_user_id
+from ..llm_adapters import resilience
+from ..llm_adapters.factory import adapter_factory
+from ..llm_adapters.http_client import http_pool
+from ..services import (
+    batch_service,
+    chat_context,
+    chat_service,
+    chat_summarizer,
+    code_screening,
+    llm_cache_service,
+    patching,
+    rate_limiter,
+    revision_service,
+    similarity_cache,
+    single_flight,
+    storage_service,
+    usage_service,
+)
+
+router = APIRouter(prefix="/metrics", tags=["meta"])
+
+
+@router.get("")
+async def get_metrics(user_id: int = Depends(get_current_user_id)) -> dict:
+    """Operational counters collected in-process by the backend services."""
+    return {
+        "storage": storage_service.get_metrics(),
+        "http": http_pool.stats(),
+        "llm_resilience": resilience.stats(),
+        "llm_adapters": adapter_factory.adapter_cache_stats(),
+        "llm_cache": llm_cache_service.get_metrics(),
+        "similarity_cache": similarity_cache.get_metrics(),
+        "rate_limits": rate_limiter.get_metrics(),
+        "usage_ledger": usage_service.get_metrics(),
+        "chat_context": chat_context.get_metrics(),
+        "chat_history": chat_service.get_metrics(),
+        "chat_summaries": chat_summarizer.get_metrics(),
+        "llm_batches": batch_service.get_metrics(),
+        "code_screening": code_screening.get_metrics(),
+        "single_flight": single_flight.get_metrics(),
+        "code_revisions": revision_service.get_metrics(),
+        "chat_patches": patching.get_metrics(),
+    }
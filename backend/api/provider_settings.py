@@ -3,6 +3,7 @@ from typing import Dict
 from fastapi import APIRouter, Body, Depends
 
 from ..api.dependencies import get_current_user_id, get_database
+from ..llm_adapters.factory import adapter_factory
 from ..schemas import ProviderCredentialPayload
 from ..services import provider_credentials_service
 
@@ -23,6 +24,9 @@ async def update_provider_credentials(
     user_id: int = Depends(get_current_user_id),
 ) -> Dict[str, ProviderCredentialPayload]:
     keep = set(payload.keys())
+    previous = await provider_credentials_service.get_credentials_map(db, user_id)
+    # Adapters built from the replaced credentials must not outlive them.
+    adapter_factory.invalidate(provider_credentials_service.credential_payloads_to_overrides(previous))
     updated = await provider_credentials_service.upsert_credentials(db, user_id, payload)
     await provider_credentials_service.delete_missing_credentials(db, user_id, keep)
     return updated
@@ -0,0 +1,43 @@
+import json
+from typing import Any, AsyncIterator, Callable, Optional
+
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+
+def format_sse(event: str, data: Any) -> str:
+    """Encode one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+class _SSEResponse(StreamingResponse):
+    def __init__(self, *args: Any, on_close: Optional[Callable[[], None]] = None, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._on_close = on_close
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self._on_close is not None:
+                self._on_close()
+
+
+def sse_response(
+    events: AsyncIterator[str], *, on_close: Optional[Callable[[], None]] = None
+) -> StreamingResponse:
+    """Stream ``events``; ``on_close`` runs once the response is over, however it ended.
+
+    Unlike a ``finally`` in the generator, it also runs when the client is gone before the
+    first event or the response fails to send.
+    """
+    return _SSEResponse(
+        events,
+        on_close=on_close,
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Stop reverse proxies (nginx) from buffering the stream.
+            "X-Accel-Buffering": "no",
+        },
+    )
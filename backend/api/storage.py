@@ -0,0 +1,22 @@
+import asyncio
+
+from fastapi import APIRouter, Depends
+
+from ..api.dependencies import get_current_user_id
+from ..config import get_settings
+from ..services import storage_service
+
+router = APIRouter(prefix="/storage", tags=["storage"])
+
+
+@router.get("/usage")
+async def get_storage_usage(user_id: int = Depends(get_current_user_id)) -> dict:
+    settings = get_settings()
+    entries = await asyncio.to_thread(storage_service.scan, user_id)
+    usage = storage_service.summarize(entries)
+    return {
+        "user_id": user_id,
+        "usage_bytes": usage,
+        "total_bytes": sum(usage.values()),
+        "quota_bytes": settings.storage_user_quota_mb * 1024 * 1024,
+    }
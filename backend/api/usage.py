@@ -0,0 +1,68 @@
+from datetime import datetime
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from ..api.dependencies import get_current_user_id, get_database
+from ..schemas import UsagePoint, UsageReport, UsageTotals
+from ..services import usage_service
+
+router = APIRouter(prefix="/usage", tags=["usage"])
+
+
+@router.get("", response_model=UsageReport)
+async def get_usage(
+    granularity: Literal["hour", "day"] = "day",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    group_by: Optional[str] = Query(
+        default=None, description="Comma-separated subset of provider, model, endpoint."
+    ),
+    db=Depends(get_database),
+    user_id: int = Depends(get_current_user_id),
+) -> UsageReport:
+    """Token usage for the current user, bucketed by hour or day (UTC)."""
+    fields = [item.strip() for item in (group_by or "").split(",") if item.strip()]
+    unknown = set(fields) - set(usage_service.GROUP_BY_FIELDS)
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Cannot group usage by: {', '.join(sorted(unknown))}"
+        )
+    default_start, default_end = usage_service.default_window(granularity)
+    start = start or default_start
+    end = end or default_end
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end.")
+
+    rows = await usage_service.query_usage(
+        db, user_id=user_id, start=start, end=end, granularity=granularity, group_by=fields
+    )
+    totals = UsageTotals()
+    points: list[UsagePoint] = []
+    for row in rows:
+        total_tokens = row["prompt_tokens"] + row["completion_tokens"]
+        requests = row["requests"]
+        points.append(
+            UsagePoint(
+                **{name: row[name] for name in ["bucket_start", *fields]},
+                requests=requests,
+                prompt_tokens=row["prompt_tokens"],
+                completion_tokens=row["completion_tokens"],
+                cached_tokens=row["cached_tokens"],
+                total_tokens=total_tokens,
+                avg_latency_ms=round(row["latency_ms_sum"] / requests, 1) if requests else None,
+            )
+        )
+        totals.requests += requests
+        totals.prompt_tokens += row["prompt_tokens"]
+        totals.completion_tokens += row["completion_tokens"]
+        totals.cached_tokens += row["cached_tokens"]
+        totals.total_tokens += total_tokens
+    return UsageReport(
+        granularity=granularity,
+        start=start,
+        end=end,
+        group_by=fields,
+        points=points,
+        totals=totals,
+    )
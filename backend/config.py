@@ -1,8 +1,8 @@
 from functools import lru_cache
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 
-from pydantic import Field
+from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings
 
 
@@ -18,9 +18,74 @@ class Settings(BaseSettings):
     # LLM provider credentials
     openai_api_key: Optional[str] = None
     anthropic_api_key: Optional[str] = None
+    anthropic_base_url: str = Field(default="https://api.anthropic.com")
 
-    allowed_upload_extensions: List[str] = Field(default_factory=lambda: ["csv", "xlsx", "xls"])
+    allowed_upload_extensions: List[str] = Field(
+        default_factory=lambda: [
+            "csv",
+            "xlsx",
+            "xls",
+            "csv.gz",
+            "gz",
+            "csv.zst",
+            "zst",
+            "parquet",
+            "feather",
+        ]
+    )
     upload_dir: Path = Field(default=Path("./uploaded_datasets"))
+    # Largest CSV a compressed upload may expand to; bigger streams are rejected.
+    upload_max_decompressed_mb: int = Field(default=4096)
+    # Token budget for the server-built dataset context, keyed by model family
+    # (matched as a substring of "provider:model"; the longest match wins).
+    dataset_context_token_budgets: Dict[str, int] = Field(
+        default_factory=lambda: {
+            "default": 1200,
+            "gpt-4o-mini": 1500,
+            "gpt-4o": 2500,
+            "gpt-4.1": 4000,
+            "claude": 4000,
+            "deepseek": 2000,
+            "qwen-max": 2000,
+            "qwen": 1200,
+        }
+    )
+    # Prompt budget for /chat/send, keyed like dataset_context_token_budgets. Older turns
+    # are dropped (and summarized) once the conversation no longer fits.
+    chat_context_token_budgets: Dict[str, int] = Field(
+        default_factory=lambda: {
+            "default": 6000,
+            "gpt-4o-mini": 16000,
+            "gpt-4o": 24000,
+            "gpt-4.1": 48000,
+            "claude": 48000,
+            "deepseek": 24000,
+            "qwen-max": 12000,
+            "qwen": 6000,
+        }
+    )
+    # stdout/stderr attached to the latest chat turn keep their head and tail within this.
+    chat_output_token_limit: int = Field(default=600)
+    # Turns sent as session_id + message rebuild the history server-side: at most this many
+    # recent messages are read, and the histories of recently active sessions stay in memory.
+    chat_history_max_messages: int = Field(default=200)
+    chat_history_cache_sessions: int = Field(default=256)
+    # Assistant replies are stored by a background writer after the response is built.
+    chat_write_behind_enabled: bool = Field(default=True)
+    # Rolling session summaries ("provider:model"; unset disables them). Once the messages
+    # older than the last chat_summary_keep_messages exceed chat_summary_trigger_tokens they
+    # are folded into the stored summary in the background, at most
+    # chat_summary_input_tokens per pass.
+    chat_summary_model: Optional[str] = Field(default=None)
+    chat_summary_trigger_tokens: int = Field(default=3000)
+    chat_summary_keep_messages: int = Field(default=6)
+    chat_summary_input_tokens: int = Field(default=6000)
+    chat_summary_max_tokens: int = Field(default=400)
+    # Task script history: a full snapshot every this many revisions, line deltas between.
+    code_revision_snapshot_interval: int = Field(default=10, ge=1)
+    # Chat diffs are applied server-side; a hunk may ignore up to this many context lines
+    # at each end that no longer match the script.
+    chat_patch_fuzz_lines: int = Field(default=2, ge=0)
 
     # LLM provider credentials (existing + new)
     openai_default_models: List[str] = Field(
@@ -45,6 +110,111 @@ class Settings(BaseSettings):
         default_factory=lambda: ["siliconflow-chat", "siliconflow-coder"]
     )
 
+    # Built-in "mock" provider for load tests: deterministic replies, no network calls.
+    # Latency is sampled around the median ("fixed", "uniform" +/- spread, or "lognormal"
+    # with sigma = spread); completion_tokens 0 reports the reply's own length.
+    # The fixed seed makes sampled latencies and injected errors repeat from run to run;
+    # set MOCK_LLM_SEED to an empty value for a fresh random sequence each start.
+    mock_llm_enabled: bool = Field(default=False)
+    mock_llm_latency_ms: float = Field(default=300.0)
+    mock_llm_latency_distribution: Literal["fixed", "uniform", "lognormal"] = Field(default="lognormal")
+    mock_llm_latency_spread: float = Field(default=0.5)
+    mock_llm_error_rate: float = Field(default=0.0)
+    mock_llm_error_status: int = Field(default=503)
+    mock_llm_completion_tokens: int = Field(default=0)
+    mock_llm_stream_chunk_chars: int = Field(default=16)
+    mock_llm_stream_chunk_ms: float = Field(default=5.0)
+    mock_llm_seed: Optional[int] = Field(default=42)
+
+    # Shared HTTP connection pool used by every LLM adapter (one client per provider origin).
+    llm_http2: bool = Field(default=True)
+    llm_http_max_connections: int = Field(default=100)
+    llm_http_max_keepalive_connections: int = Field(default=20)
+    llm_http_keepalive_expiry_seconds: float = Field(default=120.0)
+    llm_http_connect_timeout_seconds: float = Field(default=10.0)
+    llm_http_timeout_seconds: Optional[float] = Field(
+        default=None,
+        description="Overrides the adapters' per-call read timeouts when set.",
+    )
+    # Mark the stable chat prefix with Anthropic cache_control breakpoints (OpenAI and
+    # DeepSeek cache prefixes automatically).
+    llm_prompt_caching: bool = Field(default=True)
+    # Adapters built from per-user credential overrides are reused across requests.
+    llm_adapter_cache_size: int = Field(default=256)
+    provider_credentials_cache_ttl_seconds: float = Field(default=300.0)
+    # Provider model lists: served from cache, refreshed in the background once stale.
+    llm_models_cache_ttl_seconds: float = Field(default=120.0)
+    llm_models_discovery_timeout_seconds: float = Field(default=3.0)
+
+    # Retries with jittered exponential backoff on transport errors, 429 and 5xx.
+    llm_retry_max_attempts: int = Field(default=3)
+    llm_retry_base_delay_seconds: float = Field(default=0.5)
+    llm_retry_max_delay_seconds: float = Field(default=8.0)
+    # Consecutive retryable failures that open a provider's circuit, and how long it stays open.
+    llm_circuit_failure_threshold: int = Field(default=5)
+    llm_circuit_reset_seconds: float = Field(default=30.0)
+    # Hedging: once a call outlives the provider's rolling p95, race a second request.
+    llm_hedge_enabled: bool = Field(default=False)
+    llm_hedge_min_samples: int = Field(default=20)
+    llm_hedge_backup_providers: Dict[str, str] = Field(
+        default_factory=dict,
+        description='Provider to "provider:model" used for hedged requests, e.g. {"openai": "deepseek:deepseek-chat"}.',
+    )
+
+    # Response cache in front of /llm/generate ("user" keeps entries private per user).
+    llm_cache_enabled: bool = Field(default=True)
+    llm_cache_ttl_hours: float = Field(default=24.0)
+    llm_cache_max_entries: int = Field(default=5000)
+    llm_cache_scope: Literal["user", "global"] = Field(default="user")
+    # Expired and over-capacity entries are swept in the background; 0 disables the sweep.
+    llm_cache_prune_interval_seconds: int = Field(default=300)
+    # Optional fuzzy cache matching reworded prompts against the same dataset schema.
+    llm_similarity_cache_enabled: bool = Field(default=False)
+    llm_similarity_threshold: float = Field(default=0.8, ge=0.0, le=1.0)
+    llm_similarity_cache_max_entries: int = Field(default=2000)
+    # Identical generate/chat calls already in flight for the same user share one upstream call.
+    llm_single_flight_enabled: bool = Field(default=True)
+
+    # Token-bucket limits per minute ("rpm" requests, "tpm" estimated tokens; 0 = unlimited).
+    # Keys are provider ids or "default". Provider limits are shared by all users, user
+    # limits apply to each user separately, and overrides are keyed by user id.
+    rate_limit_enabled: bool = Field(default=True)
+    rate_limit_provider_limits: Dict[str, Dict[str, float]] = Field(default_factory=dict)
+    rate_limit_user_limits: Dict[str, Dict[str, float]] = Field(
+        default_factory=lambda: {"default": {"rpm": 30, "tpm": 120000}}
+    )
+    rate_limit_user_overrides: Dict[str, Dict[str, Dict[str, float]]] = Field(default_factory=dict)
+    rate_limit_max_wait_seconds: float = Field(default=10.0)
+    rate_limit_completion_token_estimate: int = Field(default=1024)
+
+    # Usage ledger writer: events are batched off the request path.
+    usage_flush_interval_seconds: float = Field(default=2.0)
+    usage_flush_batch_size: int = Field(default=500)
+    usage_queue_max_size: int = Field(default=10000)
+
+    # /llm/compare fan-out limits.
+    llm_compare_max_targets: int = Field(default=8)
+    llm_compare_max_concurrency: int = Field(default=4)
+
+    # Best-of-N on /llm/generate: candidates are screened (syntax, imports, DATASET_PATH)
+    # and optionally dry-run on the first rows of the dataset; the first valid one wins.
+    llm_candidates_max: int = Field(default=5)
+    llm_candidate_temperature: float = Field(default=0.7)
+    llm_candidate_dry_run_rows: int = Field(default=200)
+    llm_candidate_dry_run_timeout_seconds: int = Field(default=20)
+    code_screen_allowed_modules: List[str] = Field(
+        default_factory=lambda: [
+            "numpy", "pandas", "matplotlib", "seaborn", "plotly", "scipy", "statsmodels",
+            "sklearn", "lifelines", "pymc", "arviz", "nltk", "spacy", "prophet", "shap",
+            "openpyxl", "pyarrow",
+        ]
+    )
+
+    # /llm/batches: provider batch APIs where available, otherwise a throttled worker.
+    llm_batch_max_items: int = Field(default=1000)
+    llm_batch_poll_interval_seconds: float = Field(default=5.0)
+    llm_batch_worker_concurrency: int = Field(default=4)
+
     credentials_secret_key: Optional[str] = Field(
         default=None,
         description="Optional base64/UTF-8 secret for encrypting stored provider credentials. Falls back to JWT secret if omitted.",
@@ -62,6 +232,18 @@ class Settings(BaseSettings):
     max_code_execution_memory_mb: int = Field(default=768)
     artifacts_dir: Path = Field(default=Path("./analysis_artifacts"))
 
+    # Disk usage limits for uploads, artifacts and derived files (0 disables a quota).
+    storage_user_quota_mb: int = Field(default=2048)
+    storage_global_quota_mb: int = Field(default=20480)
+    storage_sweep_interval_seconds: int = Field(default=600)
+    storage_run_artifact_ttl_hours: int = Field(default=72)
+    storage_min_idle_seconds: int = Field(default=300)
+
+    @field_validator("mock_llm_seed", mode="before")
+    @classmethod
+    def _empty_seed_means_unseeded(cls, value: object) -> object:
+        return None if isinstance(value, str) and not value.strip() else value
+
     class Config:
         env_file = str(Path(__file__).resolve().parent / ".env")
         case_sensitive = False
@@ -1,5 +1,6 @@
 from databases import Database
-from sqlalchemy import MetaData, create_engine
+from sqlalchemy import MetaData, Table, create_engine
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker
 
 from .config import get_settings
@@ -13,3 +14,10 @@ engine = create_engine(
 database = Database(settings.database_url)
 
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+
+
+def upsert_insert(db: Database, table: Table):
+    """An ``INSERT`` for ``table`` supporting ``on_conflict_do_update`` on ``db``'s dialect."""
+    if db.url.dialect == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
@@ -0,0 +1,209 @@
+"""Benchmark the database work of one /chat/send turn.
+
+Usage::
+
+    python -m backend.devtools.bench_chat_db [--database-url sqlite+aiosqlite:///./bench_chat.db]
+        [--sessions 20] [--turns 25] [--concurrency 1,8]
+
+    # Postgres
+    python -m backend.devtools.bench_chat_db --database-url postgresql+asyncpg://user:pw@localhost/bench
+
+Each session belongs to a task with a script and runs its turns one after another;
+``--concurrency`` sessions run at once. Reports per turn the statements and the
+milliseconds spent in the database on the request path, for:
+
+- ``sequential``: the statements one after another, each committed on its own
+  (credentials, session check and touch, task code, user message and session touch,
+  assistant message and session touch).
+- ``batched``: credentials, session and task read concurrently, the session touch and
+  user message in one transaction, and the assistant message handed to the write-behind
+  writer (``writer_ms`` is the writer's time per turn, off the request path).
+
+Credentials are read from the database on every turn, as on a cache miss. Tables are
+created if missing; the rows written are left in place.
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+from databases import Database
+from sqlalchemy import insert, select, update
+from sqlalchemy.schema import CreateTable
+
+from ..database import metadata
+from ..models.chat import chat_messages, chat_sessions
+from ..models.task import analysis_tasks
+from ..models.user import users
+from ..services import chat_service, provider_credentials_service, task_service
+
+_SCRIPT = "import pandas as pd\n" + "".join(f"df['c{i}'] = df['v'] * {i}\n" for i in range(200))
+_REPLY = "Added a rolling mean. " * 40
+
+
+class _Counter:
+    """Counts the statements sent through a ``Database`` outside the write-behind writer."""
+
+    def __init__(self, db: Database) -> None:
+        self.statements = 0
+        for name in ("execute", "execute_many", "fetch_one", "fetch_all"):
+            setattr(db, name, self._wrap(getattr(db, name)))
+
+    def _wrap(self, method: Callable) -> Callable:
+        async def counted(*args: Any, **kwargs: Any) -> Any:
+            if asyncio.current_task() is not chat_service._writer_task:
+                self.statements += 1
+            return await method(*args, **kwargs)
+
+        return counted
+
+
+def _percentile(values: List[float], share: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(int(share * len(ordered)), len(ordered) - 1)], 2)
+
+
+async def _prepare(db: Database) -> None:
+    for table in metadata.sorted_tables:
+        await db.execute(CreateTable(table, if_not_exists=True))
+    if await db.fetch_one(select(users.c.id).where(users.c.id == 1)) is None:
+        await db.execute(insert(users).values(id=1, username="default"))
+
+
+async def _new_task(db: Database) -> int:
+    return await db.execute(
+        insert(analysis_tasks)
+        .values(user_id=1, title="bench", prompt="bench", model="mock:mock-chat", generated_code=_SCRIPT)
+        .returning(analysis_tasks.c.id)
+    )
+
+
+async def _sequential_turn(db: Database, session_id: int, task_id: int, turn: int) -> int:
+    await provider_credentials_service._load_credentials_map(db, 1)
+    if session_id:
+        await db.fetch_one(select(chat_sessions).where(chat_sessions.c.id == session_id))
+        await db.fetch_one(select(chat_sessions.c.id).where(chat_sessions.c.id == session_id))
+        await db.execute(
+            update(chat_sessions).where(chat_sessions.c.id == session_id).values(updated_at=datetime.utcnow())
+        )
+    else:
+        session_id = await db.execute(
+            insert(chat_sessions)
+            .values(
+                task_id=task_id,
+                model="mock:mock-chat",
+                user_id=1,
+                created_at=datetime.utcnow(),
+                updated_at=datetime.utcnow(),
+            )
+            .returning(chat_sessions.c.id)
+        )
+    await db.fetch_one(select(analysis_tasks.c.generated_code).where(analysis_tasks.c.id == task_id))
+    for role, content in (("user", f"Question {turn}"), ("assistant", _REPLY)):
+        await db.execute(
+            insert(chat_messages).values(
+                session_id=session_id, role=role, content=content, created_at=datetime.utcnow()
+            )
+        )
+        await db.execute(
+            update(chat_sessions).where(chat_sessions.c.id == session_id).values(updated_at=datetime.utcnow())
+        )
+    return session_id
+
+
+async def _batched_turn(db: Database, session_id: int, task_id: int, turn: int) -> int:
+    async def _none() -> None:
+        return None
+
+    _, session, task = await asyncio.gather(
+        provider_credentials_service._load_credentials_map(db, 1),
+        chat_service.get_session(db, session_id, 1) if session_id else _none(),
+        task_service.get_task(db, task_id, 1),
+    )
+    session_id = await chat_service.start_turn(
+        db,
+        session=session,
+        task_id=task_id,
+        model="mock:mock-chat",
+        user_id=1,
+        content=f"Question {turn}",
+    )
+    await chat_service.queue_message(db, session_id=session_id, role="assistant", content=_REPLY)
+    return session_id
+
+
+async def _run(db: Database, turn_fn: Callable, args: argparse.Namespace, concurrency: int) -> Dict[str, Any]:
+    counter = _Counter(db)
+    durations: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _session() -> None:
+        async with semaphore:
+            task_id = await _new_task(db)
+            session_id = 0
+            for turn in range(args.turns):
+                started = time.perf_counter()
+                session_id = await turn_fn(db, session_id, task_id, turn)
+                durations.append((time.perf_counter() - started) * 1000)
+
+    counter.statements = 0
+    started = time.perf_counter()
+    await asyncio.gather(*(_session() for _ in range(args.sessions)))
+    statements = counter.statements
+    # Throughput includes writing out what the writer still holds.
+    await chat_service.stop_writer(db)
+    elapsed = time.perf_counter() - started
+    turns = len(durations)
+    writer = chat_service.get_metrics()
+    return {
+        "statements_per_turn": round(statements / turns, 2),
+        "mean_ms": round(sum(durations) / turns, 2),
+        "p50_ms": _percentile(durations, 0.5),
+        "p95_ms": _percentile(durations, 0.95),
+        "turns_per_s": round(turns / elapsed, 1),
+        **(
+            {
+                "writer_ms": round(writer["write_ms"] / turns, 2),
+                "writer_batches": writer["write_batches"],
+            }
+            if turn_fn is _batched_turn
+            else {}
+        ),
+    }
+
+
+async def bench(args: argparse.Namespace) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for concurrency in args.concurrency:
+        for name, turn_fn in (("sequential", _sequential_turn), ("batched", _batched_turn)):
+            db = Database(args.database_url)
+            await db.connect()
+            try:
+                await _prepare(db)
+                chat_service._metrics.update(write_batches=0, write_ms=0.0)
+                if turn_fn is _batched_turn:
+                    chat_service.start_writer(db)
+                results[f"{name}@{concurrency}"] = await _run(db, turn_fn, args, concurrency)
+            finally:
+                await chat_service.stop_writer(db)
+                await db.disconnect()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default="sqlite+aiosqlite:///./bench_chat.db")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=25)
+    parser.add_argument(
+        "--concurrency", type=lambda value: [int(part) for part in value.split(",")], default=[1, 8]
+    )
+    args = parser.parse_args()
+    results = asyncio.run(bench(args))
+    print(json.dumps({"database": args.database_url.split(":", 1)[0], "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
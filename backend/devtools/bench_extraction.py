@@ -0,0 +1,88 @@
+"""Benchmark code extraction from large provider responses.
+
+Usage::
+
+    python -m backend.devtools.bench_extraction [--size-kb 100] [--chunk 64] [--repeat 20]
+
+Builds JSON responses of roughly ``--size-kb`` (plain, Markdown-fenced and ASCII-escaped)
+and reports milliseconds per response for:
+
+- ``json.loads``: lower bound for complete, well-formed JSON.
+- ``extract``: ``_extract_code_and_reasoning`` on the complete text (one pass).
+- ``stream``: feeding ``JsonFieldStream`` the text in ``--chunk``-sized pieces, as the
+  streaming endpoint does, and extracting from the already-fed stream.
+- ``reparse``: re-extracting from the growing buffer after every chunk, which is what
+  progressive output costs without an incremental parser (skipped above 2000
+  chunks, since it is quadratic).
+"""
+import argparse
+import json
+import time
+from typing import Callable, Dict
+
+from ..api.llm import _extract_code_and_reasoning
+from ..services.json_fields import JsonFieldStream
+
+_REPARSE_MAX_CHUNKS = 2000
+
+
+def build_responses(size_kb: int) -> Dict[str, str]:
+    line = "df['value_{i}'] = df['value'].rolling(7).mean()  # smoothing \"window\" {i}\n"
+    lines = []
+    size = 0
+    while size < size_kb * 1024:
+        text = line.format(i=len(lines))
+        lines.append(text)
+        size += len(text)
+    code = "import pandas as pd\n" + "".join(lines)
+    body = {"reasoning": "Rolling means per column.", "code": code}
+    plain = json.dumps(body)
+    return {
+        "plain": plain,
+        "fenced": f"```json\n{plain}\n```",
+        "ascii": json.dumps({**body, "code": code + "# naïve résumé 😀\n"}, ensure_ascii=True),
+    }
+
+
+def _time(fn: Callable[[], object], repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) * 1000 / repeat
+
+
+def _stream(text: str, chunk: int) -> None:
+    fields = JsonFieldStream()
+    for index in range(0, len(text), chunk):
+        fields.feed(text[index : index + chunk])
+    fields.finish()
+    _extract_code_and_reasoning(text, fields)
+
+
+def _reparse(text: str, chunk: int) -> None:
+    for end in range(chunk, len(text) + chunk, chunk):
+        _extract_code_and_reasoning(text[:end])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-kb", type=int, default=100)
+    parser.add_argument("--chunk", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    results = {}
+    for name, text in build_responses(args.size_kb).items():
+        row = {"bytes": len(text)}
+        if name != "fenced":
+            row["json.loads"] = round(_time(lambda: json.loads(text), args.repeat), 3)
+        row["extract"] = round(_time(lambda: _extract_code_and_reasoning(text), args.repeat), 3)
+        row["stream"] = round(_time(lambda: _stream(text, args.chunk), args.repeat), 3)
+        if len(text) // args.chunk <= _REPARSE_MAX_CHUNKS:
+            row["reparse"] = round(_time(lambda: _reparse(text, args.chunk), 1), 3)
+        results[name] = row
+    print(json.dumps({"unit": "ms per response", "chunk": args.chunk, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
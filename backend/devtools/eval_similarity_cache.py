@@ -0,0 +1,61 @@
+"""Measure near-duplicate cache precision on labelled prompt pairs.
+
+Usage::
+
+    python -m backend.devtools.eval_similarity_cache [pairs.jsonl] [--threshold 0.8]
+
+Each JSONL line is ``{"a": "...", "b": "...", "same": true}``. Without a file a small
+built-in sample of typical analysis requests is used.
+"""
+import argparse
+import json
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+from ..services.similarity_cache import evaluate_precision, jaccard, key_tokens, shingles
+
+SAMPLE_PAIRS: List[Tuple[str, str, bool]] = [
+    ("做相关性分析并绘图", "请做相关性分析, 并绘图", True),
+    ("做相关性分析并绘图", "做相关性分析并绘图。", True),
+    ("做相关性分析并绘图", "做回归分析并绘图", False),
+    ("计算每个分组的均值和标准差", "请计算每个分组的均值与标准差", True),
+    ("计算每个分组的均值和标准差", "计算每个分组的中位数和四分位距", False),
+    ("Plot a histogram of age", "plot a histogram of age.", True),
+    ("Plot a histogram of age", "Plot a histogram of  Age ", True),
+    ("Plot a histogram of age", "Plot a histogram of income", False),
+    ("Run a t-test between group A and group B", "run a t test between group A and group B", True),
+    ("Run a t-test between group A and group B", "Run a chi-square test between group A and group B", False),
+    ("Fit a linear regression of y on x", "Fit a linear regression of y on x and z", False),
+    ("Fit a linear regression of y on x", "fit a linear regression of y on x", True),
+    ("Show the top 10 rows sorted by sales_2023", "Show the top 10 rows sorted by sales_2024", False),
+    ("前10行按销售额排序", "前20行按销售额排序", False),
+    ("Show the correlation heatmap", "Show the correlation heat map", True),
+]
+
+
+def _load_pairs(path: Path) -> Iterable[Tuple[str, str, bool]]:
+    with path.open(encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                item = json.loads(line)
+                yield item["a"], item["b"], bool(item["same"])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pairs", nargs="?", type=Path)
+    parser.add_argument("--threshold", type=float, default=None)
+    parser.add_argument("--verbose", action="store_true", help="print every pair's similarity")
+    args = parser.parse_args()
+
+    pairs = list(_load_pairs(args.pairs)) if args.pairs else SAMPLE_PAIRS
+    if args.verbose:
+        for left, right, same in pairs:
+            score = jaccard(shingles(left), shingles(right))
+            tokens = "=" if key_tokens(left) == key_tokens(right) else "!"
+            print(f"{score:.3f} {tokens}  same={same!s:5}  {left!r} ~ {right!r}")
+    print(json.dumps(evaluate_precision(pairs, threshold=args.threshold), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Drive /llm/generate or /chat/send at high concurrency against the mock provider.
+
+Start the backend with the offline provider enabled, then point this at it::
+
+    MOCK_LLM_ENABLED=true RATE_LIMIT_ENABLED=false uvicorn backend.main:app --port 8000
+    python -m backend.devtools.load_test --endpoint chat --requests 2000 --concurrency 100
+
+Every request carries a distinct prompt (``--repeat`` reuses prompts to exercise the
+response cache), and chat requests each start a new session. Prints throughput, the
+status-code breakdown and latency percentiles as JSON.
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+import httpx
+
+
+def _percentile(values: List[float], share: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return round(ordered[min(int(share * len(ordered)), len(ordered) - 1)], 1)
+
+
+def _request(args: argparse.Namespace, index: int) -> Dict[str, Any]:
+    prompt = f"Summarize column {index % args.repeat if args.repeat else index} of the dataset"
+    if args.endpoint == "generate":
+        return {"path": "/llm/generate", "json": {"prompt": prompt, "model": args.model}}
+    return {
+        "path": "/chat/send",
+        "json": {"model": args.model, "messages": [{"role": "user", "content": prompt}]},
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    queue: asyncio.Queue = asyncio.Queue()
+    for index in range(args.requests):
+        queue.put_nowait(index)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=args.url, headers={"x-user-id": str(args.user_id)}, limits=limits, timeout=120.0
+    ) as client:
+
+        async def worker() -> None:
+            while not queue.empty():
+                request = _request(args, queue.get_nowait())
+                started = time.perf_counter()
+                try:
+                    response = await client.post(request["path"], json=request["json"])
+                    statuses[str(response.status_code)] += 1
+                except httpx.HTTPError as exc:
+                    statuses[type(exc).__name__] += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    return {
+        "endpoint": args.endpoint,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(args.requests / elapsed, 1) if elapsed else None,
+        "statuses": dict(statuses),
+        "latency_ms": {
+            "p50": _percentile(latencies, 0.50),
+            "p95": _percentile(latencies, 0.95),
+            "p99": _percentile(latencies, 0.99),
+            "max": round(max(latencies), 1) if latencies else 0.0,
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoint", choices=["generate", "chat"], default="generate")
+    parser.add_argument("--model", default="mock:mock-coder")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=0, help="cycle through this many distinct prompts")
+    parser.add_argument("--user-id", type=int, default=1)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""Local OpenAI-compatible LLM stub with fault injection, for exercising the adapter layer.
+
+Run it and point an OpenAI-compatible provider (DeepSeek, SiliconFlow) at it::
+
+    uvicorn backend.devtools.stub_llm_server:app --port 8765
+    SILICONFLOW_BASE_URL=http://127.0.0.1:8765 SILICONFLOW_API_KEY=stub ...
+
+It also serves Anthropic's ``/v1/messages`` (point ``ANTHROPIC_BASE_URL`` at it) and
+simulates provider prompt caching: OpenAI-style automatic prefix caching in 128-token
+steps past 1024 tokens, and Anthropic ``cache_control`` breakpoints. Cached counts are
+reported in ``usage`` the way each provider does.
+
+The OpenAI batch API is emulated too: ``POST /v1/files`` takes the JSONL upload,
+``/v1/batches`` runs it in the background (after ``batch_latency_ms``) and the results
+are read back from ``/v1/files/{id}/content``. ``error_rate`` applies per request line.
+
+Faults are configured with ``STUB_*`` environment variables or at runtime through
+``POST /_faults`` (same keys, lower case), e.g.
+``{"error_rate": 0.3, "error_status": 503, "slow_rate": 0.1, "slow_ms": 5000}``.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List
+
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+app = FastAPI(title="LLM stub")
+
+faults: Dict[str, Any] = {
+    # Base latency added to every completion.
+    "latency_ms": float(os.getenv("STUB_LATENCY_MS", "50")),
+    # Share of requests that fail with ``error_status`` (optionally with Retry-After).
+    "error_rate": float(os.getenv("STUB_ERROR_RATE", "0")),
+    "error_status": int(os.getenv("STUB_ERROR_STATUS", "503")),
+    "retry_after": os.getenv("STUB_RETRY_AFTER"),
+    # Share of requests delayed by an extra ``slow_ms`` (tail latency for hedging).
+    "slow_rate": float(os.getenv("STUB_SLOW_RATE", "0")),
+    "slow_ms": float(os.getenv("STUB_SLOW_MS", "5000")),
+    # Share of requests whose connection is dropped mid-response.
+    "drop_rate": float(os.getenv("STUB_DROP_RATE", "0")),
+    # Fail the next N requests regardless of error_rate (deterministic outages).
+    "fail_next": int(os.getenv("STUB_FAIL_NEXT", "0")),
+    # Time a submitted batch spends in progress before its output file is written.
+    "batch_latency_ms": float(os.getenv("STUB_BATCH_LATENCY_MS", "500")),
+}
+counters: Dict[str, int] = {"requests": 0, "errors": 0, "slow": 0, "dropped": 0}
+# Body of the latest request per API ("chat", "messages"), for tests to inspect.
+last_requests: Dict[str, Dict[str, Any]] = {}
+
+# Prompt prefixes seen so far, by hash.
+_CHARS_PER_TOKEN = 4
+_PREFIX_MIN_TOKENS = 1024
+_PREFIX_STEP_TOKENS = 128
+_prefix_cache: set[str] = set()
+
+REPLY = json.dumps(
+    {
+        "reasoning": "Stub response.",
+        "code": "import pandas as pd\nprint('stub')",
+        "reply": "Stub reply.",
+        "patch": None,
+    }
+)
+
+
+async def _inject_faults() -> None:
+    counters["requests"] += 1
+    if faults["fail_next"] > 0 or random.random() < faults["error_rate"]:
+        faults["fail_next"] = max(faults["fail_next"] - 1, 0)
+        counters["errors"] += 1
+        headers = {"Retry-After": str(faults["retry_after"])} if faults["retry_after"] else None
+        raise HTTPException(status_code=faults["error_status"], detail="injected fault", headers=headers)
+    delay = faults["latency_ms"]
+    if random.random() < faults["slow_rate"]:
+        counters["slow"] += 1
+        delay += faults["slow_ms"]
+    await asyncio.sleep(delay / 1000)
+
+
+def _prefix_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _serialize_openai_prompt(body: Dict[str, Any]) -> str:
+    return "".join(f"<{message.get('role')}>{message.get('content', '')}" for message in body.get("messages", []))
+
+
+def _openai_cached_tokens(prompt: str) -> int:
+    """Longest previously seen prefix, in 128-token steps from 1024 tokens, like OpenAI."""
+    step = _PREFIX_STEP_TOKENS * _CHARS_PER_TOKEN
+    cached = 0
+    for end in range(_PREFIX_MIN_TOKENS * _CHARS_PER_TOKEN, len(prompt) + 1, step):
+        key = _prefix_key(prompt[:end])
+        if key in _prefix_cache:
+            cached = end // _CHARS_PER_TOKEN
+        _prefix_cache.add(key)
+    return cached
+
+
+def _usage(body: Dict[str, Any]) -> Dict[str, Any]:
+    prompt = _serialize_openai_prompt(body)
+    prompt_tokens = len(prompt) // _CHARS_PER_TOKEN
+    completion_tokens = len(REPLY) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": _openai_cached_tokens(prompt)},
+    }
+
+
+def _blocks_text(block: Any) -> str:
+    if isinstance(block, dict):
+        return str(block.get("text", ""))
+    return str(block)
+
+
+def _anthropic_usage(body: Dict[str, Any]) -> Dict[str, int]:
+    """Split the prompt at ``cache_control`` breakpoints into read, written and plain tokens."""
+    system = body.get("system") or []
+    blocks = [_blocks_text(system)] if isinstance(system, str) else list(system)
+    for message in body.get("messages", []):
+        content = message.get("content")
+        blocks.extend([_blocks_text(content)] if isinstance(content, str) else content or [])
+    serialized = ""
+    cached_upto = 0
+    written_upto = 0
+    for block in blocks:
+        serialized += _blocks_text(block)
+        if isinstance(block, dict) and block.get("cache_control"):
+            key = _prefix_key(serialized)
+            if key in _prefix_cache:
+                cached_upto = len(serialized)
+            else:
+                _prefix_cache.add(key)
+                written_upto = len(serialized)
+    written_upto = max(written_upto - cached_upto, 0)
+    total = len(serialized)
+    return {
+        "input_tokens": (total - cached_upto - written_upto) // _CHARS_PER_TOKEN,
+        "cache_read_input_tokens": cached_upto // _CHARS_PER_TOKEN,
+        "cache_creation_input_tokens": written_upto // _CHARS_PER_TOKEN,
+        "output_tokens": len(REPLY) // 4,
+    }
+
+
+async def _stream_completion(body: Dict[str, Any]) -> AsyncIterator[str]:
+    drop = random.random() < faults["drop_rate"]
+    for index in range(0, len(REPLY), 16):
+        if drop and index >= len(REPLY) // 2:
+            counters["dropped"] += 1
+            raise ConnectionResetError("injected drop")
+        chunk = {"choices": [{"index": 0, "delta": {"content": REPLY[index : index + 16]}}]}
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(0.005)
+    if (body.get("stream_options") or {}).get("include_usage"):
+        yield f"data: {json.dumps({'choices': [], 'usage': _usage(body)})}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+@app.post("/chat/completions")
+async def chat_completions(body: Dict[str, Any]):
+    last_requests["chat"] = body
+    await _inject_faults()
+    if body.get("stream"):
+        return StreamingResponse(_stream_completion(body), media_type="text/event-stream")
+    return JSONResponse(
+        {
+            "id": f"stub-{int(time.time() * 1000)}",
+            "object": "chat.completion",
+            "model": body.get("model", "stub"),
+            "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": REPLY}, "finish_reason": "stop"}
+            ],
+            "usage": _usage(body),
+        }
+    )
+
+
+async def _stream_message(usage: Dict[str, int]) -> AsyncIterator[str]:
+    start = {"type": "message_start", "message": {"usage": {**usage, "output_tokens": 0}}}
+    yield f"event: message_start\ndata: {json.dumps(start)}\n\n"
+    for index in range(0, len(REPLY), 16):
+        delta = {
+            "type": "content_block_delta",
+            "index": 0,
+            "delta": {"type": "text_delta", "text": REPLY[index : index + 16]},
+        }
+        yield f"event: content_block_delta\ndata: {json.dumps(delta)}\n\n"
+        await asyncio.sleep(0.005)
+    end = {"type": "message_delta", "usage": {"output_tokens": usage["output_tokens"]}}
+    yield f"event: message_delta\ndata: {json.dumps(end)}\n\n"
+    yield 'event: message_stop\ndata: {"type": "message_stop"}\n\n'
+
+
+@app.post("/v1/messages")
+async def messages(body: Dict[str, Any]):
+    last_requests["messages"] = body
+    await _inject_faults()
+    if any(message.get("role") not in ("user", "assistant") for message in body.get("messages", [])):
+        raise HTTPException(status_code=400, detail="messages: roles must be 'user' or 'assistant'")
+    usage = _anthropic_usage(body)
+    if body.get("stream"):
+        return StreamingResponse(_stream_message(usage), media_type="text/event-stream")
+    return JSONResponse(
+        {
+            "id": f"stub-{int(time.time() * 1000)}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", "stub"),
+            "content": [{"type": "text", "text": REPLY}],
+            "stop_reason": "end_turn",
+            "usage": usage,
+        }
+    )
+
+
+files: Dict[str, bytes] = {}
+batches: Dict[str, Dict[str, Any]] = {}
+
+
+def _batch_result_line(request: Dict[str, Any]) -> Dict[str, Any]:
+    counters["requests"] += 1
+    if random.random() < faults["error_rate"]:
+        counters["errors"] += 1
+        response = {
+            "status_code": faults["error_status"],
+            "body": {"error": {"message": "injected fault"}},
+        }
+    else:
+        body = request.get("body") or {}
+        response = {
+            "status_code": 200,
+            "body": {
+                "id": f"stub-{uuid.uuid4().hex[:12]}",
+                "object": "chat.completion",
+                "model": body.get("model", "stub"),
+                "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": REPLY}, "finish_reason": "stop"}
+                ],
+                "usage": _usage(body),
+            },
+        }
+    return {
+        "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+        "custom_id": request.get("custom_id"),
+        "response": response,
+        "error": None,
+    }
+
+
+async def _run_batch(batch: Dict[str, Any]) -> None:
+    batch["status"] = "in_progress"
+    await asyncio.sleep(faults["batch_latency_ms"] / 1000)
+    if batch["status"] != "in_progress":
+        return
+    lines = files[batch["input_file_id"]].decode("utf-8").splitlines()
+    requests = [json.loads(line) for line in lines if line.strip()]
+    output: List[str] = []
+    errors: List[str] = []
+    for request in requests:
+        line = _batch_result_line(request)
+        (output if line["response"]["status_code"] == 200 else errors).append(json.dumps(line))
+    for key, records in (("output_file_id", output), ("error_file_id", errors)):
+        if records:
+            file_id = f"file-{uuid.uuid4().hex[:12]}"
+            files[file_id] = "\n".join(records).encode("utf-8")
+            batch[key] = file_id
+    batch["request_counts"] = {"total": len(requests), "completed": len(output), "failed": len(errors)}
+    batch["status"] = "completed"
+    batch["completed_at"] = int(time.time())
+
+
+@app.post("/v1/files")
+async def upload_file(file: UploadFile = File(...), purpose: str = Form(...)) -> Dict[str, Any]:
+    content = await file.read()
+    file_id = f"file-{uuid.uuid4().hex[:12]}"
+    files[file_id] = content
+    return {"id": file_id, "object": "file", "bytes": len(content), "purpose": purpose, "filename": file.filename}
+
+
+@app.get("/v1/files/{file_id}/content")
+async def file_content(file_id: str) -> PlainTextResponse:
+    if file_id not in files:
+        raise HTTPException(status_code=404, detail="No such file")
+    return PlainTextResponse(files[file_id].decode("utf-8"))
+
+
+@app.post("/v1/batches")
+async def create_batch(body: Dict[str, Any]) -> Dict[str, Any]:
+    if body.get("input_file_id") not in files:
+        raise HTTPException(status_code=400, detail="Unknown input_file_id")
+    batch = {
+        "id": f"batch_{uuid.uuid4().hex[:12]}",
+        "object": "batch",
+        "endpoint": body.get("endpoint"),
+        "input_file_id": body["input_file_id"],
+        "completion_window": body.get("completion_window"),
+        "status": "validating",
+        "output_file_id": None,
+        "error_file_id": None,
+        "created_at": int(time.time()),
+        "completed_at": None,
+        "request_counts": {"total": 0, "completed": 0, "failed": 0},
+    }
+    batches[batch["id"]] = batch
+    asyncio.create_task(_run_batch(batch))
+    return batch
+
+
+@app.get("/v1/batches/{batch_id}")
+async def get_batch(batch_id: str) -> Dict[str, Any]:
+    if batch_id not in batches:
+        raise HTTPException(status_code=404, detail="No such batch")
+    return batches[batch_id]
+
+
+@app.post("/v1/batches/{batch_id}/cancel")
+async def cancel_batch(batch_id: str) -> Dict[str, Any]:
+    if batch_id not in batches:
+        raise HTTPException(status_code=404, detail="No such batch")
+    batches[batch_id]["status"] = "cancelled"
+    return batches[batch_id]
+
+
+@app.get("/v1/models")
+@app.get("/models")
+async def list_models() -> Dict[str, Any]:
+    await _inject_faults()
+    return {"object": "list", "data": [{"id": "stub-chat"}, {"id": "stub-coder"}]}
+
+
+@app.get("/_faults")
+async def get_faults() -> Dict[str, Any]:
+    return {"faults": faults, "counters": counters}
+
+
+@app.post("/_faults")
+async def set_faults(update: Dict[str, Any]) -> Dict[str, Any]:
+    unknown = set(update) - set(faults)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fault keys: {sorted(unknown)}")
+    faults.update(update)
+    return {"faults": faults, "counters": counters}
@@ -1,72 +1,156 @@
-from typing import Any, Dict, Optional
-
-import httpx
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
+from ..config import get_settings
 from .base import DEFAULT_CODE_SYSTEM_PROMPT, LLMAdapter
+from .http_client import http_pool
+from .streaming import iter_sse, raise_for_stream_status
+
+
+ANTHROPIC_BASE_URL = "https://api.anthropic.com"
+_CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def _text_block(text: str) -> Dict[str, Any]:
+    return {"type": "text", "text": text}
 
 
-ANTHROPIC_ENDPOINT = "https://api.anthropic.com/v1/messages"
+def split_system_messages(
+    messages: list[Dict[str, str]], *, cache_prefix: bool
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Convert OpenAI-style chat messages into Anthropic ``system`` blocks and turns.
+
+    Leading system messages become the system prompt. The Messages API has no system
+    role, so later system messages are folded into the adjacent user turn. With
+    ``cache_prefix`` the end of the system prompt and the turn before the latest one
+    get ``cache_control`` breakpoints, so both the stable instructions and the
+    conversation so far are read from Anthropic's prompt cache on the next turn.
+    """
+    index = 0
+    system: List[Dict[str, Any]] = []
+    while index < len(messages) and messages[index]["role"] == "system":
+        system.append(_text_block(messages[index]["content"]))
+        index += 1
+
+    turns: List[Dict[str, Any]] = []
+    pending: List[Dict[str, Any]] = []
+    for message in messages[index:]:
+        block = _text_block(message["content"])
+        if message["role"] == "system":
+            if turns and turns[-1]["role"] == "user":
+                turns[-1]["content"].append(block)
+            else:
+                pending.append(block)
+            continue
+        turns.append({"role": message["role"], "content": [*pending, block]})
+        pending = []
+    if pending:
+        turns.append({"role": "user", "content": pending})
+
+    if cache_prefix:
+        if system:
+            system[-1]["cache_control"] = _CACHE_CONTROL
+        if len(turns) >= 2:
+            turns[-2]["content"][-1]["cache_control"] = _CACHE_CONTROL
+    return system, turns
 
 
 class AnthropicAdapter(LLMAdapter):
     name = "anthropic"
 
     def __init__(
-        self, *, api_key: Optional[str], model: str = "claude-3-sonnet-20240229", default_models: Optional[list[str]] = None
+        self,
+        *,
+        api_key: Optional[str],
+        base_url: str = ANTHROPIC_BASE_URL,
+        model: str = "claude-3-sonnet-20240229",
+        default_models: Optional[list[str]] = None,
     ):
         super().__init__(api_key=api_key, default_models=default_models)
         self.model = model
+        self.base_url = base_url.rstrip("/") or ANTHROPIC_BASE_URL
+        self.messages_endpoint = f"{self.base_url}/v1/messages"
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "x-api-key": self.api_key,
+            "anthropic-version": "2023-06-01",
+            "content-type": "application/json",
+        }
+
+    def _body(
+        self, messages: list[Dict[str, Any]], kwargs: Dict[str, Any], *, temperature: float
+    ) -> Dict[str, Any]:
+        return {
+            "model": kwargs.get("model") or self.model,
+            "max_tokens": kwargs.get("max_tokens", 2048),
+            "temperature": kwargs.get("temperature", temperature),
+            "system": kwargs.get("system_prompt", DEFAULT_CODE_SYSTEM_PROMPT),
+            "messages": messages,
+        }
+
+    def _chat_body(self, messages: list[Dict[str, str]], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        system, turns = split_system_messages(messages, cache_prefix=get_settings().llm_prompt_caching)
+        body = self._body(turns, kwargs, temperature=0.3)
+        if system:
+            body["system"] = system
+        return body
+
+    async def _stream(self, body: Dict[str, Any], *, timeout: float) -> AsyncIterator[Dict[str, Any]]:
+        usage: Dict[str, Any] = {}
+        async with http_pool.stream(
+            "POST",
+            self.messages_endpoint,
+            timeout=timeout,
+            headers=self._headers(),
+            json={**body, "stream": True},
+        ) as response:
+            await raise_for_stream_status(response)
+            async for event, data in iter_sse(response):
+                payload = json.loads(data)
+                kind = event or payload.get("type")
+                if kind == "message_start":
+                    usage.update((payload.get("message") or {}).get("usage") or {})
+                elif kind == "content_block_delta":
+                    text = (payload.get("delta") or {}).get("text")
+                    if text:
+                        yield {"type": "delta", "text": text}
+                elif kind == "message_delta":
+                    usage.update(payload.get("usage") or {})
+                elif kind == "error":
+                    raise RuntimeError((payload.get("error") or {}).get("message", "stream error"))
+        yield {"type": "usage", "usage": usage}
 
     async def generate_code(self, prompt: str, **kwargs: Any) -> Dict[str, Any]:
         await self.ensure_credentials()
-        system_prompt = kwargs.get("system_prompt", DEFAULT_CODE_SYSTEM_PROMPT)
-        temperature = kwargs.get("temperature", 0.1)
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                ANTHROPIC_ENDPOINT,
-                headers={
-                    "x-api-key": self.api_key,
-                    "anthropic-version": "2023-06-01",
-                    "content-type": "application/json",
-                },
-                json={
-                    "model": kwargs.get("model", self.model),
-                    "max_tokens": kwargs.get("max_tokens", 2048),
-                    "temperature": temperature,
-                    "system": system_prompt,
-                    "messages": [
-                        {"role": "user", "content": prompt},
-                    ],
-                },
-            )
-            response.raise_for_status()
-            payload = response.json()
+        response = await http_pool.post(
+            self.messages_endpoint,
+            timeout=30.0,
+            headers=self._headers(),
+            json=self._body([{"role": "user", "content": prompt}], kwargs, temperature=0.1),
+        )
+        response.raise_for_status()
+        payload = response.json()
 
         content = "".join(item.get("text", "") for item in payload["content"])
         return {"raw": payload, "code": content, "usage": payload.get("usage", {})}
 
+    async def stream_generate_code(self, prompt: str, **kwargs: Any) -> AsyncIterator[Dict[str, Any]]:
+        await self.ensure_credentials()
+        body = self._body([{"role": "user", "content": prompt}], kwargs, temperature=0.1)
+        async for event in self._stream(body, timeout=30.0):
+            yield event
+
     async def chat(self, messages: list[Dict[str, str]], **kwargs: Any) -> Dict[str, Any]:
         await self.ensure_credentials()
-        system_prompt = kwargs.get("system_prompt", DEFAULT_CODE_SYSTEM_PROMPT)
-        temperature = kwargs.get("temperature", 0.3)
-        async with httpx.AsyncClient(timeout=40.0) as client:
-            response = await client.post(
-                ANTHROPIC_ENDPOINT,
-                headers={
-                    "x-api-key": self.api_key,
-                    "anthropic-version": "2023-06-01",
-                    "content-type": "application/json",
-                },
-                json={
-                    "model": kwargs.get("model", self.model),
-                    "max_tokens": kwargs.get("max_tokens", 2048),
-                    "temperature": temperature,
-                    "system": system_prompt,
-                    "messages": messages,
-                },
-            )
-            response.raise_for_status()
-            payload = response.json()
+        response = await http_pool.post(
+            self.messages_endpoint,
+            timeout=40.0,
+            headers=self._headers(),
+            json=self._chat_body(messages, kwargs),
+        )
+        response.raise_for_status()
+        payload = response.json()
 
         content = "".join(item.get("text", "") for item in payload["content"])
         return {
@@ -75,5 +159,12 @@ class AnthropicAdapter(LLMAdapter):
             "usage": payload.get("usage", {}),
         }
 
+    async def stream_chat(
+        self, messages: list[Dict[str, str]], **kwargs: Any
+    ) -> AsyncIterator[Dict[str, Any]]:
+        await self.ensure_credentials()
+        async for event in self._stream(self._chat_body(messages, kwargs), timeout=40.0):
+            yield event
+
     async def list_models(self) -> list[str]:
         return self.default_models
@@ -1,5 +1,6 @@
 import abc
-from typing import Any, Dict, Optional
+import asyncio
+from typing import Any, AsyncIterator, Dict, Optional
 
 DEFAULT_CODE_SYSTEM_PROMPT = (
     "You are a senior data scientist. Always respond with a compact JSON object containing "
@@ -35,6 +36,7 @@ class LLMAdapter(abc.ABC):
     """Base class for LLM provider adapters."""
 
     name: str
+    supports_n = False
 
     def __init__(self, *, api_key: Optional[str], default_models: Optional[list[str]] = None):
         self.api_key = api_key
@@ -44,6 +46,14 @@ class LLMAdapter(abc.ABC):
     async def generate_code(self, prompt: str, **kwargs: Any) -> Dict[str, Any]:
         """Generate code from the provided prompt."""
 
+    async def generate_candidates(self, prompt: str, n: int, **kwargs: Any) -> list[Dict[str, Any]]:
+        """Return ``n`` independent completions of ``prompt``.
+
+        Providers that accept an ``n`` parameter set ``supports_n`` and answer in one
+        request; the default makes ``n`` concurrent ``generate_code`` calls.
+        """
+        return list(await asyncio.gather(*(self.generate_code(prompt, **kwargs) for _ in range(n))))
+
     async def chat(self, messages: list[Dict[str, str]], **kwargs: Any) -> Dict[str, Any]:
         """Exchange conversational messages with the LLM.
 
@@ -52,6 +62,27 @@ class LLMAdapter(abc.ABC):
 
         raise NotImplementedError(f"{self.name} adapter does not support chat yet.")
 
+    async def stream_generate_code(self, prompt: str, **kwargs: Any) -> AsyncIterator[Dict[str, Any]]:
+        """Stream code generation as ``{"type": "delta", "text": ...}`` events.
+
+        A final ``{"type": "usage", "usage": {...}}`` event may follow. Adapters without
+        native streaming fall back to a single delta carrying the whole completion.
+        """
+        result = await self.generate_code(prompt, **kwargs)
+        if result.get("code"):
+            yield {"type": "delta", "text": result["code"]}
+        yield {"type": "usage", "usage": result.get("usage") or {}}
+
+    async def stream_chat(
+        self, messages: list[Dict[str, str]], **kwargs: Any
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a chat reply using the same event shape as ``stream_generate_code``."""
+        result = await self.chat(messages, **kwargs)
+        content = (result.get("message") or {}).get("content") or ""
+        if content:
+            yield {"type": "delta", "text": content}
+        yield {"type": "usage", "usage": result.get("usage") or {}}
+
     async def ensure_credentials(self) -> None:
         if not self.api_key:
             raise RuntimeError(f"{self.name} API key is not configured.")
@@ -0,0 +1,124 @@
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .http_client import http_pool
+
+# Batch states after which the provider will not touch the job again.
+TERMINAL_BATCH_STATES = frozenset({"completed", "failed", "expired", "cancelled"})
+
+
+class OpenAIBatchMixin:
+    """OpenAI-style batch API: upload a JSONL file to ``/files``, then create a ``/batches`` job.
+
+    Providers bill these at a discount in exchange for a completion window of up to a
+    day. Adapters mixing this in set ``batch_api_base`` (the URL ending in ``/v1``) and
+    implement ``batch_request_body``; callers check ``supports_batch`` first.
+    """
+
+    supports_batch = True
+    batch_api_base: str
+    batch_completion_window = "24h"
+
+    def batch_request_body(self, prompt: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Chat-completions body for one generate request, as sent by ``generate_code``."""
+        raise NotImplementedError
+
+    def _auth_headers(self) -> Dict[str, str]:
+        headers = self._headers()  # type: ignore[attr-defined]
+        return {key: value for key, value in headers.items() if key.lower() != "content-type"}
+
+    async def submit_batch(self, requests: Sequence[Tuple[str, str, Dict[str, Any]]]) -> str:
+        """Submit ``(custom_id, prompt, kwargs)`` generate requests and return the batch id."""
+        await self.ensure_credentials()  # type: ignore[attr-defined]
+        lines = [
+            json.dumps(
+                {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": self.batch_request_body(prompt, kwargs),
+                },
+                ensure_ascii=False,
+            )
+            for custom_id, prompt, kwargs in requests
+        ]
+        upload = await http_pool.post(
+            f"{self.batch_api_base}/files",
+            timeout=120.0,
+            headers=self._auth_headers(),
+            data={"purpose": "batch"},
+            files={"file": ("batch.jsonl", "\n".join(lines).encode("utf-8"), "application/jsonl")},
+        )
+        upload.raise_for_status()
+        response = await http_pool.post(
+            f"{self.batch_api_base}/batches",
+            timeout=30.0,
+            headers=self._headers(),  # type: ignore[attr-defined]
+            json={
+                "input_file_id": upload.json()["id"],
+                "endpoint": "/v1/chat/completions",
+                "completion_window": self.batch_completion_window,
+            },
+        )
+        response.raise_for_status()
+        return response.json()["id"]
+
+    async def get_batch(self, batch_id: str) -> Dict[str, Any]:
+        response = await http_pool.get(
+            f"{self.batch_api_base}/batches/{batch_id}",
+            timeout=30.0,
+            headers=self._headers(),  # type: ignore[attr-defined]
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def cancel_batch(self, batch_id: str) -> None:
+        response = await http_pool.post(
+            f"{self.batch_api_base}/batches/{batch_id}/cancel",
+            timeout=30.0,
+            headers=self._headers(),  # type: ignore[attr-defined]
+        )
+        response.raise_for_status()
+
+    async def fetch_batch_results(self, batch: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Read the output and error files of a finished batch.
+
+        Returns one ``{"custom_id", "content", "usage", "error"}`` dict per request that
+        the provider reported on; requests it never reached are simply absent.
+        """
+        results: List[Dict[str, Any]] = []
+        for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+            if not file_id:
+                continue
+            response = await http_pool.get(
+                f"{self.batch_api_base}/files/{file_id}/content",
+                timeout=120.0,
+                headers=self._auth_headers(),
+            )
+            response.raise_for_status()
+            for line in response.text.splitlines():
+                if line.strip():
+                    results.append(_parse_result_line(json.loads(line)))
+        return results
+
+
+def _parse_result_line(record: Dict[str, Any]) -> Dict[str, Any]:
+    response = record.get("response") or {}
+    body = response.get("body") or {}
+    error: Optional[str] = None
+    content: Optional[str] = None
+    if record.get("error"):
+        error = (record["error"] or {}).get("message") or json.dumps(record["error"])
+    elif response.get("status_code") != 200:
+        error = ((body.get("error") or {}).get("message")) or f"HTTP {response.get('status_code')}"
+    else:
+        choices = body.get("choices") or []
+        content = ((choices[0] if choices else {}).get("message") or {}).get("content")
+        if content is None:
+            error = "Empty completion."
+    return {
+        "custom_id": record.get("custom_id"),
+        "content": content,
+        "usage": body.get("usage"),
+        "error": error,
+    }
@@ -1,8 +1,8 @@
-from typing import Any, Dict, Optional
-
-import httpx
+from typing import Any, AsyncIterator, Dict, Optional
 
 from .base import DEFAULT_CODE_SYSTEM_PROMPT, LLMAdapter
+from .http_client import http_pool
+from .streaming import stream_openai_compatible
 
 
 class DeepSeekAdapter(LLMAdapter):
@@ -20,10 +20,18 @@ class DeepSeekAdapter(LLMAdapter):
         self.chat_endpoint = f"{self.base_url}/chat/completions"
         self.models_endpoint = f"{self.base_url}/models"
 
-    async def generate_code(self, prompt: str, **kwargs: Any) -> Dict[str, Any]:
-        await self.ensure_credentials()
-        payload = {
-            "model": kwargs.get("model", self.default_models[0] if self.default_models else "deepseek-chat"),
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+
+    def _default_model(self) -> str:
+        return self.default_models[0] if self.default_models else "deepseek-chat"
+
+    def _generate_payload(self, prompt: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "model": kwargs.get("model") or self._default_model(),
             "messages": kwargs.get("messages")
             or [
                 {
@@ -35,17 +43,28 @@ class DeepSeekAdapter(LLMAdapter):
             "temperature": kwargs.get("temperature", 0.1),
         }
 
-        async with httpx.AsyncClient(timeout=40.0) as client:
-            response = await client.post(
-                self.chat_endpoint,
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json",
-                },
-                json=payload,
-            )
-            response.raise_for_status()
-            data = response.json()
+    def _chat_payload(self, messages: list[Dict[str, str]], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        if not messages or messages[0].get("role") != "system":
+            messages = [
+                {"role": "system", "content": DEFAULT_CODE_SYSTEM_PROMPT},
+                *messages,
+            ]
+        return {
+            "model": kwargs.get("model") or self._default_model(),
+            "messages": messages,
+            "temperature": kwargs.get("temperature", 0.2),
+        }
+
+    async def generate_code(self, prompt: str, **kwargs: Any) -> Dict[str, Any]:
+        await self.ensure_credentials()
+        response = await http_pool.post(
+            self.chat_endpoint,
+            timeout=40.0,
+            headers=self._headers(),
+            json=self._generate_payload(prompt, kwargs),
+        )
+        response.raise_for_status()
+        data = response.json()
 
         message = data["choices"][0]["message"]
         return {
@@ -54,49 +73,62 @@ class DeepSeekAdapter(LLMAdapter):
             "usage": data.get("usage", {}),
         }
 
-    async def chat(self, messages: list[Dict[str, str]], **kwargs: Any) -> Dict[str, Any]:
+    async def stream_generate_code(self, prompt: str, **kwargs: Any) -> AsyncIterator[Dict[str, Any]]:
         await self.ensure_credentials()
-        if not messages or messages[0].get("role") != "system":
-            messages = [
-                {"role": "system", "content": DEFAULT_CODE_SYSTEM_PROMPT},
-                *messages,
-            ]
         payload = {
-            "model": kwargs.get("model", self.default_models[0] if self.default_models else "deepseek-chat"),
-            "messages": messages,
-            "temperature": kwargs.get("temperature", 0.2),
+            **self._generate_payload(prompt, kwargs),
+            "stream": True,
+            "stream_options": {"include_usage": True},
         }
-        async with httpx.AsyncClient(timeout=40.0) as client:
-            response = await client.post(
-                self.chat_endpoint,
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json",
-                },
-                json=payload,
-            )
-            response.raise_for_status()
-            data = response.json()
+        async for event in stream_openai_compatible(
+            self.chat_endpoint, headers=self._headers(), body=payload, timeout=40.0
+        ):
+            yield event
+
+    async def chat(self, messages: list[Dict[str, str]], **kwargs: Any) -> Dict[str, Any]:
+        await self.ensure_credentials()
+        response = await http_pool.post(
+            self.chat_endpoint,
+            timeout=40.0,
+            headers=self._headers(),
+            json=self._chat_payload(messages, kwargs),
+        )
+        response.raise_for_status()
+        data = response.json()
         return {
             "raw": data,
             "message": data["choices"][0]["message"],
             "usage": data.get("usage", {}),
         }
 
+    async def stream_chat(
+        self, messages: list[Dict[str, str]], **kwargs: Any
+    ) -> AsyncIterator[Dict[str, Any]]:
+        await self.ensure_credentials()
+        payload = {
+            **self._chat_payload(messages, kwargs),
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
+        async for event in stream_openai_compatible(
+            self.chat_endpoint, headers=self._headers(), body=payload, timeout=40.0
+        ):
+            yield event
+
     async def list_models(self) -> list[str]:
         try:
             await self.ensure_credentials()
         except RuntimeError:
             return self.default_models
         try:
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                response = await client.get(
-                    self.models_endpoint,
-                    headers={"Authorization": f"Bearer {self.api_key}"},
-                )
-                response.raise_for_status()
-                payload = response.json()
-                models = [item["id"] for item in payload.get("data", []) if item.get("id")]
-                return models or self.default_models
+            response = await http_pool.get(
+                self.models_endpoint,
+                timeout=20.0,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+            )
+            response.raise_for_status()
+            payload = response.json()
+            models = [item["id"] for item in payload.get("data", []) if item.get("id")]
+            return models or self.default_models
         except Exception:
             return self.default_models
@@ -1,17 +1,28 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
+import logging
+from collections import OrderedDict
 from time import monotonic
-from typing import Callable, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from ..config import get_settings
 from ..schemas import ProviderOverride
 from .anthropic_adapter import AnthropicAdapter
 from .base import LLMAdapter
 from .deepseek_adapter import DeepSeekAdapter
+from .mock_adapter import MockAdapter
 from .openai_adapter import OpenAIAdapter
 from .qwen_adapter import QwenAdapter
+from .resilience import ResilientAdapter
 from .siliconflow_adapter import SiliconFlowAdapter
 
+logger = logging.getLogger(__name__)
+
+_MODEL_CACHE_SIZE = 512
+
 
 def _select_models(
     override_models: Optional[list[str]],
@@ -22,6 +33,33 @@ def _select_models(
     return list(models)
 
 
+def override_fingerprint(name: str, override: ProviderOverride) -> str:
+    """Hash of everything that shapes an adapter built from ``override``.
+
+    Keys the adapter cache without keeping raw API keys around as dictionary keys.
+    """
+    material = [
+        name.lower(),
+        override.api_key or "",
+        override.base_url or "",
+        list(override.default_models or []),
+    ]
+    return hashlib.sha256(json.dumps(material).encode("utf-8")).hexdigest()
+
+
+def health_key(name: str, override: Optional[ProviderOverride]) -> str:
+    """Key of the breaker and latency stats for adapters built from ``override``.
+
+    Overrides that keep the server's key and endpoint share the provider's entry; model
+    lists do not matter, only where requests go and whose credentials they carry.
+    """
+    normalized = name.lower()
+    if not override or not (override.api_key or override.base_url):
+        return normalized
+    endpoint = ProviderOverride(api_key=override.api_key, base_url=override.base_url)
+    return f"{normalized}:{override_fingerprint(normalized, endpoint)[:12]}"
+
+
 class AdapterFactory:
     """Factory that instantiates adapters and exposes provider metadata."""
 
@@ -64,6 +102,7 @@ class AdapterFactory:
             "Anthropic",
             lambda override: AnthropicAdapter(
                 api_key=(override.api_key if override and override.api_key else settings.anthropic_api_key),
+                base_url=(override.base_url if override and override.base_url else settings.anthropic_base_url),
                 model=_select_models(
                     override.default_models if override else None,
                     ["claude-3-sonnet-20240229", "claude-3-haiku-20240307"],
@@ -120,17 +159,23 @@ class AdapterFactory:
             ),
         )
 
-        self._model_cache: Dict[str, Tuple[float, List[str]]] = {}
-        self._cache_ttl_seconds = 120.0
+        if settings.mock_llm_enabled:
+            register(
+                "mock",
+                "Mock (load testing)",
+                lambda override: MockAdapter(
+                    default_models=override.default_models if override else None,
+                ),
+            )
 
-    def _get_cached_models(self, name: str) -> List[str] | None:
-        cached = self._model_cache.get(name)
-        if not cached:
-            return None
-        timestamp, models = cached
-        if monotonic() - timestamp < self._cache_ttl_seconds:
-            return models
-        return None
+        # Model lists by credential fingerprint (provider name for server credentials),
+        # with the monotonic time they were fetched. Stale entries are still served while
+        # a background refresh replaces them.
+        self._model_cache: "OrderedDict[str, Tuple[float, List[str]]]" = OrderedDict()
+        self._model_refreshes: Dict[str, asyncio.Task] = {}
+        # Override adapters by credential fingerprint, least recently used first.
+        self._adapter_cache: "OrderedDict[str, LLMAdapter]" = OrderedDict()
+        self._adapter_metrics = {"hits": 0, "misses": 0, "evicted": 0, "invalidated": 0}
 
     def _dedupe(self, models: List[str]) -> List[str]:
         seen: set[str] = set()
@@ -141,35 +186,153 @@ class AdapterFactory:
                 seen.add(item)
         return ordered
 
-    async def _resolve_models(self, name: str, override: Optional[ProviderOverride] = None) -> List[str]:
-        if override is None:
-            cached = self._get_cached_models(name)
-            if cached is not None:
-                return cached
+    @staticmethod
+    def _model_cache_key(name: str, override: Optional[ProviderOverride]) -> str:
+        return override_fingerprint(name, override) if override else name
 
+    async def _fetch_models(self, key: str, name: str, override: Optional[ProviderOverride]) -> List[str]:
         adapter = self.get(name, override=override)
         try:
             models = await adapter.list_models()
         except Exception:
+            logger.warning("Model discovery failed for %s", name, exc_info=True)
             models = adapter.default_models
-
         deduped = self._dedupe(models)
-        if override is None:
-            self._model_cache[name] = (monotonic(), deduped)
+        self._model_cache[key] = (monotonic(), deduped)
+        self._model_cache.move_to_end(key)
+        while len(self._model_cache) > _MODEL_CACHE_SIZE:
+            self._model_cache.popitem(last=False)
         return deduped
 
+    def _refresh_models(self, key: str, name: str, override: Optional[ProviderOverride]) -> asyncio.Task:
+        """Start (or join) the single in-flight discovery call for ``key``."""
+        task = self._model_refreshes.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch_models(key, name, override))
+            self._model_refreshes[key] = task
+            task.add_done_callback(lambda _: self._model_refreshes.pop(key, None))
+        return task
+
+    async def _resolve_models(self, name: str, override: Optional[ProviderOverride] = None) -> List[str]:
+        """Serve cached models, refreshing stale entries in the background.
+
+        A cold entry waits for discovery up to ``llm_models_discovery_timeout_seconds``
+        and otherwise answers with the adapter's default models; the discovery call keeps
+        running and fills the cache for the next request.
+        """
+        settings = get_settings()
+        key = self._model_cache_key(name, override)
+        cached = self._model_cache.get(key)
+        if cached is not None:
+            timestamp, models = cached
+            self._model_cache.move_to_end(key)
+            if monotonic() - timestamp >= settings.llm_models_cache_ttl_seconds:
+                self._refresh_models(key, name, override)
+            return models
+
+        task = self._refresh_models(key, name, override)
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(task), timeout=settings.llm_models_discovery_timeout_seconds
+            )
+        except asyncio.TimeoutError:
+            return self._dedupe(self.get(name, override=override).default_models)
+
     def clear_cache(self) -> None:
         self._model_cache.clear()
 
+    def warm_model_cache(self) -> None:
+        """Kick off discovery for every provider's server-configured credentials."""
+        for name in self._registry:
+            self._refresh_models(self._model_cache_key(name, None), name, None)
+
+    async def cancel_model_refreshes(self) -> None:
+        tasks = list(self._model_refreshes.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _resolve_backup(
+        self, name: str, override: Optional[ProviderOverride]
+    ) -> Optional[Tuple[LLMAdapter, Optional[str]]]:
+        """Backup adapter and model for hedged requests, from ``llm_hedge_backup_providers``.
+
+        A caller on its own credentials is only hedged within the same provider and
+        credentials, so the extra call is never billed to the server's keys.
+        """
+        target = get_settings().llm_hedge_backup_providers.get(name)
+        if not target:
+            return None
+        provider, _, model = target.partition(":")
+        provider = provider.lower()
+        if provider not in self._registry:
+            return None
+        if provider == name:
+            return self.get(provider, override=override), model or None
+        if health_key(name, override) != name:
+            return None
+        return self.get(provider), model or None
+
     def get(self, name: str, override: Optional[ProviderOverride] = None) -> LLMAdapter:
         normalized = name.lower()
         entry = self._registry.get(normalized)
         if not entry:
             raise KeyError(f"Unsupported LLM provider: {name}")
-        if override:
-            factory: Callable[[Optional[ProviderOverride]], LLMAdapter] = entry["factory"]  # type: ignore[assignment]
-            return factory(override)
-        return entry["adapter"]  # type: ignore[return-value]
+        if not override:
+            resilient = entry.get("resilient")
+            if resilient is None:
+                resilient = ResilientAdapter(
+                    entry["adapter"],  # type: ignore[arg-type]
+                    backup_resolver=lambda provider: self._resolve_backup(provider, None),
+                )
+                entry["resilient"] = resilient
+            return resilient  # type: ignore[return-value]
+
+        key = override_fingerprint(normalized, override)
+        cached = self._adapter_cache.get(key)
+        if cached is not None:
+            self._adapter_cache.move_to_end(key)
+            self._adapter_metrics["hits"] += 1
+            return cached
+        self._adapter_metrics["misses"] += 1
+        factory: Callable[[Optional[ProviderOverride]], LLMAdapter] = entry["factory"]  # type: ignore[assignment]
+        adapter = ResilientAdapter(
+            factory(override),
+            health_key=health_key(normalized, override),
+            backup_resolver=lambda provider: self._resolve_backup(provider, override),
+        )
+        limit = get_settings().llm_adapter_cache_size
+        if limit > 0:
+            self._adapter_cache[key] = adapter
+            while len(self._adapter_cache) > limit:
+                self._adapter_cache.popitem(last=False)
+                self._adapter_metrics["evicted"] += 1
+        return adapter
+
+    def invalidate(self, overrides: Dict[str, ProviderOverride]) -> None:
+        """Drop cached adapters using the API keys in ``overrides`` (e.g. credentials being replaced).
+
+        Matching on provider and key also catches adapters built from those credentials
+        merged with request-level base URLs or model lists.
+        """
+        revoked = {
+            (name.lower(), override.api_key)
+            for name, override in overrides.items()
+            if override.api_key
+        }
+        if not revoked:
+            return
+        for key, adapter in list(self._adapter_cache.items()):
+            if (adapter.name, adapter.api_key) in revoked:
+                del self._adapter_cache[key]
+                self._adapter_metrics["invalidated"] += 1
+
+    def adapter_cache_stats(self) -> Dict[str, Any]:
+        return {
+            **self._adapter_metrics,
+            "size": len(self._adapter_cache),
+            "max_size": get_settings().llm_adapter_cache_size,
+        }
 
     def providers(self) -> Dict[str, Dict[str, object]]:
         return self._registry
@@ -187,18 +350,21 @@ class AdapterFactory:
     async def list_all(
         self, overrides: Optional[Dict[str, ProviderOverride]] = None
     ) -> List[Dict[str, object]]:
-        results: List[Dict[str, object]] = []
-        for key, entry in self._registry.items():
-            override = overrides.get(key) if overrides else None
-            models = await self._resolve_models(key, override=override)
-            results.append(
-                {
-                    "id": key,
-                    "name": entry.get("display_name", key.title()),
-                    "models": models,
-                }
+        names = list(self._registry)
+        model_lists = await asyncio.gather(
+            *(
+                self._resolve_models(key, override=overrides.get(key) if overrides else None)
+                for key in names
             )
-        return results
+        )
+        return [
+            {
+                "id": key,
+                "name": self._registry[key].get("display_name", key.title()),
+                "models": models,
+            }
+            for key, models in zip(names, model_lists)
+        ]
 
 
 adapter_factory = AdapterFactory()
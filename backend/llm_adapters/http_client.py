@@ -0,0 +1,163 @@
+import contextlib
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from ..config import get_settings
+
+try:
+    import h2  # noqa: F401
+except ImportError:  # pragma: no cover - HTTP/2 is optional
+    _HTTP2_AVAILABLE = False
+else:
+    _HTTP2_AVAILABLE = True
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class _OriginStats:
+    __slots__ = (
+        "requests",
+        "connections",
+        "tls_handshakes",
+        "connect_ms",
+        "tls_ms",
+        "request_ms",
+        "http_versions",
+    )
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.connections = 0
+        self.tls_handshakes = 0
+        self.connect_ms = 0.0
+        self.tls_ms = 0.0
+        self.request_ms = 0.0
+        self.http_versions: Dict[str, int] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "new_connections": self.connections,
+            "reused_connections": max(self.requests - self.connections, 0),
+            "avg_connect_ms": round(self.connect_ms / self.connections, 2) if self.connections else None,
+            "avg_tls_ms": round(self.tls_ms / self.tls_handshakes, 2) if self.tls_handshakes else None,
+            "avg_request_ms": round(self.request_ms / self.requests, 2) if self.requests else None,
+            "http_versions": dict(self.http_versions),
+        }
+
+
+class _Trace:
+    """httpcore trace hook separating TCP/TLS handshake time from the request itself."""
+
+    def __init__(self, stats: _OriginStats):
+        self.stats = stats
+        self._started: Dict[str, float] = {}
+
+    async def __call__(self, event_name: str, info: Dict[str, Any]) -> None:
+        prefix, _, phase = event_name.rpartition(".")
+        if phase == "started":
+            self._started[prefix] = time.perf_counter()
+            return
+        if phase != "complete" or prefix not in self._started:
+            return
+        elapsed_ms = (time.perf_counter() - self._started.pop(prefix)) * 1000
+        if prefix == "connection.connect_tcp":
+            self.stats.connections += 1
+            self.stats.connect_ms += elapsed_ms
+        elif prefix == "connection.start_tls":
+            self.stats.tls_handshakes += 1
+            self.stats.tls_ms += elapsed_ms
+
+
+class HTTPClientPool:
+    """Long-lived ``httpx.AsyncClient`` per provider origin, shared by every adapter.
+
+    Reusing one client keeps TCP/TLS connections alive across calls (and multiplexes them
+    over HTTP/2 when the server negotiates it) instead of paying a handshake per request.
+    """
+
+    def __init__(self) -> None:
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats: Dict[str, _OriginStats] = {}
+
+    def client_for(self, url: str) -> httpx.AsyncClient:
+        origin = _origin(url)
+        client = self._clients.get(origin)
+        if client is None or client.is_closed:
+            settings = get_settings()
+            client = httpx.AsyncClient(
+                http2=settings.llm_http2 and _HTTP2_AVAILABLE,
+                limits=httpx.Limits(
+                    max_connections=settings.llm_http_max_connections,
+                    max_keepalive_connections=settings.llm_http_max_keepalive_connections,
+                    keepalive_expiry=settings.llm_http_keepalive_expiry_seconds,
+                ),
+                timeout=self.timeout(None),
+            )
+            self._clients[origin] = client
+        return client
+
+    @staticmethod
+    def timeout(read_seconds: Optional[float]) -> httpx.Timeout:
+        settings = get_settings()
+        seconds = settings.llm_http_timeout_seconds or read_seconds or 40.0
+        return httpx.Timeout(seconds, connect=settings.llm_http_connect_timeout_seconds)
+
+    def _prepare(self, url: str, timeout: Optional[float], kwargs: Dict[str, Any]) -> _OriginStats:
+        stats = self._stats.setdefault(_origin(url), _OriginStats())
+        kwargs["timeout"] = self.timeout(timeout)
+        kwargs["extensions"] = {**kwargs.get("extensions", {}), "trace": _Trace(stats)}
+        return stats
+
+    @staticmethod
+    def _record(stats: _OriginStats, response: httpx.Response, started: float) -> None:
+        stats.requests += 1
+        stats.request_ms += (time.perf_counter() - started) * 1000
+        stats.http_versions[response.http_version] = stats.http_versions.get(response.http_version, 0) + 1
+
+    async def request(
+        self, method: str, url: str, *, timeout: Optional[float] = None, **kwargs: Any
+    ) -> httpx.Response:
+        stats = self._prepare(url, timeout, kwargs)
+        started = time.perf_counter()
+        response = await self.client_for(url).request(method, url, **kwargs)
+        self._record(stats, response, started)
+        return response
+
+    async def post(self, url: str, *, timeout: Optional[float] = None, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", url, timeout=timeout, **kwargs)
+
+    async def get(self, url: str, *, timeout: Optional[float] = None, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", url, timeout=timeout, **kwargs)
+
+    @contextlib.asynccontextmanager
+    async def stream(
+        self, method: str, url: str, *, timeout: Optional[float] = None, **kwargs: Any
+    ) -> AsyncIterator[httpx.Response]:
+        """Open a streaming request; request time is measured up to the response headers."""
+        stats = self._prepare(url, timeout, kwargs)
+        started = time.perf_counter()
+        async with self.client_for(url).stream(method, url, **kwargs) as response:
+            self._record(stats, response, started)
+            yield response
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "http2_available": _HTTP2_AVAILABLE,
+            "open_clients": sum(1 for client in self._clients.values() if not client.is_closed),
+            "origins": {origin: stats.to_dict() for origin, stats in self._stats.items()},
+        }
+
+    async def aclose(self) -> None:
+        clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            await client.aclose()
+
+
+http_pool = HTTPClientPool()
@@ -0,0 +1,152 @@
+import asyncio
+import difflib
+import hashlib
+import json
+import random
+import re
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+from ..config import get_settings
+from .base import LLMAdapter
+
+_CHARS_PER_TOKEN = 4
+_SCRIPT_PATTERN = re.compile(r"```python\n(?P<code>.*?)```", re.DOTALL)
+
+
+class MockAdapter(LLMAdapter):
+    """Offline provider for load tests: no network calls, no credentials, no cost.
+
+    Replies are a pure function of the prompt (the same prompt always yields the same
+    code or patch), so everything downstream of the adapter -- parsing, caching,
+    persistence -- behaves the same from run to run. Latency, error rate and reported
+    token counts come from the ``mock_llm_*`` settings; errors are raised as
+    ``httpx.HTTPStatusError`` so retries and circuit breakers see them like real ones.
+    """
+
+    name = "mock"
+
+    def __init__(self, *, default_models: Optional[list[str]] = None):
+        super().__init__(api_key=None, default_models=default_models or ["mock-coder", "mock-chat"])
+        seed = get_settings().mock_llm_seed
+        self._random = random.Random(seed)
+
+    async def ensure_credentials(self) -> None:
+        return None
+
+    def _sample_latency(self) -> float:
+        settings = get_settings()
+        median = max(settings.mock_llm_latency_ms, 0.0) / 1000
+        spread = max(settings.mock_llm_latency_spread, 0.0)
+        distribution = settings.mock_llm_latency_distribution
+        if distribution == "uniform":
+            return max(self._random.uniform(median * (1 - spread), median * (1 + spread)), 0.0)
+        if distribution == "lognormal":
+            return median * self._random.lognormvariate(0.0, spread)
+        return median
+
+    async def _simulate_call(self) -> None:
+        settings = get_settings()
+        await asyncio.sleep(self._sample_latency())
+        if self._random.random() < settings.mock_llm_error_rate:
+            request = httpx.Request("POST", "mock://llm/chat/completions")
+            response = httpx.Response(settings.mock_llm_error_status, request=request)
+            raise httpx.HTTPStatusError(
+                f"Mock provider returned {response.status_code}", request=request, response=response
+            )
+
+    @staticmethod
+    def _digest(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+    @staticmethod
+    def _padding(content_chars: int) -> str:
+        """Comment lines that bring the reply up to ``mock_llm_completion_tokens``."""
+        target = get_settings().mock_llm_completion_tokens * _CHARS_PER_TOKEN
+        missing = target - content_chars
+        if missing <= 0:
+            return ""
+        line = "# " + "x" * 76 + "\n"
+        return line * (missing // len(line) + 1)
+
+    def _code_reply(self, prompt: str) -> str:
+        digest = self._digest(prompt)
+        code = (
+            "import os\n\n"
+            "import pandas as pd\n\n"
+            f"# mock response {digest}\n"
+            "df = pd.read_csv(os.environ['DATASET_PATH']) if os.environ.get('DATASET_PATH') else pd.DataFrame()\n"
+            "print(df.describe(include='all'))\n"
+        )
+        code += self._padding(len(code))
+        return json.dumps({"reasoning": f"Deterministic mock reply {digest}.", "code": code})
+
+    def _chat_reply(self, messages: list[Dict[str, Any]]) -> str:
+        text = "\n".join(str(message.get("content", "")) for message in messages)
+        digest = self._digest(text)
+        scripts = _SCRIPT_PATTERN.findall(text)
+        patch = None
+        if scripts:
+            # Append one line to the current script so clients get a diff they can apply.
+            old = scripts[0].rstrip("\n")
+            new = f"{old}\nprint('mock change {digest}')"
+            patch = "\n".join(
+                difflib.unified_diff(
+                    old.splitlines(),
+                    new.splitlines(),
+                    fromfile="a/analysis.py",
+                    tofile="b/analysis.py",
+                    lineterm="",
+                )
+            )
+        reply = f"Mock reply {digest}."
+        reply += self._padding(len(reply) + len(patch or ""))
+        return json.dumps({"reply": reply, "patch": patch, "reasoning": "Deterministic mock reply."})
+
+    @staticmethod
+    def _usage(prompt_text: str, content: str) -> Dict[str, int]:
+        prompt_tokens = len(prompt_text) // _CHARS_PER_TOKEN
+        completion_tokens = get_settings().mock_llm_completion_tokens or len(content) // _CHARS_PER_TOKEN
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    async def _stream(self, content: str, usage: Dict[str, int]) -> AsyncIterator[Dict[str, Any]]:
+        settings = get_settings()
+        size = max(settings.mock_llm_stream_chunk_chars, 1)
+        await self._simulate_call()
+        for index in range(0, len(content), size):
+            yield {"type": "delta", "text": content[index : index + size]}
+            await asyncio.sleep(settings.mock_llm_stream_chunk_ms / 1000)
+        yield {"type": "usage", "usage": usage}
+
+    async def generate_code(self, prompt: str, **kwargs: Any) -> Dict[str, Any]:
+        await self._simulate_call()
+        content = self._code_reply(prompt)
+        return {"raw": None, "code": content, "usage": self._usage(prompt, content)}
+
+    async def stream_generate_code(self, prompt: str, **kwargs: Any) -> AsyncIterator[Dict[str, Any]]:
+        content = self._code_reply(prompt)
+        async for event in self._stream(content, self._usage(prompt, content)):
+            yield event
+
+    async def chat(self, messages: list[Dict[str, str]], **kwargs: Any) -> Dict[str, Any]:
+        await self._simulate_call()
+        content = self._chat_reply(messages)
+        prompt_text = "".join(str(message.get("content", "")) for message in messages)
+        return {
+            "raw": None,
+            "message": {"role": "assistant", "content": content},
+            "usage": self._usage(prompt_text, content),
+        }
+
+    async def stream_chat(
+        self, messages: list[Dict[str, str]], **kwargs: Any
+    ) -> AsyncIterator[Dict[str, Any]]:
+        content = self._chat_reply(messages)
+        prompt_text = "".join(str(message.get("content", "")) for message in messages)
+        async for event in self._stream(content, self._usage(prompt_text, content)):
+            yield event
@@ -1,4 +1,4 @@
-from typing import Any, Dict, Optional
+from typing import Any, AsyncIterator, Dict, Optional
 
 import httpx
 
@@ -7,14 +7,19 @@ from .base import (
     DEFAULT_CODE_SYSTEM_PROMPT,
     LLMAdapter,
 )
+from .batch import OpenAIBatchMixin
+from .http_client import http_pool
+from .streaming import stream_openai_compatible
 
 
 OPENAI_ENDPOINT = "https://api.openai.com/v1/chat/completions"
 OPENAI_MODELS_ENDPOINT = "https://api.openai.com/v1/models"
 
 
-class OpenAIAdapter(LLMAdapter):
+class OpenAIAdapter(OpenAIBatchMixin, LLMAdapter):
     name = "openai"
+    batch_api_base = "https://api.openai.com/v1"
+    supports_n = True
 
     def __init__(
         self,
@@ -26,8 +31,13 @@ class OpenAIAdapter(LLMAdapter):
         super().__init__(api_key=api_key, default_models=default_models)
         self.model = model
 
-    async def generate_code(self, prompt: str, **kwargs: Any) -> Dict[str, Any]:
-        await self.ensure_credentials()
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+
+    def _generate_body(self, prompt: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
         messages = kwargs.get("messages") or [
             {
                 "role": "system",
@@ -35,7 +45,6 @@ class OpenAIAdapter(LLMAdapter):
             },
             {"role": "user", "content": prompt},
         ]
-        temperature = kwargs.get("temperature", 0.1)
         response_format = kwargs.get("response_format") or {
             "type": "json_schema",
             "json_schema": {
@@ -43,42 +52,62 @@ class OpenAIAdapter(LLMAdapter):
                 "schema": DEFAULT_CODE_RESPONSE_SCHEMA,
             },
         }
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            request_body = {
-                "model": kwargs.get("model", self.model),
-                "messages": messages,
-                "temperature": temperature,
-                "response_format": response_format,
-            }
-            response = await client.post(
-                OPENAI_ENDPOINT,
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json",
-                },
-                json=request_body,
-            )
-            try:
+        return {
+            "model": kwargs.get("model") or self.model,
+            "messages": messages,
+            "temperature": kwargs.get("temperature", 0.1),
+            "response_format": response_format,
+        }
+
+    def batch_request_body(self, prompt: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        return self._generate_body(prompt, kwargs)
+
+    def _chat_body(self, messages: list[Dict[str, str]], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        body: Dict[str, Any] = {
+            "model": kwargs.get("model") or self.model,
+            "messages": messages,
+            "temperature": kwargs.get("temperature", 0.3),
+        }
+        if "response_format" in kwargs:
+            body["response_format"] = kwargs["response_format"]
+        if kwargs.get("prompt_cache_key"):
+            # Routes requests sharing a prefix to the same cache shard.
+            body["prompt_cache_key"] = kwargs["prompt_cache_key"]
+        return body
+
+    @staticmethod
+    def _should_downgrade_schema(exc: httpx.HTTPStatusError, request_body: Dict[str, Any]) -> bool:
+        return (
+            exc.response.status_code == 400
+            and request_body["response_format"].get("type") == "json_schema"
+        )
+
+    async def _post_generate(self, request_body: Dict[str, Any]) -> Dict[str, Any]:
+        await self.ensure_credentials()
+        response = await http_pool.post(
+            OPENAI_ENDPOINT,
+            timeout=30.0,
+            headers=self._headers(),
+            json=request_body,
+        )
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError as exc:
+            if self._should_downgrade_schema(exc, request_body):
+                request_body["response_format"] = {"type": "json_object"}
+                response = await http_pool.post(
+                    OPENAI_ENDPOINT,
+                    timeout=30.0,
+                    headers=self._headers(),
+                    json=request_body,
+                )
                 response.raise_for_status()
-            except httpx.HTTPStatusError as exc:
-                if (
-                    exc.response.status_code == 400
-                    and response_format.get("type") == "json_schema"
-                ):
-                    request_body["response_format"] = {"type": "json_object"}
-                    response = await client.post(
-                        OPENAI_ENDPOINT,
-                        headers={
-                            "Authorization": f"Bearer {self.api_key}",
-                            "Content-Type": "application/json",
-                        },
-                        json=request_body,
-                    )
-                    response.raise_for_status()
-                else:
-                    raise
-            payload = response.json()
+            else:
+                raise
+        return response.json()
 
+    async def generate_code(self, prompt: str, **kwargs: Any) -> Dict[str, Any]:
+        payload = await self._post_generate(self._generate_body(prompt, kwargs))
         content = payload["choices"][0]["message"]["content"]
         return {
             "raw": payload,
@@ -86,50 +115,90 @@ class OpenAIAdapter(LLMAdapter):
             "usage": payload.get("usage", {}),
         }
 
-    async def chat(self, messages: list[Dict[str, str]], **kwargs: Any) -> Dict[str, Any]:
+    async def generate_candidates(self, prompt: str, n: int, **kwargs: Any) -> list[Dict[str, Any]]:
+        """One request with ``n`` choices; the prompt is billed once.
+
+        The shared usage is reported on the first candidate only so that summing usage
+        over the candidates gives the request's real cost.
+        """
+        payload = await self._post_generate({**self._generate_body(prompt, kwargs), "n": n})
+        choices = sorted(payload["choices"], key=lambda choice: choice.get("index", 0))
+        return [
+            {
+                "raw": payload if position == 0 else None,
+                "code": choice["message"]["content"],
+                "usage": payload.get("usage", {}) if position == 0 else {},
+            }
+            for position, choice in enumerate(choices)
+        ]
+
+    async def stream_generate_code(self, prompt: str, **kwargs: Any) -> AsyncIterator[Dict[str, Any]]:
         await self.ensure_credentials()
-        temperature = kwargs.get("temperature", 0.3)
-        body: Dict[str, Any] = {
-            "model": kwargs.get("model", self.model),
-            "messages": messages,
-            "temperature": temperature,
+        request_body = {
+            **self._generate_body(prompt, kwargs),
+            "stream": True,
+            "stream_options": {"include_usage": True},
         }
-        if "response_format" in kwargs:
-            body["response_format"] = kwargs["response_format"]
+        try:
+            async for event in stream_openai_compatible(
+                OPENAI_ENDPOINT, headers=self._headers(), body=request_body, timeout=30.0
+            ):
+                yield event
+        except httpx.HTTPStatusError as exc:
+            if not self._should_downgrade_schema(exc, request_body):
+                raise
+            request_body["response_format"] = {"type": "json_object"}
+            async for event in stream_openai_compatible(
+                OPENAI_ENDPOINT, headers=self._headers(), body=request_body, timeout=30.0
+            ):
+                yield event
 
-        async with httpx.AsyncClient(timeout=40.0) as client:
-            response = await client.post(
-                OPENAI_ENDPOINT,
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json",
-                },
-                json=body,
-            )
-            response.raise_for_status()
-            payload = response.json()
+    async def chat(self, messages: list[Dict[str, str]], **kwargs: Any) -> Dict[str, Any]:
+        await self.ensure_credentials()
+        response = await http_pool.post(
+            OPENAI_ENDPOINT,
+            timeout=40.0,
+            headers=self._headers(),
+            json=self._chat_body(messages, kwargs),
+        )
+        response.raise_for_status()
+        payload = response.json()
 
         message = payload["choices"][0]["message"]
         return {"raw": payload, "message": message, "usage": payload.get("usage", {})}
 
+    async def stream_chat(
+        self, messages: list[Dict[str, str]], **kwargs: Any
+    ) -> AsyncIterator[Dict[str, Any]]:
+        await self.ensure_credentials()
+        body = {
+            **self._chat_body(messages, kwargs),
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
+        async for event in stream_openai_compatible(
+            OPENAI_ENDPOINT, headers=self._headers(), body=body, timeout=40.0
+        ):
+            yield event
+
     async def list_models(self) -> list[str]:
         try:
             await self.ensure_credentials()
         except RuntimeError:
             return self.default_models
         try:
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                response = await client.get(
-                    OPENAI_MODELS_ENDPOINT,
-                    headers={"Authorization": f"Bearer {self.api_key}"},
-                )
-                response.raise_for_status()
-                data = response.json()
-                models = [
-                    item["id"]
-                    for item in data.get("data", [])
-                    if isinstance(item, dict) and item.get("id")
-                ]
-                return models or self.default_models
+            response = await http_pool.get(
+                OPENAI_MODELS_ENDPOINT,
+                timeout=20.0,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+            )
+            response.raise_for_status()
+            data = response.json()
+            models = [
+                item["id"]
+                for item in data.get("data", [])
+                if isinstance(item, dict) and item.get("id")
+            ]
+            return models or self.default_models
         except Exception:
             return self.default_models
@@ -1,8 +1,9 @@
-from typing import Any, Dict, Optional
-
-import httpx
+import json
+from typing import Any, AsyncIterator, Dict, Optional
 
 from .base import DEFAULT_CODE_SYSTEM_PROMPT, LLMAdapter
+from .http_client import http_pool
+from .streaming import iter_sse, raise_for_stream_status
 
 
 class QwenAdapter(LLMAdapter):
@@ -21,9 +22,60 @@ class QwenAdapter(LLMAdapter):
         self.chat_endpoint_url = f"{self.base_url}/api/v1/services/aigc/text-generation/generation"
         self.models_endpoint = f"{self.base_url}/api/v1/models"
 
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+
+    def _default_model(self) -> str:
+        return self.default_models[0] if self.default_models else "qwen-plus"
+
+    def _chat_messages(self, messages: list[Dict[str, str]]) -> list[Dict[str, str]]:
+        if not messages or messages[0].get("role") != "system":
+            messages = [
+                {"role": "system", "content": DEFAULT_CODE_SYSTEM_PROMPT},
+                *messages,
+            ]
+        return messages
+
+    async def _stream(
+        self, url: str, model: str, messages: list[Dict[str, str]]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        # DashScope streams over SSE when asked via header; incremental_output makes each
+        # event carry only the new text instead of the full completion so far.
+        payload = {
+            "model": model,
+            "input": {"messages": messages},
+            "parameters": {"result_format": "message", "incremental_output": True},
+        }
+        usage: Dict[str, Any] = {}
+        async with http_pool.stream(
+            "POST",
+            url,
+            timeout=40.0,
+            headers={**self._headers(), "X-DashScope-SSE": "enable"},
+            json=payload,
+        ) as response:
+            await raise_for_stream_status(response)
+            async for _, data in iter_sse(response):
+                chunk = json.loads(data)
+                if chunk.get("code") and not chunk.get("output"):
+                    raise RuntimeError(chunk.get("message") or chunk["code"])
+                output = chunk.get("output") or {}
+                choices = output.get("choices") or []
+                if choices:
+                    text = choices[0].get("message", {}).get("content", "")
+                else:
+                    text = output.get("text", "")
+                if text:
+                    yield {"type": "delta", "text": text}
+                usage = chunk.get("usage") or usage
+        yield {"type": "usage", "usage": usage}
+
     async def generate_code(self, prompt: str, **kwargs: Any) -> Dict[str, Any]:
         await self.ensure_credentials()
-        model = kwargs.get("model", self.default_models[0] if self.default_models else "qwen-plus")
+        model = kwargs.get("model") or self._default_model()
         payload = {
             "model": model,
             "input": {
@@ -34,17 +86,14 @@ class QwenAdapter(LLMAdapter):
             },
             "parameters": {"result_format": "json"},
         }
-        async with httpx.AsyncClient(timeout=40.0) as client:
-            response = await client.post(
-                self.text_endpoint,
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json",
-                },
-                json=payload,
-            )
-            response.raise_for_status()
-            data = response.json()
+        response = await http_pool.post(
+            self.text_endpoint,
+            timeout=40.0,
+            headers=self._headers(),
+            json=payload,
+        )
+        response.raise_for_status()
+        data = response.json()
         output = data.get("output") or {}
         choices = output.get("choices") or []
         text = ""
@@ -52,50 +101,59 @@ class QwenAdapter(LLMAdapter):
             text = choices[0].get("message", {}).get("content", "") or choices[0].get("text", "")
         return {"raw": data, "code": text, "usage": data.get("usage", {})}
 
+    async def stream_generate_code(self, prompt: str, **kwargs: Any) -> AsyncIterator[Dict[str, Any]]:
+        await self.ensure_credentials()
+        messages = [
+            {"role": "system", "content": DEFAULT_CODE_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ]
+        model = kwargs.get("model") or self._default_model()
+        async for event in self._stream(self.text_endpoint, model, messages):
+            yield event
+
     async def chat(self, messages: list[Dict[str, str]], **kwargs: Any) -> Dict[str, Any]:
         await self.ensure_credentials()
-        model = kwargs.get("model", self.default_models[0] if self.default_models else "qwen-plus")
-        if not messages or messages[0].get("role") != "system":
-            messages = [
-                {"role": "system", "content": DEFAULT_CODE_SYSTEM_PROMPT},
-                *messages,
-            ]
         payload = {
-            "model": model,
-            "input": {"messages": messages},
+            "model": kwargs.get("model") or self._default_model(),
+            "input": {"messages": self._chat_messages(messages)},
             "parameters": {"result_format": "json"},
         }
-        async with httpx.AsyncClient(timeout=40.0) as client:
-            response = await client.post(
-                self.chat_endpoint_url,
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json",
-                },
-                json=payload,
-            )
-            response.raise_for_status()
-            data = response.json()
+        response = await http_pool.post(
+            self.chat_endpoint_url,
+            timeout=40.0,
+            headers=self._headers(),
+            json=payload,
+        )
+        response.raise_for_status()
+        data = response.json()
         output = data.get("output") or {}
         choices = output.get("choices") or []
         message = choices[0].get("message", {}) if choices else {"role": "assistant", "content": ""}
         return {"raw": data, "message": message, "usage": data.get("usage", {})}
 
+    async def stream_chat(
+        self, messages: list[Dict[str, str]], **kwargs: Any
+    ) -> AsyncIterator[Dict[str, Any]]:
+        await self.ensure_credentials()
+        model = kwargs.get("model") or self._default_model()
+        async for event in self._stream(self.chat_endpoint_url, model, self._chat_messages(messages)):
+            yield event
+
     async def list_models(self) -> list[str]:
         try:
             await self.ensure_credentials()
         except RuntimeError:
             return self.default_models
         try:
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                response = await client.get(
-                    self.models_endpoint,
-                    headers={"Authorization": f"Bearer {self.api_key}"},
-                )
-                response.raise_for_status()
-                payload = response.json()
-                data = payload.get("data") or payload.get("models") or []
-                models = [item.get("model") or item.get("id") for item in data if isinstance(item, dict)]
-                return [m for m in models if m] or self.default_models
+            response = await http_pool.get(
+                self.models_endpoint,
+                timeout=20.0,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+            )
+            response.raise_for_status()
+            payload = response.json()
+            data = payload.get("data") or payload.get("models") or []
+            models = [item.get("model") or item.get("id") for item in data if isinstance(item, dict)]
+            return [m for m in models if m] or self.default_models
         except Exception:
             return self.default_models
@@ -0,0 +1,359 @@
+import asyncio
+import contextlib
+import logging
+import random
+import time
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional, Tuple
+
+import httpx
+
+from ..config import get_settings
+from .base import LLMAdapter
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = frozenset({408, 425, 429, 500, 502, 503, 504, 529})
+_LATENCY_WINDOW = 200
+# Health entries kept, least recently used evicted first; one per provider plus one per
+# distinct credential/endpoint override in use.
+_HEALTH_ENTRIES = 1024
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling the provider while its circuit breaker is open."""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(exc, httpx.TransportError)
+
+
+def _retry_after_seconds(exc: BaseException) -> Optional[float]:
+    if not isinstance(exc, httpx.HTTPStatusError):
+        return None
+    value = exc.response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt: int, exc: Optional[BaseException] = None) -> float:
+    """Full-jitter exponential backoff, honouring ``Retry-After`` up to the delay cap."""
+    settings = get_settings()
+    cap = settings.llm_retry_max_delay_seconds
+    retry_after = _retry_after_seconds(exc) if exc is not None else None
+    if retry_after is not None:
+        return min(retry_after, cap)
+    return random.uniform(0, min(cap, settings.llm_retry_base_delay_seconds * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open (one trial call) -> closed."""
+
+    def __init__(self) -> None:
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._trial_in_flight = False
+
+    def before_call(self, provider: str) -> bool:
+        """Admit a call or raise ``CircuitOpenError``; ``True`` when it is the half-open trial."""
+        if self.state == "closed":
+            return False
+        reset_seconds = get_settings().llm_circuit_reset_seconds
+        if self.state == "open" and time.monotonic() - self.opened_at >= reset_seconds:
+            self.state = "half_open"
+            self._trial_in_flight = False
+        if self.state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        raise CircuitOpenError(
+            f"{provider} is temporarily unavailable after repeated failures; retry shortly."
+        )
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        threshold = get_settings().llm_circuit_failure_threshold
+        if self.state == "half_open" or (threshold > 0 and self.consecutive_failures >= threshold):
+            if self.state != "open":
+                self.trips += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def record_rejected(self, trial: bool) -> None:
+        """A call refused for a client-side reason (bad key, bad request) says nothing about
+        the provider: the breaker keeps its state and only a trial stops being in flight."""
+        if trial:
+            self._trial_in_flight = False
+
+    def record_abandoned(self, trial: bool) -> None:
+        """A call that was cancelled or closed early proves nothing about the provider, but
+        a trial must not stay in flight forever: it counts as failed and the breaker reopens."""
+        if trial and self.state == "half_open":
+            self.record_failure()
+
+
+class _ProviderHealth:
+    def __init__(self) -> None:
+        self.breaker = CircuitBreaker()
+        self.latencies: Deque[float] = deque(maxlen=_LATENCY_WINDOW)
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.hedges_fired = 0
+        self.hedges_won = 0
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < max(get_settings().llm_hedge_min_samples, 1):
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def to_dict(self) -> Dict[str, Any]:
+        p95 = self.p95()
+        return {
+            "circuit": self.breaker.state,
+            "circuit_trips": self.breaker.trips,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retries,
+            "hedges_fired": self.hedges_fired,
+            "hedges_won": self.hedges_won,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+
+_health: "OrderedDict[str, _ProviderHealth]" = OrderedDict()
+
+
+def provider_health(key: str) -> _ProviderHealth:
+    """Health of the provider endpoint ``key``: the provider name for server credentials,
+    or a fingerprint of the override's credentials and endpoint."""
+    health = _health.get(key)
+    if health is None:
+        health = _health[key] = _ProviderHealth()
+        while len(_health) > _HEALTH_ENTRIES:
+            _health.popitem(last=False)
+    else:
+        _health.move_to_end(key)
+    return health
+
+
+def stats() -> Dict[str, Any]:
+    return {provider: health.to_dict() for provider, health in _health.items()}
+
+
+def _with_hedged_call(result: Any, provider: str, kwargs: Dict[str, Any]) -> Any:
+    """Note the discarded call of a hedged request in the winner's usage, so the ledger
+    counts it; its tokens are never reported."""
+    hedged_call = {"provider": provider, "model": kwargs.get("model")}
+    if isinstance(result, list):
+        return [_with_hedged_call(result[0], provider, kwargs), *result[1:]] if result else result
+    if not isinstance(result, dict):
+        return result
+    return {**result, "usage": {**(result.get("usage") or {}), "hedged_call": hedged_call}}
+
+
+BackupResolver = Callable[[str], Optional[Tuple[LLMAdapter, Optional[str]]]]
+
+
+class ResilientAdapter(LLMAdapter):
+    """Wraps a provider adapter with retries, a circuit breaker and optional hedging.
+
+    Everything except the generation/chat entry points is delegated to the wrapped
+    adapter, so callers can keep treating it as the concrete provider adapter.
+    """
+
+    def __init__(
+        self,
+        inner: LLMAdapter,
+        *,
+        health_key: Optional[str] = None,
+        backup_resolver: Optional[BackupResolver] = None,
+    ):
+        # LLMAdapter.__init__ is skipped on purpose: attributes such as api_key and
+        # default_models must resolve on the wrapped adapter through __getattr__.
+        self.inner = inner
+        self.name = inner.name
+        # Breaker and latency are tracked per credentials and endpoint, so one user's
+        # broken key or base URL cannot open the circuit for everybody else.
+        self.health_key = health_key or inner.name
+        self._backup_resolver = backup_resolver
+
+    def __getattr__(self, item: str) -> Any:
+        return getattr(self.inner, item)
+
+    @property
+    def supports_n(self) -> bool:  # type: ignore[override]
+        return self.inner.supports_n
+
+    @property
+    def health(self) -> _ProviderHealth:
+        return provider_health(self.health_key)
+
+    async def _timed(self, method: str, args: tuple, kwargs: Dict[str, Any]) -> Any:
+        started = time.monotonic()
+        result = await getattr(self.inner, method)(*args, **kwargs)
+        self.health.latencies.append(time.monotonic() - started)
+        return result
+
+    def _hedge_target(
+        self, kwargs: Dict[str, Any]
+    ) -> Tuple[Optional["ResilientAdapter"], Dict[str, Any]]:
+        """The backup to hedge with (``None`` for this adapter itself) and its call kwargs."""
+        if self._backup_resolver is not None:
+            backup = self._backup_resolver(self.name)
+            if backup is not None:
+                adapter, model = backup
+                hedge_kwargs = {**kwargs, "model": model}
+                if adapter is self:
+                    return None, hedge_kwargs
+                if isinstance(adapter, ResilientAdapter) and adapter.health.breaker.state != "open":
+                    return adapter, hedge_kwargs
+        return None, kwargs
+
+    async def _call_once(
+        self, method: str, args: tuple, kwargs: Dict[str, Any], *, hedge: bool
+    ) -> Any:
+        settings = get_settings()
+        threshold = self.health.p95() if hedge and settings.llm_hedge_enabled else None
+        if threshold is None:
+            return await self._timed(method, args, kwargs)
+
+        primary = asyncio.create_task(self._timed(method, args, kwargs))
+        done, _ = await asyncio.wait({primary}, timeout=threshold)
+        if done:
+            return primary.result()
+
+        backup, hedge_kwargs = self._hedge_target(kwargs)
+        self.health.hedges_fired += 1
+        # A backup provider goes through its own retries and breaker, not hedged again.
+        hedge_task = asyncio.create_task(
+            backup._call(method, args, hedge_kwargs, hedge=False)
+            if backup is not None
+            else self._timed(method, args, hedge_kwargs)
+        )
+        pending = {primary, hedge_task}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge_task:
+                            self.health.hedges_won += 1
+                            return _with_hedged_call(task.result(), self.name, kwargs)
+                        hedge_name = backup.name if backup is not None else self.name
+                        return _with_hedged_call(task.result(), hedge_name, hedge_kwargs)
+                    error = error or task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+        assert error is not None
+        raise error
+
+    async def _call(
+        self, method: str, args: tuple, kwargs: Dict[str, Any], *, hedge: bool = True
+    ) -> Any:
+        settings = get_settings()
+        health = self.health
+        attempts = max(settings.llm_retry_max_attempts, 1)
+        for attempt in range(attempts):
+            trial = health.breaker.before_call(self.name)
+            health.calls += 1
+            try:
+                result = await self._call_once(method, args, kwargs, hedge=hedge)
+            except asyncio.CancelledError:
+                health.breaker.record_abandoned(trial)
+                raise
+            except Exception as exc:
+                if not is_retryable(exc):
+                    health.breaker.record_rejected(trial)
+                    raise
+                health.failures += 1
+                health.breaker.record_failure()
+                if attempt + 1 >= attempts or health.breaker.state == "open":
+                    raise
+                delay = backoff_delay(attempt, exc)
+                health.retries += 1
+                logger.warning(
+                    "%s.%s failed (%s); retry %d/%d in %.2fs",
+                    self.name, method, exc, attempt + 1, attempts - 1, delay,
+                )
+                await asyncio.sleep(delay)
+                continue
+            health.breaker.record_success()
+            return result
+        raise RuntimeError("unreachable")  # pragma: no cover
+
+    async def _stream(
+        self, method: str, *args: Any, **kwargs: Any
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Retry a stream only while nothing has been yielded; no hedging mid-stream."""
+        settings = get_settings()
+        health = self.health
+        attempts = max(settings.llm_retry_max_attempts, 1)
+        for attempt in range(attempts):
+            trial = health.breaker.before_call(self.name)
+            health.calls += 1
+            started = False
+            try:
+                async with contextlib.aclosing(getattr(self.inner, method)(*args, **kwargs)) as events:
+                    async for event in events:
+                        started = True
+                        yield event
+            except (asyncio.CancelledError, GeneratorExit):
+                # The consumer went away (client disconnect, early close).
+                health.breaker.record_abandoned(trial)
+                raise
+            except Exception as exc:
+                if not is_retryable(exc):
+                    health.breaker.record_rejected(trial)
+                    raise
+                health.failures += 1
+                health.breaker.record_failure()
+                if started or attempt + 1 >= attempts or health.breaker.state == "open":
+                    raise
+                health.retries += 1
+                await asyncio.sleep(backoff_delay(attempt, exc))
+                continue
+            health.breaker.record_success()
+            return
+
+    async def generate_code(self, prompt: str, **kwargs: Any) -> Dict[str, Any]:
+        return await self._call("generate_code", (prompt,), kwargs)
+
+    async def generate_candidates(self, prompt: str, n: int, **kwargs: Any) -> list[Dict[str, Any]]:
+        return await self._call("generate_candidates", (prompt, n), kwargs)
+
+    async def chat(self, messages: list[Dict[str, str]], **kwargs: Any) -> Dict[str, Any]:
+        return await self._call("chat", (messages,), kwargs)
+
+    async def stream_generate_code(self, prompt: str, **kwargs: Any) -> AsyncIterator[Dict[str, Any]]:
+        async with contextlib.aclosing(self._stream("stream_generate_code", prompt, **kwargs)) as events:
+            async for event in events:
+                yield event
+
+    async def stream_chat(
+        self, messages: list[Dict[str, str]], **kwargs: Any
+    ) -> AsyncIterator[Dict[str, Any]]:
+        async with contextlib.aclosing(self._stream("stream_chat", messages, **kwargs)) as events:
+            async for event in events:
+                yield event
+
+    async def ensure_credentials(self) -> None:
+        await self.inner.ensure_credentials()
+
+    async def list_models(self) -> list[str]:
+        return await self.inner.list_models()
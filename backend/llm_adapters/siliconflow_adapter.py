@@ -1,11 +1,14 @@
-from typing import Any, Dict, Optional
+from typing import Any, AsyncIterator, Dict, Optional
 
 import httpx
 
 from .base import DEFAULT_CODE_SYSTEM_PROMPT, LLMAdapter
+from .batch import OpenAIBatchMixin
+from .http_client import http_pool
+from .streaming import stream_openai_compatible
 
 
-class SiliconFlowAdapter(LLMAdapter):
+class SiliconFlowAdapter(OpenAIBatchMixin, LLMAdapter):
     name = "siliconflow"
 
     def __init__(
@@ -19,11 +22,20 @@ class SiliconFlowAdapter(LLMAdapter):
         self.base_url = base_url.rstrip("/")
         self.chat_endpoint = f"{self.base_url}/v1/chat/completions"
         self.models_endpoint = f"{self.base_url}/v1/models"
+        self.batch_api_base = f"{self.base_url}/v1"
 
-    async def generate_code(self, prompt: str, **kwargs: Any) -> Dict[str, Any]:
-        await self.ensure_credentials()
-        payload = {
-            "model": kwargs.get("model", self.default_models[0] if self.default_models else "siliconflow-chat"),
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+
+    def _default_model(self) -> str:
+        return self.default_models[0] if self.default_models else "siliconflow-chat"
+
+    def _generate_payload(self, prompt: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "model": kwargs.get("model") or self._default_model(),
             "messages": kwargs.get("messages")
             or [
                 {
@@ -34,87 +46,123 @@ class SiliconFlowAdapter(LLMAdapter):
             ],
             "temperature": kwargs.get("temperature", 0.1),
         }
-        async with httpx.AsyncClient(timeout=40.0) as client:
-            response = await client.post(
-                self.chat_endpoint,
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json",
-                },
-                json=payload,
-            )
-            response.raise_for_status()
-            data = response.json()
-        message = data["choices"][0]["message"]
-        return {
-            "raw": data,
-            "code": message.get("content", ""),
-            "usage": data.get("usage", {}),
-        }
 
-    async def chat(self, messages: list[Dict[str, str]], **kwargs: Any) -> Dict[str, Any]:
-        await self.ensure_credentials()
+    def batch_request_body(self, prompt: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        return self._generate_payload(prompt, kwargs)
+
+    def _chat_payload(self, messages: list[Dict[str, str]], kwargs: Dict[str, Any]) -> Dict[str, Any]:
         if not messages or messages[0].get("role") != "system":
             messages = [
                 {"role": "system", "content": DEFAULT_CODE_SYSTEM_PROMPT},
                 *messages,
             ]
         payload: Dict[str, Any] = {
-            "model": kwargs.get("model", self.default_models[0] if self.default_models else "siliconflow-chat"),
+            "model": kwargs.get("model") or self._default_model(),
             "messages": messages,
             "temperature": kwargs.get("temperature", 0.2),
         }
         # If caller requests JSON response (OpenAI-compatible), pass it through.
         if "response_format" in kwargs:
             payload["response_format"] = kwargs["response_format"]
+        return payload
 
-        async with httpx.AsyncClient(timeout=40.0) as client:
-            try:
-                response = await client.post(
+    @staticmethod
+    def _should_drop_response_format(exc: httpx.HTTPStatusError, payload: Dict[str, Any]) -> bool:
+        # Fallback: if server doesn't support response_format, retry without it
+        return (
+            "response_format" in payload
+            and exc.response is not None
+            and exc.response.status_code in {400, 422}
+        )
+
+    async def generate_code(self, prompt: str, **kwargs: Any) -> Dict[str, Any]:
+        await self.ensure_credentials()
+        response = await http_pool.post(
+            self.chat_endpoint,
+            timeout=40.0,
+            headers=self._headers(),
+            json=self._generate_payload(prompt, kwargs),
+        )
+        response.raise_for_status()
+        data = response.json()
+        message = data["choices"][0]["message"]
+        return {
+            "raw": data,
+            "code": message.get("content", ""),
+            "usage": data.get("usage", {}),
+        }
+
+    async def stream_generate_code(self, prompt: str, **kwargs: Any) -> AsyncIterator[Dict[str, Any]]:
+        await self.ensure_credentials()
+        payload = {**self._generate_payload(prompt, kwargs), "stream": True}
+        async for event in stream_openai_compatible(
+            self.chat_endpoint, headers=self._headers(), body=payload, timeout=40.0
+        ):
+            yield event
+
+    async def chat(self, messages: list[Dict[str, str]], **kwargs: Any) -> Dict[str, Any]:
+        await self.ensure_credentials()
+        payload = self._chat_payload(messages, kwargs)
+        try:
+            response = await http_pool.post(
+                self.chat_endpoint,
+                timeout=40.0,
+                headers=self._headers(),
+                json=payload,
+            )
+            response.raise_for_status()
+        except httpx.HTTPStatusError as exc:
+            if self._should_drop_response_format(exc, payload):
+                payload.pop("response_format", None)
+                response = await http_pool.post(
                     self.chat_endpoint,
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json",
-                    },
+                    timeout=40.0,
+                    headers=self._headers(),
                     json=payload,
                 )
                 response.raise_for_status()
-            except httpx.HTTPStatusError as exc:
-                # Fallback: if server doesn't support response_format, retry without it
-                if "response_format" in payload and exc.response is not None and exc.response.status_code in {400, 422}:
-                    payload.pop("response_format", None)
-                    response = await client.post(
-                        self.chat_endpoint,
-                        headers={
-                            "Authorization": f"Bearer {self.api_key}",
-                            "Content-Type": "application/json",
-                        },
-                        json=payload,
-                    )
-                    response.raise_for_status()
-                else:
-                    raise
-            data = response.json()
+            else:
+                raise
+        data = response.json()
         return {
             "raw": data,
             "message": data["choices"][0]["message"],
             "usage": data.get("usage", {}),
         }
 
+    async def stream_chat(
+        self, messages: list[Dict[str, str]], **kwargs: Any
+    ) -> AsyncIterator[Dict[str, Any]]:
+        await self.ensure_credentials()
+        payload = {**self._chat_payload(messages, kwargs), "stream": True}
+        try:
+            async for event in stream_openai_compatible(
+                self.chat_endpoint, headers=self._headers(), body=payload, timeout=40.0
+            ):
+                yield event
+        except httpx.HTTPStatusError as exc:
+            if not self._should_drop_response_format(exc, payload):
+                raise
+            payload.pop("response_format", None)
+            async for event in stream_openai_compatible(
+                self.chat_endpoint, headers=self._headers(), body=payload, timeout=40.0
+            ):
+                yield event
+
     async def list_models(self) -> list[str]:
         try:
             await self.ensure_credentials()
         except RuntimeError:
             return self.default_models
         try:
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                response = await client.get(
-                    self.models_endpoint,
-                    headers={"Authorization": f"Bearer {self.api_key}"},
-                )
-                response.raise_for_status()
-                payload = response.json()
-                models = [item.get("id") for item in payload.get("data", []) if item.get("id")]
-                return models or self.default_models
+            response = await http_pool.get(
+                self.models_endpoint,
+                timeout=20.0,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+            )
+            response.raise_for_status()
+            payload = response.json()
+            models = [item.get("id") for item in payload.get("data", []) if item.get("id")]
+            return models or self.default_models
         except Exception:
             return self.default_models
@@ -0,0 +1,57 @@
+import json
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+
+from .http_client import http_pool
+
+
+async def iter_sse(response: httpx.Response) -> AsyncIterator[Tuple[Optional[str], str]]:
+    """Yield ``(event, data)`` pairs from a server-sent events response body."""
+    event: Optional[str] = None
+    data_lines: list[str] = []
+    async for line in response.aiter_lines():
+        if not line:
+            if data_lines:
+                yield event, "\n".join(data_lines)
+            event, data_lines = None, []
+            continue
+        if line.startswith(":"):
+            continue
+        field, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if field == "event":
+            event = value
+        elif field == "data":
+            data_lines.append(value)
+    if data_lines:
+        yield event, "\n".join(data_lines)
+
+
+async def raise_for_stream_status(response: httpx.Response) -> None:
+    """Like ``raise_for_status`` but reads the body first so error details are available."""
+    if response.is_error:
+        await response.aread()
+        response.raise_for_status()
+
+
+async def stream_openai_compatible(
+    url: str,
+    *,
+    headers: Dict[str, str],
+    body: Dict[str, Any],
+    timeout: float,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Stream a ``/chat/completions`` call from any OpenAI-compatible endpoint."""
+    async with http_pool.stream("POST", url, timeout=timeout, headers=headers, json=body) as response:
+        await raise_for_stream_status(response)
+        async for _, data in iter_sse(response):
+            if data.strip() == "[DONE]":
+                break
+            chunk = json.loads(data)
+            if chunk.get("usage"):
+                yield {"type": "usage", "usage": chunk["usage"]}
+            for choice in chunk.get("choices") or []:
+                text = (choice.get("delta") or {}).get("content")
+                if text:
+                    yield {"type": "delta", "text": text}
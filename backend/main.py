@@ -1,12 +1,38 @@
-from fastapi import FastAPI
+import math
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from sqlalchemy import inspect, select, text
 
-from .api import auth, chat, execution, files, history, llm, provider_settings
+from .api import (
+    auth,
+    chat,
+    execution,
+    files,
+    history,
+    llm,
+    metrics,
+    provider_settings,
+    storage,
+    usage,
+)
 from .config import get_settings
 from .database import database, engine, metadata
+from .llm_adapters.factory import adapter_factory
+from .llm_adapters.http_client import http_pool
 from . import models  # noqa: F401 ensure models are registered
+from .models.chat import chat_messages
 from .models.user import users
+from .services import (
+    batch_service,
+    chat_service,
+    chat_summarizer,
+    llm_cache_service,
+    storage_service,
+    usage_service,
+)
+from .services.rate_limiter import RateLimitExceeded
 
 
 def ensure_user_table_schema() -> None:
@@ -19,6 +45,31 @@ def ensure_user_table_schema() -> None:
         if "password_hash" not in column_names:
             connection.execute(text("ALTER TABLE users ADD COLUMN password_hash TEXT"))
 
+
+def ensure_chat_table_schema() -> None:
+    # Runs after create_all, which neither adds columns nor indexes to existing tables.
+    with engine.begin() as connection:
+        column_names = {column["name"] for column in inspect(connection).get_columns("chat_sessions")}
+        for name, ddl in (
+            ("summary", "TEXT"),
+            ("summary_through_id", "INTEGER"),
+            ("summary_message_count", "INTEGER NOT NULL DEFAULT 0"),
+            ("summary_updated_at", "TIMESTAMP"),
+        ):
+            if name not in column_names:
+                connection.execute(text(f"ALTER TABLE chat_sessions ADD COLUMN {name} {ddl}"))
+    for index in chat_messages.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+
+def ensure_sqlite_journal_mode() -> None:
+    # WAL lets readers proceed while a write commits; the mode is stored in the file.
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.connect() as connection:
+        connection.execute(text("PRAGMA journal_mode=WAL"))
+
+
 settings = get_settings()
 
 app = FastAPI(title=settings.app_name, version="0.1.0")
@@ -32,10 +83,21 @@ app.add_middleware(
 )
 
 
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+
 @app.on_event("startup")
 async def startup_event() -> None:
+    ensure_sqlite_journal_mode()
     ensure_user_table_schema()
     metadata.create_all(bind=engine)
+    ensure_chat_table_schema()
     if not database.is_connected:
         await database.connect()
     default_user = await database.fetch_one(select(users.c.id).where(users.c.id == 1))
@@ -43,10 +105,25 @@ async def startup_event() -> None:
         await database.execute(
             users.insert().values(id=1, username="default", email=None, password_hash=None)
         )
+    storage_service.start_sweeper()
+    llm_cache_service.start_pruner(database)
+    usage_service.start_writer(database)
+    chat_service.start_writer(database)
+    batch_service.start_runner(database)
+    chat_summarizer.start_summarizer(database)
+    adapter_factory.warm_model_cache()
 
 
 @app.on_event("shutdown")
 async def shutdown_event() -> None:
+    await storage_service.stop_sweeper()
+    await llm_cache_service.stop_pruner()
+    await batch_service.stop_runner()
+    await chat_summarizer.stop_summarizer()
+    await chat_service.stop_writer(database)
+    await usage_service.stop_writer(database)
+    await adapter_factory.cancel_model_refreshes()
+    await http_pool.aclose()
     if database.is_connected:
         await database.disconnect()
 
@@ -58,6 +135,9 @@ app.include_router(execution.router)
 app.include_router(files.router)
 app.include_router(history.router)
 app.include_router(chat.router)
+app.include_router(storage.router)
+app.include_router(metrics.router)
+app.include_router(usage.router)
 
 
 @app.get("/health", tags=["meta"])
@@ -2,6 +2,10 @@ from .task import analysis_tasks
 from .chat import chat_messages, chat_sessions
 from .user import users
 from .provider_credential import provider_credentials
+from .llm_cache import llm_response_cache
+from .usage import llm_usage_events, llm_usage_rollups
+from .batch import llm_batch_items, llm_batch_jobs
+from .revision import code_revisions
 
 __all__ = [
     "analysis_tasks",
@@ -9,4 +13,10 @@ __all__ = [
     "chat_messages",
     "users",
     "provider_credentials",
+    "llm_response_cache",
+    "llm_usage_events",
+    "llm_usage_rollups",
+    "llm_batch_jobs",
+    "llm_batch_items",
+    "code_revisions",
 ]
@@ -0,0 +1,58 @@
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Table,
+    Text,
+    UniqueConstraint,
+)
+
+from ..database import metadata
+
+# One row per /llm/batches submission. ``mode`` is "provider" when the prompts were sent
+# through the provider's batch API (``provider_batch_id``) and "worker" when the backend
+# works through them itself.
+llm_batch_jobs = Table(
+    "llm_batch_jobs",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("model", String(128), nullable=False),
+    Column("request_kwargs", Text, nullable=True),
+    Column("overrides_encrypted", Text, nullable=True),
+    Column("mode", String(16), nullable=False),
+    Column("status", String(16), nullable=False),
+    Column("provider_batch_id", String(128), nullable=True),
+    Column("total", Integer, nullable=False, default=0),
+    Column("completed", Integer, nullable=False, default=0),
+    Column("failed", Integer, nullable=False, default=0),
+    Column("error", Text, nullable=True),
+    Column("created_at", DateTime, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+    Column("completed_at", DateTime, nullable=True),
+    Index("ix_llm_batch_jobs_status", "status"),
+    Index("ix_llm_batch_jobs_user_created", "user_id", "created_at"),
+)
+
+# Individual prompts of a job. ``content`` keeps the raw completion so results are parsed
+# with the same extractor as /llm/generate when they are read.
+llm_batch_items = Table(
+    "llm_batch_items",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("job_id", Integer, ForeignKey("llm_batch_jobs.id"), nullable=False),
+    Column("custom_id", String(64), nullable=False),
+    Column("prompt", Text, nullable=False),
+    Column("status", String(16), nullable=False),
+    Column("content", Text, nullable=True),
+    Column("usage", Text, nullable=True),
+    Column("error", Text, nullable=True),
+    Column("latency_ms", Float, nullable=True),
+    Column("completed_at", DateTime, nullable=True),
+    UniqueConstraint("job_id", "custom_id", name="uq_llm_batch_items_job_custom_id"),
+    Index("ix_llm_batch_items_job_status", "job_id", "status"),
+)
@@ -4,6 +4,7 @@ from sqlalchemy import (
     Column,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
     String,
     Table,
@@ -22,6 +23,11 @@ chat_sessions = Table(
     Column("task_id", Integer, ForeignKey("analysis_tasks.id"), nullable=True),
     Column("model", String(64), nullable=False),
     Column("title", String(255), nullable=True),
+    # Running summary of the messages up to summary_through_id (summary_message_count of them).
+    Column("summary", Text, nullable=True),
+    Column("summary_through_id", Integer, nullable=True),
+    Column("summary_message_count", Integer, nullable=False, server_default=text("0")),
+    Column("summary_updated_at", DateTime, nullable=True),
     Column("created_at", DateTime, nullable=False, server_default=text("CURRENT_TIMESTAMP")),
     Column(
         "updated_at",
@@ -42,4 +48,5 @@ chat_messages = Table(
     Column("content", Text, nullable=False),
     Column("metadata", Text, nullable=True),
     Column("created_at", DateTime, nullable=False, server_default=text("CURRENT_TIMESTAMP")),
+    Index("ix_chat_messages_session_created", "session_id", "created_at"),
 )
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, DateTime, Float, Index, Integer, String, Table, Text
+
+from ..database import metadata
+
+llm_response_cache = Table(
+    "llm_response_cache",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("cache_key", String(64), nullable=False, unique=True),
+    Column("user_id", Integer, nullable=True),
+    Column("model", String(128), nullable=False),
+    Column("response", Text, nullable=False),
+    Column("latency_ms", Float, nullable=False, default=0.0),
+    Column("hit_count", Integer, nullable=False, default=0),
+    Column("created_at", DateTime, nullable=False),
+    Column("last_accessed_at", DateTime, nullable=False),
+    Column("expires_at", DateTime, nullable=False),
+    Index("ix_llm_response_cache_last_accessed_at", "last_accessed_at"),
+)
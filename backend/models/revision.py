@@ -0,0 +1,32 @@
+from sqlalchemy import (
+    Column,
+    DateTime,
+    ForeignKey,
+    Integer,
+    String,
+    Table,
+    Text,
+    UniqueConstraint,
+)
+
+from ..database import metadata
+
+# Script history per task. ``revision`` counts from 1 within a task. Snapshot rows
+# (``kind`` "snapshot") hold the full script; delta rows hold line edits against the
+# previous revision, and ``base_revision`` names the snapshot their chain starts from.
+code_revisions = Table(
+    "code_revisions",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("task_id", Integer, ForeignKey("analysis_tasks.id"), nullable=False),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("revision", Integer, nullable=False),
+    Column("base_revision", Integer, nullable=False),
+    Column("kind", String(16), nullable=False),
+    Column("content", Text, nullable=False),
+    Column("code_hash", String(64), nullable=False),
+    Column("code_size", Integer, nullable=False),
+    Column("source", String(16), nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    UniqueConstraint("task_id", "revision", name="uq_code_revisions_task_revision"),
+)
@@ -0,0 +1,56 @@
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Float,
+    Index,
+    Integer,
+    String,
+    Table,
+    UniqueConstraint,
+)
+
+from ..database import metadata
+
+# Append-only ledger: one row per provider call.
+llm_usage_events = Table(
+    "llm_usage_events",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, nullable=False),
+    Column("provider", String(64), nullable=False),
+    Column("model", String(128), nullable=False),
+    Column("endpoint", String(64), nullable=False),
+    Column("prompt_tokens", Integer, nullable=False, default=0),
+    Column("completion_tokens", Integer, nullable=False, default=0),
+    Column("cached_tokens", Integer, nullable=False, default=0),
+    Column("latency_ms", Float, nullable=True),
+    Column("created_at", DateTime, nullable=False),
+    Index("ix_llm_usage_events_user_created", "user_id", "created_at"),
+)
+
+# Hourly and daily totals maintained alongside the ledger so dashboards never scan it.
+llm_usage_rollups = Table(
+    "llm_usage_rollups",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("granularity", String(8), nullable=False),
+    Column("bucket_start", DateTime, nullable=False),
+    Column("user_id", Integer, nullable=False),
+    Column("provider", String(64), nullable=False),
+    Column("model", String(128), nullable=False),
+    Column("endpoint", String(64), nullable=False),
+    Column("requests", Integer, nullable=False, default=0),
+    Column("prompt_tokens", Integer, nullable=False, default=0),
+    Column("completion_tokens", Integer, nullable=False, default=0),
+    Column("cached_tokens", Integer, nullable=False, default=0),
+    Column("latency_ms_sum", Float, nullable=False, default=0.0),
+    UniqueConstraint(
+        "granularity",
+        "user_id",
+        "bucket_start",
+        "provider",
+        "model",
+        "endpoint",
+        name="uq_llm_usage_rollups_bucket",
+    ),
+)
@@ -80,8 +80,13 @@ async def run_python_code(
     extra_requirements: Optional[Iterable[str]] = None,
     timeout: Optional[int] = None,
     user_id: Optional[int] = None,
+    collect_artifacts: bool = True,
 ) -> dict:
-    """Execute Python code inside a temporary working directory."""
+    """Execute Python code inside a temporary working directory.
+
+    With ``collect_artifacts=False`` (dry runs) generated images are discarded with the
+    working directory instead of being copied to the artifacts folder.
+    """
     settings = get_settings()
     timeout = timeout or settings.max_code_execution_seconds
 
@@ -125,8 +130,14 @@ async def run_python_code(
             try:
                 stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
             except asyncio.TimeoutError as exc:
-                process.kill()
                 raise CodeExecutionError(f"Code execution exceeded {timeout}s timeout.") from exc
+            finally:
+                if process.returncode is None:
+                    # Timed out or cancelled (a losing candidate, a client that went away):
+                    # kill and reap the child before its working directory is removed.
+                    with contextlib.suppress(ProcessLookupError):
+                        process.kill()
+                    await process.wait()
 
             artifact_entries: list[dict] = []
             artifacts_manifest = tmp_path / "artifacts.json"
@@ -147,7 +158,7 @@ async def run_python_code(
                 ]
 
             artifact_folder = None
-            if manifest_items:
+            if manifest_items and collect_artifacts:
                 if user_id is not None:
                     if task_id:
                         run_identifier = f"user_{user_id}_task_{task_id}"
@@ -6,6 +6,7 @@ from pydantic import BaseModel, EmailStr, Field
 
 TaskStatus = Literal["queued", "running", "succeeded", "failed"]
 ChatRole = Literal["user", "assistant", "system"]
+PatchStatus = Literal["applied", "fuzzy", "regenerated", "syntax_error", "failed"]
 
 
 class UserRegisterRequest(BaseModel):
@@ -56,7 +57,31 @@ class LLMGenerateRequest(BaseModel):
         default=None,
         description="Optional context or schema extracted from uploaded dataset to guide code generation.",
     )
+    dataset_filename: Optional[str] = Field(
+        default=None,
+        description="Uploaded dataset to describe server-side; takes precedence over dataset_context.",
+    )
     provider_overrides: Optional[Dict[str, ProviderOverride]] = None
+    bypass_cache: bool = Field(
+        default=False,
+        description="Skip the response cache lookup and always call the provider.",
+    )
+    candidates: int = Field(
+        default=1,
+        ge=1,
+        description="Generate this many scripts concurrently and return the first that passes screening.",
+    )
+    dry_run: bool = Field(
+        default=False,
+        description="With candidates > 1, also run each screened script on a sample of the dataset.",
+    )
+
+
+class LLMCandidateReport(BaseModel):
+    index: int
+    valid: bool
+    problems: list[str] = Field(default_factory=list)
+    latency_ms: Optional[float] = None
 
 
 class LLMGenerateResponse(BaseModel):
@@ -65,6 +90,8 @@ class LLMGenerateResponse(BaseModel):
     prompt: str
     reasoning: Optional[str] = None
     usage: Optional[dict] = None
+    cached: bool = False
+    candidates: Optional[list[LLMCandidateReport]] = None
 
 
 class CodeExecutionRequest(BaseModel):
@@ -97,6 +124,93 @@ class AnalysisTaskCreate(BaseModel):
 
 
 
+class LLMCompareRequest(BaseModel):
+    prompt: str = Field(..., description="Natural language task description from user.")
+    targets: list[str] = Field(..., min_length=1, description="provider:model identifiers to compare.")
+    task_type: Literal["strategy", "analysis"] = "analysis"
+    dataset_context: Optional[str] = None
+    dataset_filename: Optional[str] = None
+    provider_overrides: Optional[Dict[str, ProviderOverride]] = None
+    execute: bool = Field(
+        default=False,
+        description="Also run each generated script in the sandbox against the dataset.",
+    )
+    max_concurrency: Optional[int] = Field(
+        default=None,
+        ge=1,
+        description="Upper bound on simultaneous provider calls and sandbox runs for this request.",
+    )
+
+
+class LLMCompareResult(BaseModel):
+    model: str
+    success: bool = Field(
+        ..., description="Code was generated and, when execution was requested, it ran cleanly."
+    )
+    latency_ms: float
+    usage: Optional[dict] = None
+    code: Optional[str] = None
+    reasoning: Optional[str] = None
+    error: Optional[str] = None
+    execution: Optional[CodeExecutionResult] = None
+    execution_ms: Optional[float] = None
+
+
+class LLMBatchItem(BaseModel):
+    prompt: str = Field(..., description="Natural language task description from user.")
+    custom_id: Optional[str] = Field(
+        default=None, max_length=64, description="Caller's id for this item; defaults to its position."
+    )
+    dataset_filename: Optional[str] = Field(
+        default=None, description="Overrides the batch-level dataset for this item."
+    )
+
+
+class LLMBatchRequest(BaseModel):
+    model: str = Field(..., description="LLM provider identifier.")
+    items: list[LLMBatchItem] = Field(..., min_length=1)
+    task_type: Literal["strategy", "analysis"] = "analysis"
+    dataset_context: Optional[str] = None
+    dataset_filename: Optional[str] = None
+    provider_overrides: Optional[Dict[str, ProviderOverride]] = None
+    mode: Literal["auto", "provider", "worker"] = Field(
+        default="auto",
+        description=(
+            "provider: use the provider's batch API; worker: throttled calls from the backend; "
+            "auto: the batch API when the provider has one."
+        ),
+    )
+
+
+class LLMBatchJob(BaseModel):
+    id: int
+    model: str
+    mode: str
+    status: str
+    total: int
+    completed: int
+    failed: int
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    completed_at: Optional[datetime] = None
+
+
+class LLMBatchItemResult(BaseModel):
+    custom_id: str
+    status: str
+    code: Optional[str] = None
+    reasoning: Optional[str] = None
+    usage: Optional[dict] = None
+    error: Optional[str] = None
+    latency_ms: Optional[float] = None
+
+
+class LLMBatchResults(BaseModel):
+    job: LLMBatchJob
+    items: list[LLMBatchItemResult]
+
+
 class LLMProviderInfo(BaseModel):
     id: str
     name: str
@@ -121,6 +235,25 @@ class AnalysisTaskRead(BaseModel):
         from_attributes = True
 
 
+class CodeRevisionCreate(BaseModel):
+    code: str
+    source: Literal["generate", "chat", "run", "manual"] = "manual"
+
+
+class CodeRevisionRead(BaseModel):
+    id: int
+    task_id: int
+    revision: int
+    kind: Literal["snapshot", "delta"]
+    code_size: int
+    source: str
+    created_at: datetime
+
+
+class CodeRevisionDetail(CodeRevisionRead):
+    code: str
+
+
 class ChatMessagePayload(BaseModel):
     role: ChatRole
     content: str
@@ -128,25 +261,50 @@ class ChatMessagePayload(BaseModel):
 
 class ChatTurnMetadata(BaseModel):
     code_snapshot: Optional[str] = None
+    revision_id: Optional[int] = Field(
+        default=None, description="A stored revision of the task's script, instead of code_snapshot."
+    )
     stdout: Optional[str] = None
     stderr: Optional[str] = None
 
 
 class ChatSendRequest(BaseModel):
     model: str
-    messages: list[ChatMessagePayload]
+    messages: list[ChatMessagePayload] = Field(
+        default_factory=list, description="The whole conversation, ending with the new user turn."
+    )
+    message: Optional[str] = Field(
+        default=None,
+        description="Only the new user turn; the history of session_id is rebuilt server-side.",
+    )
     session_id: Optional[int] = None
     task_id: Optional[int] = None
     context: Optional[ChatTurnMetadata] = None
     provider_overrides: Optional[Dict[str, ProviderOverride]] = None
 
 
+class ChatContextReport(BaseModel):
+    """Local prompt-size estimates for one chat turn, before and after budgeting."""
+
+    budget: int
+    tokens_before: int
+    tokens_after: int
+    dropped_messages: int = 0
+    truncated_outputs: int = 0
+
+
 class ChatMessageResponse(BaseModel):
     session_id: int
     message: ChatMessagePayload
     reasoning: Optional[str] = None
     patch: Optional[str] = None
+    patched_code: Optional[str] = Field(
+        default=None, description="The script with the patch applied and checked to parse."
+    )
+    patch_status: Optional[PatchStatus] = None
     usage: Optional[dict] = None
+    context: Optional[ChatContextReport] = None
+    revision_id: Optional[int] = None
 
 
 class ChatSessionRead(BaseModel):
@@ -155,6 +313,7 @@ class ChatSessionRead(BaseModel):
     task_id: Optional[int] = None
     model: str
     title: Optional[str] = None
+    summary: Optional[str] = None
     created_at: datetime
     updated_at: datetime
 
@@ -171,3 +330,33 @@ class ChatMessageRecord(BaseModel):
 class ChatSessionHistoryResponse(BaseModel):
     session: ChatSessionRead
     messages: list[ChatMessageRecord]
+
+
+class UsagePoint(BaseModel):
+    bucket_start: datetime
+    provider: Optional[str] = None
+    model: Optional[str] = None
+    endpoint: Optional[str] = None
+    requests: int
+    prompt_tokens: int
+    completion_tokens: int
+    cached_tokens: int
+    total_tokens: int
+    avg_latency_ms: Optional[float] = None
+
+
+class UsageTotals(BaseModel):
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    total_tokens: int = 0
+
+
+class UsageReport(BaseModel):
+    granularity: Literal["hour", "day"]
+    start: datetime
+    end: datetime
+    group_by: list[str]
+    points: list[UsagePoint]
+    totals: UsageTotals
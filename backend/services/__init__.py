@@ -1,9 +1,43 @@
-from . import auth_service, chat_service, prompt_builder, provider_credentials_service, task_service
+from . import (
+    auth_service,
+    batch_service,
+    chat_context,
+    chat_service,
+    chat_summarizer,
+    code_screening,
+    dataset_context,
+    dataset_service,
+    llm_cache_service,
+    patching,
+    prompt_builder,
+    provider_credentials_service,
+    rate_limiter,
+    revision_service,
+    similarity_cache,
+    single_flight,
+    storage_service,
+    task_service,
+    usage_service,
+)
 
 __all__ = [
     "prompt_builder",
+    "dataset_service",
+    "dataset_context",
     "task_service",
     "chat_service",
+    "chat_context",
     "auth_service",
     "provider_credentials_service",
+    "storage_service",
+    "llm_cache_service",
+    "similarity_cache",
+    "rate_limiter",
+    "usage_service",
+    "batch_service",
+    "code_screening",
+    "single_flight",
+    "chat_summarizer",
+    "revision_service",
+    "patching",
 ]
@@ -0,0 +1,434 @@
+import asyncio
+import contextlib
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from databases import Database
+from sqlalchemy import func, insert, select
+
+from ..config import get_settings
+from ..llm_adapters.base import LLMAdapter
+from ..llm_adapters.batch import TERMINAL_BATCH_STATES
+from ..llm_adapters.factory import adapter_factory
+from ..llm_adapters.resilience import CircuitOpenError
+from ..models.batch import llm_batch_items, llm_batch_jobs
+from ..schemas import ProviderOverride
+from ..security import decrypt_secret, encrypt_secret
+from . import provider_credentials_service, rate_limiter, usage_service
+from .rate_limiter import RateLimitExceeded
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+USAGE_ENDPOINT = "llm.batch"
+
+_runner_task: Optional[asyncio.Task] = None
+_wake: Optional[asyncio.Event] = None
+_metrics: Dict[str, Any] = {
+    "jobs_created": 0,
+    "jobs_finished": 0,
+    "provider_batches_submitted": 0,
+    "provider_submit_failures": 0,
+    "items_completed": 0,
+    "items_failed": 0,
+    "worker_throttled": 0,
+    "last_pass_seconds": None,
+}
+
+
+def supports_provider_batch(adapter: LLMAdapter) -> bool:
+    return bool(getattr(adapter, "supports_batch", False))
+
+
+async def create_job(
+    db: Database,
+    *,
+    user_id: int,
+    model: str,
+    mode: str,
+    request_kwargs: Dict[str, Any],
+    items: Sequence[Tuple[str, str]],
+    override: Optional[ProviderOverride] = None,
+) -> int:
+    """Persist a job and its ``(custom_id, prompt)`` items, then nudge the runner.
+
+    A request-level provider override is stored encrypted, like saved credentials, so
+    the runner can rebuild the same adapter later.
+    """
+    now = datetime.utcnow()
+    async with db.transaction():
+        job_id = await db.execute(
+            insert(llm_batch_jobs).values(
+                user_id=user_id,
+                model=model,
+                request_kwargs=json.dumps(request_kwargs),
+                overrides_encrypted=encrypt_secret(override.model_dump_json()) if override else None,
+                mode=mode,
+                status="queued",
+                total=len(items),
+                completed=0,
+                failed=0,
+                created_at=now,
+                updated_at=now,
+            )
+        )
+        await db.execute_many(
+            insert(llm_batch_items),
+            [
+                {"job_id": job_id, "custom_id": custom_id, "prompt": prompt, "status": "pending"}
+                for custom_id, prompt in items
+            ],
+        )
+    _metrics["jobs_created"] += 1
+    wake()
+    return job_id
+
+
+async def get_job(db: Database, job_id: int, *, user_id: int) -> Optional[Dict[str, Any]]:
+    row = await db.fetch_one(
+        select(llm_batch_jobs).where(llm_batch_jobs.c.id == job_id).where(llm_batch_jobs.c.user_id == user_id)
+    )
+    return dict(row) if row else None
+
+
+async def list_jobs(db: Database, *, user_id: int, limit: int = 50) -> List[Dict[str, Any]]:
+    rows = await db.fetch_all(
+        select(llm_batch_jobs)
+        .where(llm_batch_jobs.c.user_id == user_id)
+        .order_by(llm_batch_jobs.c.created_at.desc())
+        .limit(limit)
+    )
+    return [dict(row) for row in rows]
+
+
+async def list_items(
+    db: Database,
+    job_id: int,
+    *,
+    status: Optional[str] = None,
+    offset: int = 0,
+    limit: int = 100,
+) -> List[Dict[str, Any]]:
+    query = select(llm_batch_items).where(llm_batch_items.c.job_id == job_id)
+    if status:
+        query = query.where(llm_batch_items.c.status == status)
+    rows = await db.fetch_all(query.order_by(llm_batch_items.c.id).offset(offset).limit(limit))
+    items = []
+    for row in rows:
+        item = dict(row)
+        item["usage"] = json.loads(item["usage"]) if item["usage"] else None
+        items.append(item)
+    return items
+
+
+async def _job_adapter(db: Database, job: Dict[str, Any]) -> LLMAdapter:
+    provider = job["model"].partition(":")[0]
+    stored_map = await provider_credentials_service.get_credentials_map(db, job["user_id"])
+    stored = provider_credentials_service.credential_payloads_to_overrides(stored_map)
+    request_override = None
+    if job["overrides_encrypted"]:
+        decrypted = decrypt_secret(job["overrides_encrypted"])
+        request_override = ProviderOverride.model_validate_json(decrypted) if decrypted else None
+    override = provider_credentials_service.merge_overrides(stored.get(provider), request_override)
+    return adapter_factory.get(provider, override=override)
+
+
+async def _update_job(db: Database, job_id: int, **values: Any) -> None:
+    await db.execute(
+        llm_batch_jobs.update()
+        .where(llm_batch_jobs.c.id == job_id)
+        .values(updated_at=datetime.utcnow(), **values)
+    )
+
+
+async def _finish_item(
+    db: Database,
+    job: Dict[str, Any],
+    custom_id: str,
+    *,
+    content: Optional[str],
+    usage: Optional[Dict[str, Any]],
+    error: Optional[str],
+    latency_ms: Optional[float] = None,
+) -> None:
+    status = "failed" if error else "completed"
+    await db.execute(
+        llm_batch_items.update()
+        .where(llm_batch_items.c.job_id == job["id"])
+        .where(llm_batch_items.c.custom_id == custom_id)
+        .where(llm_batch_items.c.status == "pending")
+        .values(
+            status=status,
+            content=content,
+            usage=json.dumps(usage) if usage else None,
+            error=error,
+            latency_ms=round(latency_ms, 1) if latency_ms is not None else None,
+            completed_at=datetime.utcnow(),
+        )
+    )
+    _metrics["items_failed" if error else "items_completed"] += 1
+    if usage:
+        usage_service.record(
+            user_id=job["user_id"],
+            provider=job["model"].partition(":")[0],
+            model=job["model"],
+            endpoint=USAGE_ENDPOINT,
+            usage=usage,
+            latency_ms=latency_ms,
+        )
+
+
+async def _refresh_counts(db: Database, job_id: int, *, final_status: Optional[str] = None) -> int:
+    """Recount item states onto the job; mark it finished once nothing is pending.
+
+    Returns the number of pending items.
+    """
+    rows = await db.fetch_all(
+        select(llm_batch_items.c.status, func.count().label("count"))
+        .where(llm_batch_items.c.job_id == job_id)
+        .group_by(llm_batch_items.c.status)
+    )
+    counts = {row["status"]: row["count"] for row in rows}
+    pending = counts.get("pending", 0)
+    await _update_job(db, job_id, completed=counts.get("completed", 0), failed=counts.get("failed", 0))
+    if final_status or not pending:
+        now = datetime.utcnow()
+        # Only the call that moves the job out of an active state finishes it, so a job
+        # is counted once and a cancelled job is not turned back into a completed one.
+        finished = await db.fetch_one(
+            llm_batch_jobs.update()
+            .where(llm_batch_jobs.c.id == job_id)
+            .where(llm_batch_jobs.c.status.in_(ACTIVE_STATUSES))
+            .values(status=final_status or "completed", completed_at=now, updated_at=now)
+            .returning(llm_batch_jobs.c.id)
+        )
+        if finished is not None:
+            _metrics["jobs_finished"] += 1
+    return pending
+
+
+async def _pending_items(db: Database, job_id: int, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    query = (
+        select(llm_batch_items.c.custom_id, llm_batch_items.c.prompt)
+        .where(llm_batch_items.c.job_id == job_id)
+        .where(llm_batch_items.c.status == "pending")
+        .order_by(llm_batch_items.c.id)
+    )
+    if limit:
+        query = query.limit(limit)
+    return [{"custom_id": row["custom_id"], "prompt": row["prompt"]} for row in await db.fetch_all(query)]
+
+
+async def _submit_provider_batch(db: Database, job: Dict[str, Any], adapter: LLMAdapter) -> None:
+    kwargs = json.loads(job["request_kwargs"] or "{}")
+    items = await _pending_items(db, job["id"])
+    try:
+        batch_id = await adapter.submit_batch(  # type: ignore[attr-defined]
+            [(item["custom_id"], item["prompt"], kwargs) for item in items]
+        )
+    except Exception as exc:
+        # Not every account or compatible endpoint offers the batch API; the worker
+        # still gets the job done, just without the batch discount.
+        _metrics["provider_submit_failures"] += 1
+        logger.warning("Batch submission for job %s failed, falling back to the worker: %s", job["id"], exc)
+        await _update_job(
+            db, job["id"], mode="worker", error=f"Provider batch submission failed: {exc}"
+        )
+        return
+    _metrics["provider_batches_submitted"] += 1
+    await _update_job(db, job["id"], provider_batch_id=batch_id, status="running")
+
+
+async def _poll_provider_batch(db: Database, job: Dict[str, Any], adapter: LLMAdapter) -> None:
+    batch = await adapter.get_batch(job["provider_batch_id"])  # type: ignore[attr-defined]
+    state = batch.get("status")
+    if state not in TERMINAL_BATCH_STATES:
+        counts = batch.get("request_counts") or {}
+        await _update_job(
+            db,
+            job["id"],
+            completed=counts.get("completed", job["completed"]),
+            failed=counts.get("failed", job["failed"]),
+        )
+        return
+    results = await adapter.fetch_batch_results(batch)  # type: ignore[attr-defined]
+    async with db.transaction():
+        for result in results:
+            if result["custom_id"] is None:
+                continue
+            await _finish_item(
+                db,
+                job,
+                result["custom_id"],
+                content=result["content"],
+                usage=result["usage"],
+                error=result["error"],
+            )
+        if state != "completed":
+            await db.execute(
+                llm_batch_items.update()
+                .where(llm_batch_items.c.job_id == job["id"])
+                .where(llm_batch_items.c.status == "pending")
+                .values(status="failed", error=f"Provider batch {state}.", completed_at=datetime.utcnow())
+            )
+        await _refresh_counts(db, job["id"], final_status="completed" if state == "completed" else "failed")
+
+
+async def _run_worker(db: Database, job: Dict[str, Any], adapter: LLMAdapter) -> bool:
+    """Work through one chunk of pending items with bounded concurrency under the user's
+    rate limits, so one large job cannot hold up a runner pass.
+
+    Returns whether items remain that the next pass can start on right away; not when
+    the rate limiter or an open circuit breaker pushed back or the job was cancelled.
+    """
+    settings = get_settings()
+    concurrency = max(1, settings.llm_batch_worker_concurrency)
+    kwargs = json.loads(job["request_kwargs"] or "{}")
+    if job["status"] == "queued":
+        await _update_job(db, job["id"], status="running")
+    semaphore = asyncio.Semaphore(concurrency)
+    throttled = asyncio.Event()
+
+    async def run(item: Dict[str, Any]) -> None:
+        async with semaphore:
+            if throttled.is_set():
+                return
+            try:
+                reservation = await rate_limiter.acquire(
+                    job["user_id"],
+                    adapter.name,
+                    estimated_tokens=rate_limiter.estimate_request_tokens(item["prompt"]),
+                )
+            except RateLimitExceeded:
+                _metrics["worker_throttled"] += 1
+                throttled.set()
+                return
+            started = time.perf_counter()
+            try:
+                with reservation.released_on_error():
+                    result = await adapter.generate_code(item["prompt"], **kwargs)
+            except CircuitOpenError:
+                throttled.set()
+                return
+            except Exception as exc:
+                await _finish_item(db, job, item["custom_id"], content=None, usage=None, error=str(exc))
+                return
+            reservation.settle(result.get("usage"))
+            await _finish_item(
+                db,
+                job,
+                item["custom_id"],
+                content=result.get("code") or "",
+                usage=result.get("usage"),
+                error=None,
+                latency_ms=(time.perf_counter() - started) * 1000,
+            )
+
+    current = await db.fetch_one(
+        select(llm_batch_jobs.c.status).where(llm_batch_jobs.c.id == job["id"])
+    )
+    if current is None or current["status"] not in ACTIVE_STATUSES:
+        return False
+    items = await _pending_items(db, job["id"], limit=concurrency * 4)
+    await asyncio.gather(*(run(item) for item in items))
+    pending = await _refresh_counts(db, job["id"])
+    return bool(pending) and not throttled.is_set()
+
+
+async def _advance(db: Database, job: Dict[str, Any]) -> bool:
+    """Advance ``job`` by one step; returns whether it has more work ready right now."""
+    adapter = await _job_adapter(db, job)
+    if job["mode"] == "provider" and supports_provider_batch(adapter):
+        if job["provider_batch_id"] is None:
+            await _submit_provider_batch(db, job, adapter)
+        else:
+            await _poll_provider_batch(db, job, adapter)
+        return False
+    return await _run_worker(db, job, adapter)
+
+
+async def run_pending(db: Database) -> int:
+    """Advance every queued or running job once; returns how many were looked at.
+
+    Worker jobs get one chunk each per pass. When any has more ready, the next pass is
+    started right away rather than after the poll interval.
+    """
+    started = time.monotonic()
+    rows = await db.fetch_all(select(llm_batch_jobs).where(llm_batch_jobs.c.status.in_(ACTIVE_STATUSES)))
+    jobs = [dict(row) for row in rows]
+
+    async def advance(job: Dict[str, Any]) -> bool:
+        try:
+            return await _advance(db, job)
+        except Exception:  # pragma: no cover - one bad job must not stall the rest
+            logger.exception("Batch job %s could not be advanced", job["id"])
+            return False
+
+    more = await asyncio.gather(*(advance(job) for job in jobs))
+    _metrics["last_pass_seconds"] = round(time.monotonic() - started, 4)
+    if any(more):
+        wake()
+    return len(jobs)
+
+
+async def cancel_job(db: Database, job_id: int, *, user_id: int) -> Optional[Dict[str, Any]]:
+    """Cancel a job that has not finished; pending items are marked cancelled."""
+    job = await get_job(db, job_id, user_id=user_id)
+    if job is None or job["status"] not in ACTIVE_STATUSES:
+        return job
+    if job["provider_batch_id"]:
+        with contextlib.suppress(Exception):
+            adapter = await _job_adapter(db, job)
+            await adapter.cancel_batch(job["provider_batch_id"])  # type: ignore[attr-defined]
+    async with db.transaction():
+        await db.execute(
+            llm_batch_items.update()
+            .where(llm_batch_items.c.job_id == job_id)
+            .where(llm_batch_items.c.status == "pending")
+            .values(status="cancelled", completed_at=datetime.utcnow())
+        )
+        await _refresh_counts(db, job_id, final_status="cancelled")
+    return await get_job(db, job_id, user_id=user_id)
+
+
+def wake() -> None:
+    """Start the next runner pass now instead of at the next poll interval."""
+    if _wake is not None:
+        _wake.set()
+
+
+async def _runner_loop(db: Database, wake_event: asyncio.Event) -> None:
+    interval = get_settings().llm_batch_poll_interval_seconds
+    while True:
+        try:
+            await run_pending(db)
+        except Exception:  # pragma: no cover - keep the runner alive
+            logger.exception("Batch runner pass failed")
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(wake_event.wait(), interval)
+        wake_event.clear()
+
+
+def start_runner(db: Database) -> None:
+    global _runner_task, _wake
+    if get_settings().llm_batch_poll_interval_seconds <= 0 or (_runner_task and not _runner_task.done()):
+        return
+    _wake = asyncio.Event()
+    _runner_task = asyncio.create_task(_runner_loop(db, _wake))
+
+
+async def stop_runner() -> None:
+    global _runner_task, _wake
+    if _runner_task is None:
+        return
+    _runner_task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await _runner_task
+    _runner_task, _wake = None, None
+
+
+def get_metrics() -> Dict[str, Any]:
+    return dict(_metrics)
@@ -0,0 +1,185 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from ..config import get_settings
+from ..schemas import ChatContextReport
+from .tokens import estimate_tokens, match_model_budget, normalize_usage
+
+# Per-message framing (role, separators) that every provider adds on top of the content.
+_MESSAGE_OVERHEAD_TOKENS = 4
+# Output tails carry tracebacks and final results, so they get the larger share.
+_OUTPUT_HEAD_SHARE = 0.35
+_SUMMARY_MAX_TOKENS = 300
+_SUMMARY_LINE_CHARS = 160
+
+_metrics: Dict[str, int] = {
+    "turns": 0,
+    "tokens_before": 0,
+    "tokens_after": 0,
+    "dropped_messages": 0,
+    "truncated_outputs": 0,
+    "over_budget": 0,
+    "prompt_tokens": 0,
+    "cached_prompt_tokens": 0,
+}
+
+
+def resolve_chat_budget(model: str) -> Tuple[str, int]:
+    """Map a ``provider:model`` string to its model family and chat prompt budget."""
+    return match_model_budget(model, get_settings().chat_context_token_budgets, 6000)
+
+
+def estimate_messages(messages: Sequence[Dict[str, str]]) -> int:
+    return sum(estimate_tokens(message["content"]) + _MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def _take_lines(lines: Sequence[str], budget: int) -> List[str]:
+    taken: List[str] = []
+    used = 0
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        taken.append(line)
+        used += cost
+    return taken
+
+
+def truncate_output(text: str, max_tokens: int) -> Tuple[str, bool]:
+    """Keep the head and tail of program output within ``max_tokens``.
+
+    Returns the (possibly) shortened text and whether anything was cut.
+    """
+    if max_tokens <= 0 or estimate_tokens(text) <= max_tokens:
+        return text, False
+    head_budget = int(max_tokens * _OUTPUT_HEAD_SHARE)
+    lines = text.splitlines()
+    head = _take_lines(lines, head_budget)
+    tail = _take_lines(lines[len(head):][::-1], max_tokens - head_budget)[::-1]
+    omitted = len(lines) - len(head) - len(tail)
+    if omitted <= 0:
+        return text, False
+    if not head and not tail:
+        # A single enormous line (e.g. a printed array): fall back to characters.
+        chars = max_tokens * 4
+        head_chars = int(chars * _OUTPUT_HEAD_SHARE)
+        return f"{text[:head_chars]}\n... [output truncated] ...\n{text[-(chars - head_chars):]}", True
+    return "\n".join([*head, f"... [{omitted} lines omitted] ...", *tail]), True
+
+
+def render_full_context(content: str, context: Optional[Dict[str, Any]]) -> str:
+    """A user message with the whole context snapshot appended, untrimmed, as every user
+    turn carried it before prompts were budgeted."""
+    if not context:
+        return content
+    fragments: List[str] = [content, "\n\n--- Context Snapshot ---"]
+    for key, label in (("code_snapshot", "Current code"), ("stdout", "Last stdout"), ("stderr", "Last stderr")):
+        if context.get(key):
+            fragments.append(f"{label}:\n{context[key]}")
+    return "\n\n".join(fragments)
+
+
+def render_turn_context(content: str, context: Optional[Dict[str, Any]]) -> Tuple[str, int]:
+    """Append the code snapshot and trimmed run output to the latest user message.
+
+    Returns the message text and how many output streams were truncated.
+    """
+    if not context:
+        return content, 0
+    limit = get_settings().chat_output_token_limit
+    truncated = 0
+    fragments: List[str] = [content, "\n\n--- Context Snapshot ---"]
+    if context.get("code_snapshot"):
+        fragments.append("Current code:\n" + context["code_snapshot"])
+    for key, label in (("stdout", "Last stdout"), ("stderr", "Last stderr")):
+        if context.get(key):
+            text, cut = truncate_output(context[key], limit)
+            truncated += cut
+            fragments.append(f"{label}:\n{text}")
+    return "\n\n".join(fragments), truncated
+
+
+def _summarize_dropped(dropped: Sequence[Dict[str, str]], max_tokens: int) -> Optional[str]:
+    header = (
+        f"{len(dropped)} earlier messages, preceding the conversation above, were omitted to fit "
+        "the context window. In them the user asked about:"
+    )
+    used = estimate_tokens(header)
+    lines: List[str] = []
+    # Prefer the most recent of the dropped questions, listed in chronological order.
+    for message in reversed(dropped):
+        if message["role"] != "user":
+            continue
+        first_line = next((line.strip() for line in message["content"].splitlines() if line.strip()), "")
+        if not first_line:
+            continue
+        line = "- " + first_line[:_SUMMARY_LINE_CHARS]
+        cost = estimate_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        lines.append(line)
+        used += cost
+    if used > max_tokens:
+        return None
+    return "\n".join([header, *reversed(lines)])
+
+
+def fit_messages(
+    head: List[Dict[str, str]],
+    history: List[Dict[str, str]],
+    tail: List[Dict[str, str]],
+    *,
+    budget: int,
+) -> Tuple[List[Dict[str, str]], int]:
+    """Assemble ``head + history + tail``, dropping the oldest history to fit ``budget``.
+
+    ``head`` (instructions) and ``tail`` (latest turn and per-turn directives) are always
+    kept. The note about dropped turns goes after the kept history rather than before it
+    so the stable head stays a cacheable prefix. Returns the messages and the number of
+    history messages dropped.
+    """
+    available = budget - estimate_messages(head) - estimate_messages(tail)
+    if estimate_messages(history) <= available:
+        return [*head, *history, *tail], 0
+
+    summary_budget = min(_SUMMARY_MAX_TOKENS, max(available // 5, 0))
+    remaining = available - summary_budget
+    kept: List[Dict[str, str]] = []
+    for message in reversed(history):
+        cost = estimate_messages([message])
+        if cost > remaining:
+            break
+        kept.append(message)
+        remaining -= cost
+    kept.reverse()
+    dropped = history[: len(history) - len(kept)]
+    summary = _summarize_dropped(dropped, summary_budget - _MESSAGE_OVERHEAD_TOKENS)
+    note = [{"role": "system", "content": summary}] if summary else []
+    return [*head, *kept, *note, *tail], len(dropped)
+
+
+def record(report: ChatContextReport) -> None:
+    _metrics["turns"] += 1
+    _metrics["tokens_before"] += report.tokens_before
+    _metrics["tokens_after"] += report.tokens_after
+    _metrics["dropped_messages"] += report.dropped_messages
+    _metrics["truncated_outputs"] += report.truncated_outputs
+    if report.tokens_after > report.budget:
+        _metrics["over_budget"] += 1
+
+
+def record_usage(usage: Optional[Dict[str, Any]]) -> None:
+    """Track how much of the provider-reported prompt was served from its prefix cache."""
+    prompt, _, cached = normalize_usage(usage)
+    _metrics["prompt_tokens"] += prompt
+    _metrics["cached_prompt_tokens"] += cached
+
+
+def get_metrics() -> Dict[str, Any]:
+    before = _metrics["tokens_before"]
+    prompt = _metrics["prompt_tokens"]
+    return {
+        **_metrics,
+        "tokens_saved": before - _metrics["tokens_after"],
+        "reduction": round(1 - _metrics["tokens_after"] / before, 4) if before else None,
+        "prompt_cache_hit_rate": round(_metrics["cached_prompt_tokens"] / prompt, 4) if prompt else None,
+    }
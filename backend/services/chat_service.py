@@ -1,53 +1,145 @@
+import asyncio
+import contextlib
 import json
+import logging
+import sys
+import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 from databases import Database
 from sqlalchemy import insert, select, update
 
+from ..config import get_settings
 from ..models.chat import chat_messages, chat_sessions
-from ..models.task import analysis_tasks
 from ..schemas import ChatMessagePayload
 
+logger = logging.getLogger(__name__)
 
-async def ensure_session(
+# Recent history of active sessions as (message id, message), most recently used last.
+_histories: "OrderedDict[int, List[Tuple[int, ChatMessagePayload]]]" = OrderedDict()
+# Stands in for the id of a queued message; it sorts after every stored one.
+_UNWRITTEN_ID = sys.maxsize
+# Write-behind of assistant messages, and per session the last one still queued.
+_queue: Optional[asyncio.Queue] = None
+_writer_task: Optional[asyncio.Task] = None
+_unwritten: Dict[int, asyncio.Future] = {}
+# Keeps one multi-row insert within SQLite's bound-parameter limit.
+_WRITE_BATCH_SIZE = 500
+# A batch that fails is retried after each delay (seconds), then written row by row so
+# one bad message cannot take the others with it.
+_WRITE_RETRY_DELAYS = (0.1, 0.5, 2.0)
+# SQLite has one writer at a time. Transactions queue here instead of polling its lock,
+# which starves waiters past the busy timeout when many turns arrive together.
+_sqlite_write_lock = asyncio.Lock()
+_metrics: Dict[str, Any] = {
+    "history_hits": 0,
+    "history_misses": 0,
+    "history_evicted": 0,
+    "queued_messages": 0,
+    "written_messages": 0,
+    "write_batches": 0,
+    "write_retries": 0,
+    "write_failures": 0,
+    "waits": 0,
+    "write_ms": 0.0,
+}
+
+
+def _message_row(
+    session_id: int, role: str, content: str, metadata: Optional[dict], created_at: datetime
+) -> Dict[str, Any]:
+    return {
+        "session_id": session_id,
+        "role": role,
+        "content": content,
+        "metadata": None if metadata is None else json.dumps(metadata),
+        "created_at": created_at,
+    }
+
+
+async def _insert_message(
+    db: Database, session_id: int, role: str, content: str, metadata: Optional[dict], created_at: datetime
+) -> int:
+    return await db.execute(
+        insert(chat_messages)
+        .values(**_message_row(session_id, role, content, metadata, created_at))
+        .returning(chat_messages.c.id)
+    )
+
+
+@contextlib.asynccontextmanager
+async def _write_transaction(db: Database) -> AsyncIterator[None]:
+    if db.url.dialect != "sqlite":
+        async with db.transaction():
+            yield
+        return
+    async with _sqlite_write_lock, db.transaction():
+        yield
+
+
+def _extend_history(session_id: int, message_id: int, message: ChatMessagePayload) -> None:
+    history = _histories.get(session_id)
+    if history is not None:
+        history.append((message_id, message))
+        del history[: -get_settings().chat_history_max_messages]
+
+
+async def start_turn(
     db: Database,
     *,
-    session_id: Optional[int],
+    session: Optional[Any],
     task_id: Optional[int],
     model: str,
     user_id: int,
+    content: str,
+    metadata: Optional[dict] = None,
 ) -> int:
-    if session_id:
-        result = await db.fetch_one(
-            select(chat_sessions.c.id)
-            .where(chat_sessions.c.id == session_id)
-            .where(chat_sessions.c.user_id == user_id)
-        )
-        if result:
+    """Store a user message, creating ``session`` when it is ``None``, in one transaction.
+
+    ``session`` is a row the caller already read for ``user_id``. Returns the session id.
+    """
+    if session is not None:
+        # Message ids follow the conversation: the previous reply is written first.
+        await _wait_written(session["id"])
+    now = datetime.utcnow()
+    async with _write_transaction(db):
+        if session is None:
+            session_id = await db.execute(
+                insert(chat_sessions)
+                .values(task_id=task_id, model=model, user_id=user_id, created_at=now, updated_at=now)
+                .returning(chat_sessions.c.id)
+            )
+        else:
+            session_id = session["id"]
             await db.execute(
-                update(chat_sessions)
-                .where(chat_sessions.c.id == session_id)
-                .values(updated_at=datetime.utcnow())
+                update(chat_sessions).where(chat_sessions.c.id == session_id).values(updated_at=now)
             )
-            return session_id
+        message_id = await _insert_message(db, session_id, "user", content, metadata, now)
+    _extend_history(session_id, message_id, ChatMessagePayload(role="user", content=content))
+    return session_id
 
-    query = (
-        insert(chat_sessions)
-        .values(
-            task_id=task_id,
-            model=model,
-            user_id=user_id,
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow(),
+
+async def append_message(
+    db: Database,
+    *,
+    session_id: int,
+    role: str,
+    content: str,
+    metadata: Optional[dict] = None,
+) -> int:
+    now = datetime.utcnow()
+    async with _write_transaction(db):
+        message_id = await _insert_message(db, session_id, role, content, metadata, now)
+        await db.execute(
+            update(chat_sessions).where(chat_sessions.c.id == session_id).values(updated_at=now)
         )
-        .returning(chat_sessions.c.id)
-    )
-    new_id = await db.execute(query)
-    return new_id
+    _extend_history(session_id, message_id, ChatMessagePayload(role=role, content=content))
+    return message_id
 
 
-async def append_message(
+async def queue_message(
     db: Database,
     *,
     session_id: int,
@@ -55,23 +147,236 @@ async def append_message(
     content: str,
     metadata: Optional[dict] = None,
 ) -> None:
-    await db.execute(
-        insert(chat_messages).values(
-            session_id=session_id,
-            role=role,
-            content=content,
-            metadata=None if metadata is None else json.dumps(metadata),
-            created_at=datetime.utcnow(),
+    """Store a message off the request path when the writer runs, else write it now.
+
+    The cached history shows the message at once; reads of the session from the database
+    wait for it to be written.
+    """
+    if _queue is None:
+        await append_message(db, session_id=session_id, role=role, content=content, metadata=metadata)
+        return
+    message = ChatMessagePayload(role=role, content=content)
+    written = asyncio.get_running_loop().create_future()
+    _unwritten[session_id] = written
+    _queue.put_nowait(
+        {
+            "session_id": session_id,
+            "message": message,
+            "metadata": metadata,
+            "created_at": datetime.utcnow(),
+            "written": written,
+        }
+    )
+    _extend_history(session_id, _UNWRITTEN_ID, message)
+    _metrics["queued_messages"] += 1
+
+
+async def _wait_written(session_id: int) -> None:
+    written = _unwritten.get(session_id)
+    if written is not None and not written.done():
+        _metrics["waits"] += 1
+        await asyncio.shield(written)
+
+
+async def _insert_batch(db: Database, batch: List[Dict[str, Any]]) -> List[int]:
+    """Insert queued messages and touch their sessions in one transaction."""
+    rows = [
+        _message_row(
+            item["session_id"],
+            item["message"].role,
+            item["message"].content,
+            item["metadata"],
+            item["created_at"],
         )
+        for item in batch
+    ]
+    # Two statements whatever the batch size: the write lock is held only briefly.
+    async with _write_transaction(db):
+        inserted = await db.fetch_all(insert(chat_messages).values(rows).returning(chat_messages.c.id))
+        await db.execute(
+            update(chat_sessions)
+            .where(chat_sessions.c.id.in_({item["session_id"] for item in batch}))
+            .values(updated_at=batch[-1]["created_at"])
+        )
+    # One statement numbers its rows in order.
+    return sorted(row["id"] for row in inserted)
+
+
+async def _write_with_retries(db: Database, batch: List[Dict[str, Any]]) -> List[Optional[int]]:
+    """Ids of the written messages, ``None`` for those that could not be stored.
+
+    The client already has its reply, so a failing batch is retried with backoff and
+    finally written one message at a time before anything is given up.
+    """
+    for delay in (*_WRITE_RETRY_DELAYS, None):
+        try:
+            return list(await _insert_batch(db, batch))
+        except Exception:  # pragma: no cover - keep the writer alive
+            if delay is None:
+                if len(batch) > 1:
+                    break
+                _metrics["write_failures"] += 1
+                logger.exception("Failed to write a chat message for session %s", batch[0]["session_id"])
+                return [None]
+            _metrics["write_retries"] += 1
+            logger.warning("Failed to write %d chat messages; retrying in %.1fs", len(batch), delay)
+            await asyncio.sleep(delay)
+    ids: List[Optional[int]] = []
+    for item in batch:
+        try:
+            ids.extend(await _insert_batch(db, [item]))
+        except Exception:  # pragma: no cover - keep the writer alive
+            _metrics["write_failures"] += 1
+            logger.exception("Failed to write a chat message for session %s", item["session_id"])
+            ids.append(None)
+    return ids
+
+
+async def _write_messages(db: Database, batch: List[Dict[str, Any]]) -> None:
+    started = time.perf_counter()
+    ids = await _write_with_retries(db, batch)
+    written = sum(message_id is not None for message_id in ids)
+    _metrics["written_messages"] += written
+    _metrics["write_batches"] += 1
+    _metrics["write_ms"] += (time.perf_counter() - started) * 1000
+    for item, stored_id in zip(batch, ids):
+        session_id = item["session_id"]
+        history = _histories.get(session_id) or []
+        for position, (message_id, message) in enumerate(history):
+            if message is item["message"]:
+                if stored_id is not None:
+                    history[position] = (stored_id, message)
+                else:
+                    # Not stored; do not serve it from memory either.
+                    del history[position]
+                break
+        item["written"].set_result(None)
+        if _unwritten.get(session_id) is item["written"]:
+            del _unwritten[session_id]
+
+
+async def _writer_loop(db: Database, queue: asyncio.Queue) -> None:
+    """Write whatever is queued as one batch; a ``None`` item ends the loop."""
+    while True:
+        first = await queue.get()
+        if first is None:
+            return
+        batch = [first]
+        stopping = False
+        while len(batch) < _WRITE_BATCH_SIZE and not queue.empty():
+            item = queue.get_nowait()
+            if item is None:
+                stopping = True
+                break
+            batch.append(item)
+        await _write_messages(db, batch)
+        if stopping:
+            return
+
+
+def start_writer(db: Database) -> None:
+    global _queue, _writer_task
+    if not get_settings().chat_write_behind_enabled or (_writer_task and not _writer_task.done()):
+        return
+    _queue = asyncio.Queue()
+    _writer_task = asyncio.create_task(_writer_loop(db, _queue))
+
+
+async def stop_writer(db: Database) -> None:
+    """Write the queued messages and stop the writer."""
+    global _queue, _writer_task
+    queue, task = _queue, _writer_task
+    # Later messages are written directly.
+    _queue, _writer_task = None, None
+    if queue is None or task is None:
+        return
+    if not task.done():
+        await queue.put(None)
+        await task
+        return
+    remaining = []
+    while not queue.empty():
+        item = queue.get_nowait()
+        if item is not None:
+            remaining.append(item)
+    for start in range(0, len(remaining), _WRITE_BATCH_SIZE):
+        await _write_messages(db, remaining[start : start + _WRITE_BATCH_SIZE])
+
+
+def _remember_history(session_id: int, history: List[Tuple[int, ChatMessagePayload]]) -> None:
+    _histories[session_id] = history
+    _histories.move_to_end(session_id)
+    while len(_histories) > get_settings().chat_history_cache_sessions:
+        _histories.popitem(last=False)
+        _metrics["history_evicted"] += 1
+
+
+async def load_history(
+    db: Database, session_id: int, *, after_id: Optional[int] = None
+) -> List[ChatMessagePayload]:
+    """The session's latest ``chat_history_max_messages`` messages, oldest first.
+
+    Read from the database once, then kept in memory and extended by new messages
+    while the session stays among the most recently used. ``after_id`` leaves out the
+    messages already folded into the session summary.
+    """
+    history = _histories.get(session_id)
+    if history is not None:
+        _metrics["history_hits"] += 1
+        _histories.move_to_end(session_id)
+    else:
+        _metrics["history_misses"] += 1
+        await _wait_written(session_id)
+        rows = await db.fetch_all(
+            select(chat_messages.c.id, chat_messages.c.role, chat_messages.c.content)
+            .where(chat_messages.c.session_id == session_id)
+            .order_by(chat_messages.c.created_at.desc(), chat_messages.c.id.desc())
+            .limit(get_settings().chat_history_max_messages)
+        )
+        history = [
+            (row["id"], ChatMessagePayload(role=row["role"], content=row["content"]))
+            for row in reversed(rows)
+        ]
+        _remember_history(session_id, history)
+    return [message for message_id, message in history if after_id is None or message_id > after_id]
+
+
+async def list_messages_after(
+    db: Database, session_id: int, after_id: Optional[int], *, limit: int
+) -> list[Dict[str, Any]]:
+    """Up to ``limit`` messages of a session following ``after_id``, oldest first."""
+    await _wait_written(session_id)
+    query = (
+        select(chat_messages.c.id, chat_messages.c.role, chat_messages.c.content)
+        .where(chat_messages.c.session_id == session_id)
+        .order_by(chat_messages.c.id)
+        .limit(limit)
     )
+    if after_id is not None:
+        query = query.where(chat_messages.c.id > after_id)
+    rows = await db.fetch_all(query)
+    return [dict(row) for row in rows]
+
+
+async def save_summary(
+    db: Database, session_id: int, *, summary: str, through_id: int, message_count: int
+) -> None:
     await db.execute(
         update(chat_sessions)
         .where(chat_sessions.c.id == session_id)
-        .values(updated_at=datetime.utcnow())
+        .values(
+            summary=summary,
+            summary_through_id=through_id,
+            summary_message_count=message_count,
+            summary_updated_at=datetime.utcnow(),
+            # Summarizing is not activity: keep the session's place in the recent list.
+            updated_at=chat_sessions.c.updated_at,
+        )
     )
 
 
 async def list_messages(db: Database, session_id: int) -> list[ChatMessagePayload]:
+    await _wait_written(session_id)
     rows = await db.fetch_all(
         select(chat_messages.c.role, chat_messages.c.content)
         .where(chat_messages.c.session_id == session_id)
@@ -108,6 +413,7 @@ async def get_session(db: Database, session_id: int, user_id: int):
 
 
 async def get_session_messages(db: Database, session_id: int):
+    await _wait_written(session_id)
     query = (
         select(
             chat_messages.c.role,
@@ -138,12 +444,10 @@ async def get_session_messages(db: Database, session_id: int):
     return result
 
 
-async def get_latest_task_code(db: Database, task_id: int, user_id: int) -> Optional[str]:
-    row = await db.fetch_one(
-        select(analysis_tasks.c.generated_code)
-        .where(analysis_tasks.c.id == task_id)
-        .where(analysis_tasks.c.user_id == user_id)
-    )
-    if row and row["generated_code"]:
-        return row["generated_code"]
-    return None
+def get_metrics() -> Dict[str, Any]:
+    return {
+        **_metrics,
+        "write_ms": round(_metrics["write_ms"], 2),
+        "cached_sessions": len(_histories),
+        "unwritten_messages": _queue.qsize() if _queue is not None else 0,
+    }
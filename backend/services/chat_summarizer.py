@@ -0,0 +1,190 @@
+import asyncio
+import contextlib
+import logging
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from databases import Database
+
+from ..config import get_settings
+from ..llm_adapters.factory import adapter_factory
+from . import chat_context, chat_service, provider_credentials_service, rate_limiter, usage_service
+from .rate_limiter import RateLimitExceeded
+from .tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_INSTRUCTIONS = """
+You maintain the running summary of a conversation between a user and an assistant
+that helps with a Python data-analysis script. Update the current summary with the new
+messages. Keep what later turns depend on: the user's goals, changes made or rejected,
+facts about the data, errors and open questions. Drop greetings and repetition.
+Reply with the updated summary only, as plain text, in at most {max_tokens} tokens.
+""".strip()
+
+_queue: Optional[asyncio.Queue] = None
+_worker_task: Optional[asyncio.Task] = None
+_pending: Set[int] = set()
+_metrics: Dict[str, Any] = {
+    "scheduled": 0,
+    "runs": 0,
+    "skipped": 0,
+    "deferred": 0,
+    "failures": 0,
+    "messages_folded": 0,
+    "tokens_folded": 0,
+    "summary_tokens": 0,
+    "last_latency_ms": None,
+}
+
+
+def schedule(session_id: int, user_id: int) -> None:
+    """Queue a threshold check for ``session_id``; never blocks or fails the request."""
+    if _queue is None or session_id in _pending:
+        return
+    _pending.add(session_id)
+    _queue.put_nowait((session_id, user_id))
+    _metrics["scheduled"] += 1
+
+
+def _message_tokens(row: Dict[str, Any]) -> int:
+    return chat_context.estimate_messages([row])
+
+
+def _select_batch(rows: List[Dict[str, Any]], *, window_full: bool) -> Tuple[List[Dict[str, Any]], int]:
+    """The oldest messages to fold this pass and the foldable tokens left after them."""
+    settings = get_settings()
+    # The newest messages stay verbatim; when the window is full they lie beyond it.
+    keep = 0 if window_full else settings.chat_summary_keep_messages
+    foldable = rows[: max(len(rows) - keep, 0)]
+    total = sum(_message_tokens(row) for row in foldable)
+    if total < settings.chat_summary_trigger_tokens:
+        return [], total
+    batch: List[Dict[str, Any]] = []
+    used = 0
+    for row in foldable:
+        cost = _message_tokens(row)
+        if batch and used + cost > settings.chat_summary_input_tokens:
+            break
+        batch.append(row)
+        used += cost
+    return batch, total - used
+
+
+def _render_transcript(rows: List[Dict[str, Any]]) -> str:
+    return "\n\n".join(f"{row['role'].capitalize()}: {row['content']}" for row in rows)
+
+
+async def summarize_session(db: Database, session_id: int, user_id: int) -> bool:
+    """Fold a session's older messages into its summary once they cross the threshold.
+
+    The existing summary is extended with the next messages after ``summary_through_id``
+    rather than rebuilt. Returns whether the summary changed.
+    """
+    settings = get_settings()
+    session = await chat_service.get_session(db, session_id, user_id)
+    if session is None or not settings.chat_summary_model:
+        return False
+    window = settings.chat_history_max_messages
+    rows = await chat_service.list_messages_after(
+        db, session_id, session["summary_through_id"], limit=window
+    )
+    batch, remaining = _select_batch(rows, window_full=len(rows) >= window)
+    if not batch:
+        _metrics["skipped"] += 1
+        return False
+
+    provider, _, variant = settings.chat_summary_model.partition(":")
+    stored_map = await provider_credentials_service.get_credentials_map(db, user_id)
+    stored = provider_credentials_service.credential_payloads_to_overrides(stored_map)
+    adapter = adapter_factory.get(provider, override=stored.get(provider))
+    current = session["summary"] or "(none yet)"
+    instructions = SUMMARY_INSTRUCTIONS.format(max_tokens=settings.chat_summary_max_tokens)
+    messages = [
+        {"role": "system", "content": instructions},
+        {
+            "role": "user",
+            "content": f"Current summary:\n{current}\n\nNew messages:\n{_render_transcript(batch)}",
+        },
+    ]
+    try:
+        reservation = await rate_limiter.acquire(
+            user_id,
+            adapter.name,
+            estimated_tokens=sum(estimate_tokens(message["content"]) for message in messages)
+            + settings.chat_summary_max_tokens,
+        )
+    except RateLimitExceeded:
+        # The next chat turn schedules the session again.
+        _metrics["deferred"] += 1
+        return False
+    started = time.perf_counter()
+    with reservation.released_on_error():
+        result = await adapter.chat(messages, model=variant or None)
+    latency_ms = (time.perf_counter() - started) * 1000
+    usage = result.get("usage")
+    reservation.settle(usage)
+    usage_service.record(
+        user_id=user_id,
+        provider=adapter.name,
+        model=settings.chat_summary_model,
+        endpoint="chat.summary",
+        usage=usage,
+        latency_ms=latency_ms,
+    )
+    summary = ((result.get("message") or {}).get("content") or "").strip()
+    if not summary:
+        _metrics["failures"] += 1
+        return False
+
+    await chat_service.save_summary(
+        db,
+        session_id,
+        summary=summary,
+        through_id=batch[-1]["id"],
+        message_count=session["summary_message_count"] + len(batch),
+    )
+    _metrics["runs"] += 1
+    _metrics["messages_folded"] += len(batch)
+    _metrics["tokens_folded"] += sum(_message_tokens(row) for row in batch)
+    _metrics["summary_tokens"] += estimate_tokens(summary)
+    _metrics["last_latency_ms"] = round(latency_ms, 1)
+    if remaining >= settings.chat_summary_trigger_tokens:
+        schedule(session_id, user_id)
+    return True
+
+
+async def _worker_loop(db: Database, queue: asyncio.Queue) -> None:
+    while True:
+        session_id, user_id = await queue.get()
+        _pending.discard(session_id)
+        try:
+            await summarize_session(db, session_id, user_id)
+        except Exception:  # pragma: no cover - keep the worker alive
+            _metrics["failures"] += 1
+            logger.exception("Summarizing chat session %s failed", session_id)
+
+
+def start_summarizer(db: Database) -> None:
+    global _queue, _worker_task
+    if not get_settings().chat_summary_model or (_worker_task and not _worker_task.done()):
+        return
+    _queue = asyncio.Queue()
+    _worker_task = asyncio.create_task(_worker_loop(db, _queue))
+
+
+async def stop_summarizer() -> None:
+    """Stop the worker; queued sessions are checked again after their next turn."""
+    global _queue, _worker_task
+    task = _worker_task
+    _queue, _worker_task = None, None
+    _pending.clear()
+    if task is None:
+        return
+    task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await task
+
+
+def get_metrics() -> Dict[str, Any]:
+    return {**_metrics, "queued": _queue.qsize() if _queue is not None else 0}
@@ -0,0 +1,123 @@
+import ast
+import asyncio
+import sys
+from typing import Any, Dict, List, Optional
+
+from ..config import get_settings
+from ..sandbox.runner import CodeExecutionError, run_python_code
+from . import dataset_service
+from .dataset_service import DatasetIngestError
+
+_STDERR_TAIL_LINES = 3
+
+_metrics: Dict[str, Any] = {
+    "requests": 0,
+    "candidates": 0,
+    "screened": 0,
+    "passed": 0,
+    "rejected": {"empty": 0, "syntax": 0, "imports": 0, "dataset": 0, "dry_run": 0},
+    "dry_runs": 0,
+    "cancelled": 0,
+    "no_valid_candidate": 0,
+    "winner_index": {},
+}
+
+
+def _imported_roots(tree: ast.AST) -> set[str]:
+    roots: set[str] = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            roots.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            roots.add(node.module.split(".")[0])
+    return roots
+
+
+def _mentions(tree: ast.AST, name: str) -> bool:
+    return any(isinstance(node, ast.Constant) and node.value == name for node in ast.walk(tree))
+
+
+def screen_code(code: str, *, expects_dataset: bool) -> List[str]:
+    """Static checks that catch most scripts that would fail straight away.
+
+    Returns the problems found; an empty list means the script is worth running. The
+    import check allows the standard library plus ``code_screen_allowed_modules``
+    (what the sandbox has installed).
+    """
+    _metrics["screened"] += 1
+    problems: List[str] = []
+    if not code.strip():
+        _metrics["rejected"]["empty"] += 1
+        return ["No code was generated."]
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as exc:
+        _metrics["rejected"]["syntax"] += 1
+        return [f"Syntax error on line {exc.lineno}: {exc.msg}"]
+    allowed = set(sys.stdlib_module_names) | set(get_settings().code_screen_allowed_modules)
+    unknown = sorted(_imported_roots(tree) - allowed)
+    if unknown:
+        _metrics["rejected"]["imports"] += 1
+        problems.append("Imports modules the sandbox does not provide: " + ", ".join(unknown))
+    if expects_dataset and not _mentions(tree, "DATASET_PATH"):
+        _metrics["rejected"]["dataset"] += 1
+        problems.append("Does not load the dataset from DATASET_PATH.")
+    if not problems:
+        _metrics["passed"] += 1
+    return problems
+
+
+async def dry_run(code: str, *, dataset_filename: str, user_id: int) -> Optional[str]:
+    """Run ``code`` against the first rows of the dataset with a short timeout.
+
+    Returns a short error description, or ``None`` when the script exits cleanly.
+    """
+    settings = get_settings()
+    _metrics["dry_runs"] += 1
+    try:
+        source = dataset_service.resolve_user_dataset(dataset_filename, user_id)
+    except DatasetIngestError as exc:
+        return str(exc)
+    if source is None:
+        return "Dataset not found."
+    sample = await asyncio.to_thread(
+        dataset_service.ensure_sample, source, settings.llm_candidate_dry_run_rows
+    )
+    try:
+        run = await run_python_code(
+            code,
+            dataset_filename=str(sample.relative_to(settings.upload_dir)),
+            user_id=user_id,
+            timeout=settings.llm_candidate_dry_run_timeout_seconds,
+            collect_artifacts=False,
+        )
+    except CodeExecutionError as exc:
+        _metrics["rejected"]["dry_run"] += 1
+        return str(exc)
+    if run["returncode"] == 0:
+        return None
+    _metrics["rejected"]["dry_run"] += 1
+    tail = [line for line in run["stderr"].splitlines() if line.strip()][-_STDERR_TAIL_LINES:]
+    return "\n".join(tail) or f"Exited with status {run['returncode']}."
+
+
+def record_request(candidates: int) -> None:
+    _metrics["requests"] += 1
+    _metrics["candidates"] += candidates
+
+
+def record_outcome(winner_index: Optional[int], cancelled: int) -> None:
+    _metrics["cancelled"] += cancelled
+    if winner_index is None:
+        _metrics["no_valid_candidate"] += 1
+        return
+    key = str(winner_index)
+    _metrics["winner_index"][key] = _metrics["winner_index"].get(key, 0) + 1
+
+
+def get_metrics() -> Dict[str, Any]:
+    return {
+        **_metrics,
+        "rejected": dict(_metrics["rejected"]),
+        "winner_index": dict(_metrics["winner_index"]),
+    }
@@ -0,0 +1,181 @@
+import asyncio
+import csv
+import hashlib
+import io
+import json
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config import get_settings
+from . import dataset_service, storage_service
+from .tokens import estimate_tokens, match_model_budget
+
+_CONTEXT_CACHE_SIZE = 128
+_context_cache: "OrderedDict[Tuple[str, int, str, int], str]" = OrderedDict()
+
+# Stratify the sample on the first text column with a handful of categories so that
+# rare groups still show up in the few rows that fit the budget.
+_STRATA_MIN = 2
+_STRATA_MAX = 20
+
+
+def resolve_token_budget(model: str) -> Tuple[str, int]:
+    """Map a ``provider:model`` string to its model family and context token budget."""
+    return match_model_budget(model, get_settings().dataset_context_token_budgets, 1200)
+
+
+def _format_number(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:.4g}"
+    return str(value)
+
+
+def _describe_column(column: Dict[str, Any]) -> str:
+    parts = [f"- {column['name']} ({column['dtype']})"]
+    if column.get("nulls"):
+        parts.append(f"nulls={column['nulls']}")
+    if "mean" in column:
+        parts.append(
+            "min={min} max={max} mean={mean} std={std}".format(
+                **{key: _format_number(column[key]) for key in ("min", "max", "mean", "std")}
+            )
+        )
+    elif column.get("top"):
+        if column.get("distinct") is not None:
+            parts.append(f"distinct={column['distinct']}")
+        if column["top"][0][1] <= 1:
+            parts.append("mostly unique values")
+            return " ".join(parts)
+        top = ", ".join(f"{value!r}×{count}" for value, count in column["top"])
+        parts.append(f"top: {top}")
+    return " ".join(parts)
+
+
+def _stratified_order(profile: Dict[str, Any]) -> Tuple[List[List[Any]], Optional[str]]:
+    """Interleave reservoir rows round-robin across the strata of one categorical column."""
+    sample = profile.get("sample") or []
+    for index, column in enumerate(profile.get("columns", [])):
+        distinct = column.get("distinct")
+        if "mean" in column or distinct is None or not (_STRATA_MIN <= distinct <= _STRATA_MAX):
+            continue
+        groups: "OrderedDict[Any, List[List[Any]]]" = OrderedDict()
+        for row in sample:
+            groups.setdefault(row[index] if index < len(row) else None, []).append(row)
+        ordered: List[List[Any]] = []
+        while any(groups.values()):
+            for rows in groups.values():
+                if rows:
+                    ordered.append(rows.pop(0))
+        return ordered, column["name"]
+    return list(sample), None
+
+
+def _csv_line(values: List[Any]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="").writerow(
+        ["" if value is None else _format_number(value) for value in values]
+    )
+    return buffer.getvalue()
+
+
+def build_dataset_context(profile: Dict[str, Any], *, filename: str, token_budget: int) -> str:
+    """Assemble schema, statistics and sample rows, most informative first, within budget."""
+    columns = profile.get("columns", [])
+    lines = [
+        f"Dataset file: {filename} ({profile.get('rows', 0)} rows x {len(columns)} columns)",
+        "The sandbox exposes this file through the DATASET_PATH environment variable.",
+        "Columns:",
+    ]
+    used = estimate_tokens("\n".join(lines))
+
+    for position, column in enumerate(columns):
+        line = _describe_column(column)
+        cost = estimate_tokens(line) + 1
+        if used + cost > token_budget:
+            remaining = [item["name"] for item in columns[position:]]
+            names_line = "- (statistics omitted) " + ", ".join(remaining)
+            if used + estimate_tokens(names_line) + 1 <= token_budget:
+                lines.append(names_line)
+            else:
+                lines.append(f"- ... {len(remaining)} more columns omitted")
+            return "\n".join(lines)
+        lines.append(line)
+        used += cost
+
+    rows, strata = _stratified_order(profile)
+    if not rows:
+        return "\n".join(lines)
+    heading = "Sample rows (random sample" + (f", stratified by {strata}" if strata else "") + "):"
+    header = _csv_line([column["name"] for column in columns])
+    used += estimate_tokens(heading) + estimate_tokens(header) + 2
+    sample_lines: List[str] = []
+    for row in rows:
+        line = _csv_line(row)
+        cost = estimate_tokens(line) + 1
+        if used + cost > token_budget:
+            break
+        sample_lines.append(line)
+        used += cost
+    if sample_lines:
+        lines.extend([heading, header, *sample_lines])
+    return "\n".join(lines)
+
+
+def _cache_get(key: Tuple[str, int, str, int]) -> Optional[str]:
+    cached = _context_cache.get(key)
+    if cached is not None:
+        _context_cache.move_to_end(key)
+    return cached
+
+
+def _cache_put(key: Tuple[str, int, str, int], value: str) -> None:
+    _context_cache[key] = value
+    _context_cache.move_to_end(key)
+    while len(_context_cache) > _CONTEXT_CACHE_SIZE:
+        _context_cache.popitem(last=False)
+
+
+def _build_for_path(path: Path, dataset_filename: str, token_budget: int) -> str:
+    profile = dataset_service.load_profile(path)
+    return build_dataset_context(profile, filename=dataset_filename, token_budget=token_budget)
+
+
+async def get_dataset_context(dataset_filename: str, *, user_id: int, model: str) -> Optional[str]:
+    """Return a cached, budget-fitted context for an uploaded dataset, or ``None`` if missing."""
+    path = dataset_service.resolve_user_dataset(dataset_filename, user_id)
+    if path is None:
+        return None
+    storage_service.touch(path)
+    family, token_budget = resolve_token_budget(model)
+    key = (str(path.resolve()), path.stat().st_mtime_ns, family, token_budget)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+    # Profiling may scan the whole file the first time; keep it off the event loop.
+    context = await asyncio.to_thread(_build_for_path, path, dataset_filename, token_budget)
+    _cache_put(key, context)
+    return context
+
+
+def schema_fingerprint(profile: Dict[str, Any]) -> str:
+    """Stable hash of a profile's column names and dtypes, ignoring the data itself."""
+    columns = [[column["name"], column["dtype"]] for column in profile.get("columns", [])]
+    return hashlib.sha256(json.dumps(columns, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+async def get_schema_fingerprint(
+    dataset_filename: Optional[str], *, user_id: int, dataset_context: Optional[str] = None
+) -> str:
+    """Fingerprint the dataset a prompt targets so cached answers never cross schemas.
+
+    Falls back to hashing client-supplied context text, or ``"none"`` without a dataset.
+    """
+    if dataset_filename:
+        path = dataset_service.resolve_user_dataset(dataset_filename, user_id)
+        if path is not None:
+            profile = await asyncio.to_thread(dataset_service.load_profile, path)
+            return schema_fingerprint(profile)
+    if dataset_context:
+        return hashlib.sha256(dataset_context.strip().encode("utf-8")).hexdigest()
+    return "none"
@@ -0,0 +1,480 @@
+import asyncio
+import contextlib
+import json
+import os
+import tempfile
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from fastapi import UploadFile
+
+from ..config import get_settings
+from ..sandbox.runner import CodeExecutionError, _resolve_dataset_source
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pa_parquet
+except ImportError:  # pragma: no cover - columnar uploads disabled without pyarrow
+    pa = None
+    pa_ipc = None
+    pa_parquet = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - .zst uploads disabled without zstandard
+    zstandard = None
+
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+DECOMPRESS_PIECE_BYTES = 1024 * 1024
+PREVIEW_ROWS = 500
+
+PROFILE_SUFFIX = ".profile.json"
+# First rows of a dataset as CSV, for quick sandbox dry runs of generated scripts.
+SAMPLE_SUFFIX = ".sample.csv"
+PROFILE_CHUNK_ROWS = 50_000
+PROFILE_SAMPLE_ROWS = 200
+PROFILE_TOP_VALUES = 5
+# Bound the per-column value counter so high-cardinality text columns stay cheap.
+_MAX_TRACKED_VALUES = 5_000
+_TRACKED_VALUES_AFTER_PRUNE = 1_000
+
+# Compressed CSV extensions mapped to their codec. They are decompressed while the
+# upload streams to disk so the sandbox and pandas only ever see plain CSV.
+COMPRESSED_CSV_EXTENSIONS: Dict[str, str] = {
+    "csv.gz": "gzip",
+    "gz": "gzip",
+    "csv.zst": "zstd",
+    "zst": "zstd",
+}
+COLUMNAR_EXTENSIONS = {"parquet", "feather"}
+EXCEL_EXTENSIONS = {"xlsx", "xls"}
+
+
+class DatasetIngestError(ValueError):
+    """Raised when an uploaded dataset cannot be stored or inspected."""
+
+
+def detect_extension(filename: str, allowed: Iterable[str]) -> Optional[str]:
+    """Return the longest allowed extension matching ``filename`` (e.g. ``csv.gz``)."""
+    lowered = filename.lower()
+    for extension in sorted(allowed, key=len, reverse=True):
+        if lowered.endswith("." + extension.lower().lstrip(".")):
+            return extension.lower().lstrip(".")
+    return None
+
+
+def stored_filename(original: str, extension: str) -> str:
+    """Name under which the upload is stored; compressed CSV drops its codec suffix."""
+    name = Path(original).name
+    if extension not in COMPRESSED_CSV_EXTENSIONS:
+        return name
+    stem = name[: -(len(extension) + 1)]
+    return stem if stem.lower().endswith(".csv") else f"{stem}.csv"
+
+
+class _CsvSink:
+    """Writes upload chunks to an open file, decompressing them in bounded pieces.
+
+    Each piece is at most ``DECOMPRESS_PIECE_BYTES``, so a small compressed chunk that
+    expands enormously never materializes in memory, and the expanded size is checked
+    against ``limit`` as it grows. Concatenated gzip members and zstd frames are handled.
+    Newlines are counted on the way through for the row count.
+    """
+
+    def __init__(self, fh: BinaryIO, codec: Optional[str], limit: int):
+        if codec == "zstd" and zstandard is None:
+            raise DatasetIngestError("Zstandard uploads require the 'zstandard' package.")
+        self.codec = codec
+        self.limit = limit
+        self.written = 0
+        self.newlines = 0
+        self.last_byte = b""
+        self._fh = fh
+        # Whether the current gzip member has been fed input it has not finished.
+        self._member_open = False
+        if codec == "gzip":
+            self._obj = self._new_gzip()
+        elif codec == "zstd":
+            self._obj = zstandard.ZstdDecompressor().stream_writer(
+                _PieceWriter(self._emit), write_size=DECOMPRESS_PIECE_BYTES, closefd=False
+            )
+            self._frames = _ZstdFrames()
+
+    @staticmethod
+    def _new_gzip():
+        # 32 + MAX_WBITS lets zlib auto-detect the gzip header.
+        return zlib.decompressobj(32 + zlib.MAX_WBITS)
+
+    def write(self, data: bytes) -> None:
+        if self.codec is None:
+            self._emit(data)
+            return
+        try:
+            if self.codec == "gzip":
+                self._feed_gzip(data)
+            else:
+                self._frames.feed(data)
+                self._obj.write(data)
+        except DatasetIngestError:
+            raise
+        except Exception as exc:  # zlib.error / zstandard.ZstdError
+            raise DatasetIngestError(f"Corrupt {self.codec} stream: {exc}") from exc
+
+    def _feed_gzip(self, data: bytes) -> None:
+        while data:
+            self._member_open = True
+            self._emit(self._obj.decompress(data, DECOMPRESS_PIECE_BYTES))
+            if self._obj.eof:
+                data = self._obj.unused_data
+                self._obj = self._new_gzip()
+                self._member_open = False
+            else:
+                data = self._obj.unconsumed_tail
+
+    def close(self) -> None:
+        """Flush the decompressor; a stream that stops inside a gzip member or zstd frame
+        is rejected rather than stored as a silently shortened CSV."""
+        if self.codec == "gzip":
+            self._emit(self._obj.flush())
+            if self._member_open and not self._obj.eof:
+                raise DatasetIngestError("Truncated gzip stream")
+        elif self.codec == "zstd":
+            self._obj.flush()
+            if not self._frames.at_boundary:
+                raise DatasetIngestError("Truncated zstd stream")
+
+    def _emit(self, piece: bytes) -> None:
+        if not piece:
+            return
+        self.written += len(piece)
+        if self.codec is not None and self.written > self.limit:
+            raise DatasetIngestError(
+                f"Decompressed dataset exceeds the {self.limit // (1024 * 1024)} MB limit."
+            )
+        self._fh.write(piece)
+        self.newlines += piece.count(b"\n")
+        self.last_byte = piece[-1:]
+
+
+class _ZstdFrames:
+    """Follows zstd frame boundaries (RFC 8878) from block headers alone.
+
+    zstandard's stream writer accepts a stream cut off mid-frame without complaint, and
+    telling one apart only needs the frame and block headers, not a second decode.
+    """
+
+    _NEEDS = {"magic": 4, "skippable": 4, "descriptor": 1, "block": 3}
+
+    def __init__(self) -> None:
+        self._state = "magic"
+        self._pending = b""
+        self._skip = 0
+        self._checksum = False
+
+    @property
+    def at_boundary(self) -> bool:
+        return self._state == "magic" and not self._pending and not self._skip
+
+    def feed(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            if self._skip:
+                step = min(self._skip, len(view))
+                self._skip -= step
+                view = view[step:]
+                continue
+            take = self._NEEDS[self._state] - len(self._pending)
+            self._pending += bytes(view[:take])
+            view = view[take:]
+            if len(self._pending) == self._NEEDS[self._state]:
+                header, self._pending = self._pending, b""
+                self._advance(int.from_bytes(header, "little"))
+
+    def _advance(self, value: int) -> None:
+        if self._state == "magic":
+            if value == 0xFD2FB528:
+                self._state = "descriptor"
+            elif value & 0xFFFFFFF0 == 0x184D2A50:
+                self._state = "skippable"
+            else:
+                raise DatasetIngestError("Corrupt zstd stream: unknown frame magic")
+        elif self._state == "skippable":
+            self._skip, self._state = value, "magic"
+        elif self._state == "descriptor":
+            single_segment = bool(value & 0x20)
+            self._checksum = bool(value & 0x04)
+            content_size = (1 if single_segment else 0, 2, 4, 8)[value >> 6]
+            self._skip = (0 if single_segment else 1) + (0, 1, 2, 4)[value & 0x03] + content_size
+            self._state = "block"
+        else:
+            block_type, size = (value >> 1) & 0x03, value >> 3
+            self._skip = 1 if block_type == 1 else size
+            if value & 0x01:
+                self._skip += 4 if self._checksum else 0
+                self._state = "magic"
+
+
+class _PieceWriter:
+    """File-like target for zstandard's stream writer that hands each piece on."""
+
+    def __init__(self, emit):
+        self.write = emit
+
+
+async def store_upload(file: UploadFile, destination: Path, extension: str) -> Optional[int]:
+    """Stream an upload to ``destination`` and return its CSV data-row count when known.
+
+    Compressed CSV is decompressed chunk by chunk in a worker thread, so neither the
+    compressed nor the expanded payload is ever held in memory and the event loop stays
+    free. Newlines are counted on the way through, which spares a second pass over the
+    file for the row count.
+    """
+    codec = COMPRESSED_CSV_EXTENSIONS.get(extension)
+    count_lines = codec is not None or extension == "csv"
+    limit = get_settings().upload_max_decompressed_mb * 1024 * 1024
+    with destination.open("wb") as fh:
+        sink = _CsvSink(fh, codec, limit)
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            await asyncio.to_thread(sink.write, chunk)
+        sink.close()
+    if not count_lines:
+        return None
+    total_lines = sink.newlines + (1 if sink.last_byte and sink.last_byte != b"\n" else 0)
+    # subtract header row if present (at least one row read)
+    return max(total_lines - 1, 0)
+
+
+def _arrow_schema_preview(schema: Any) -> Dict[str, str]:
+    # An empty table converts without reading any data and yields pandas dtypes,
+    # keeping the schema format identical to CSV/Excel uploads.
+    empty = schema.empty_table().to_pandas()
+    return {str(col): str(dtype) for col, dtype in empty.dtypes.items()}
+
+
+def inspect_parquet(path: Path) -> Tuple[pd.DataFrame, Dict[str, str], int]:
+    """Read schema and row count from the Parquet footer plus a small leading preview."""
+    if pa_parquet is None:
+        raise DatasetIngestError("Parquet uploads require the 'pyarrow' package.")
+    parquet_file = pa_parquet.ParquetFile(path)
+    schema = parquet_file.schema_arrow
+    try:
+        first_batch = next(parquet_file.iter_batches(batch_size=PREVIEW_ROWS))
+        preview_df = first_batch.to_pandas()
+    except StopIteration:
+        preview_df = schema.empty_table().to_pandas()
+    return preview_df, _arrow_schema_preview(schema), parquet_file.metadata.num_rows
+
+
+def inspect_feather(path: Path) -> Tuple[pd.DataFrame, Dict[str, str], int]:
+    """Read schema and row count from the Arrow IPC footer of a memory-mapped Feather file."""
+    if pa_ipc is None:
+        raise DatasetIngestError("Feather uploads require the 'pyarrow' package.")
+    with pa.memory_map(str(path)) as source:
+        reader = pa_ipc.open_file(source)
+        schema = reader.schema
+        count_rows = getattr(reader, "count_rows", None)
+        if count_rows is not None:
+            total_rows = count_rows()
+        else:
+            total_rows = sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+        preview_df = (
+            reader.get_batch(0).slice(0, PREVIEW_ROWS).to_pandas()
+            if reader.num_record_batches
+            else schema.empty_table().to_pandas()
+        )
+    return preview_df, _arrow_schema_preview(schema), total_rows
+
+
+def resolve_user_dataset(dataset_filename: str, user_id: Optional[int]) -> Optional[Path]:
+    """Locate an uploaded dataset for ``user_id`` using the sandbox's access rules."""
+    try:
+        return _resolve_dataset_source(dataset_filename, get_settings().upload_dir, user_id)
+    except CodeExecutionError as exc:
+        raise DatasetIngestError(str(exc)) from exc
+
+
+def profile_path(dataset_path: Path) -> Path:
+    return dataset_path.with_name(dataset_path.name + PROFILE_SUFFIX)
+
+
+def sample_path(dataset_path: Path) -> Path:
+    return dataset_path.with_name(dataset_path.name + SAMPLE_SUFFIX)
+
+
+def iter_dataset_chunks(path: Path, chunk_rows: int = PROFILE_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Yield the dataset in bounded DataFrame chunks regardless of its storage format."""
+    suffix = path.suffix.lower().lstrip(".")
+    if suffix == "parquet":
+        if pa_parquet is None:
+            raise DatasetIngestError("Parquet uploads require the 'pyarrow' package.")
+        for batch in pa_parquet.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    elif suffix == "feather":
+        if pa_ipc is None:
+            raise DatasetIngestError("Feather uploads require the 'pyarrow' package.")
+        with pa.memory_map(str(path)) as source:
+            reader = pa_ipc.open_file(source)
+            for index in range(reader.num_record_batches):
+                yield reader.get_batch(index).to_pandas()
+    elif suffix in EXCEL_EXTENSIONS:
+        yield pd.read_excel(path)
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+
+
+class _ColumnProfile:
+    def __init__(self, name: str, dtype: str, numeric: bool):
+        self.name = name
+        self.dtype = dtype
+        self.numeric = numeric
+        self.count = 0
+        self.nulls = 0
+        self.minimum: Any = None
+        self.maximum: Any = None
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.values: Counter = Counter()
+        self.values_truncated = False
+
+    def update(self, series: pd.Series) -> None:
+        non_null = series.dropna()
+        self.nulls += int(len(series) - len(non_null))
+        self.count += int(len(non_null))
+        if non_null.empty:
+            return
+        if self.numeric:
+            as_float = pd.to_numeric(non_null, errors="coerce").astype("float64")
+            if as_float.isna().any():
+                self._demote()
+        if self.numeric:
+            self.total += float(as_float.sum())
+            self.total_sq += float((as_float * as_float).sum())
+            low, high = as_float.min(), as_float.max()
+            self.minimum = low if self.minimum is None else min(self.minimum, low)
+            self.maximum = high if self.maximum is None else max(self.maximum, high)
+            return
+        self.values.update(non_null.astype(str).value_counts().to_dict())
+        if len(self.values) > _MAX_TRACKED_VALUES:
+            self.values = Counter(dict(self.values.most_common(_TRACKED_VALUES_AFTER_PRUNE)))
+            self.values_truncated = True
+
+    def _demote(self) -> None:
+        """Switch to text statistics once a column typed numeric from its first chunks
+        holds other values, as pandas would type it reading the whole file. Numbers seen
+        before the switch are not in the value counts."""
+        self.numeric = False
+        self.dtype = "object"
+        self.values_truncated = self.minimum is not None
+        self.minimum = self.maximum = None
+        self.total = self.total_sq = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {
+            "name": self.name,
+            "dtype": self.dtype,
+            "count": self.count,
+            "nulls": self.nulls,
+        }
+        if self.numeric:
+            if self.count:
+                mean = self.total / self.count
+                variance = max(self.total_sq / self.count - mean * mean, 0.0)
+                result.update(
+                    min=float(self.minimum),
+                    max=float(self.maximum),
+                    mean=mean,
+                    std=variance ** 0.5,
+                )
+            return result
+        result["distinct"] = None if self.values_truncated else len(self.values)
+        result["top"] = [[value, count] for value, count in self.values.most_common(PROFILE_TOP_VALUES)]
+        return result
+
+
+def _is_numeric(series: pd.Series) -> bool:
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+
+def build_profile(path: Path, *, sample_rows: int = PROFILE_SAMPLE_ROWS) -> Dict[str, Any]:
+    """Compute column statistics and a uniform reservoir sample in one pass over the data."""
+    columns: Dict[str, _ColumnProfile] = {}
+    reservoir: List[Optional[List[Any]]] = [None] * sample_rows
+    rng = np.random.default_rng(zlib.crc32(path.name.encode("utf-8")))
+    seen = 0
+
+    for chunk in iter_dataset_chunks(path):
+        for name in chunk.columns:
+            key = str(name)
+            if key not in columns:
+                columns[key] = _ColumnProfile(key, str(chunk[name].dtype), _is_numeric(chunk[name]))
+            columns[key].update(chunk[name])
+
+        # Algorithm R, vectorised per chunk: row i replaces slot j ~ U[0, i] when j < k.
+        size = len(chunk)
+        if size and sample_rows:
+            positions = np.arange(seen, seen + size)
+            slots = np.where(
+                positions < sample_rows,
+                positions,
+                (rng.random(size) * (positions + 1)).astype(np.int64),
+            )
+            chosen = np.flatnonzero(slots < sample_rows)
+            if chosen.size:
+                rows = chunk.iloc[chosen].astype(object).where(chunk.iloc[chosen].notna(), None)
+                for slot, row in zip(slots[chosen], rows.itertuples(index=False, name=None)):
+                    reservoir[int(slot)] = list(row)
+        seen += size
+
+    return {
+        "source_mtime_ns": path.stat().st_mtime_ns,
+        "rows": seen,
+        "columns": [column.to_dict() for column in columns.values()],
+        "sample": [row for row in reservoir if row is not None],
+    }
+
+
+def load_profile(path: Path) -> Dict[str, Any]:
+    """Return the stored profile for ``path``, rebuilding it when missing or stale."""
+    sidecar = profile_path(path)
+    mtime_ns = path.stat().st_mtime_ns
+    if sidecar.exists():
+        try:
+            cached = json.loads(sidecar.read_text("utf-8"))
+            if cached.get("source_mtime_ns") == mtime_ns:
+                return cached
+        except (OSError, json.JSONDecodeError):
+            pass
+    profile = build_profile(path)
+    # Write aside and rename, so a concurrent reader never sees a half-written sidecar.
+    fd, partial = tempfile.mkstemp(dir=sidecar.parent, prefix=sidecar.name, suffix=".part")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(profile, fh, default=str, ensure_ascii=False)
+        os.replace(partial, sidecar)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(partial)
+        raise
+    return profile
+
+
+def ensure_sample(path: Path, rows: int) -> Path:
+    """Return a CSV of the first ``rows`` rows of ``path``, rewriting it when stale."""
+    sidecar = sample_path(path)
+    if sidecar.exists() and sidecar.stat().st_mtime_ns >= path.stat().st_mtime_ns:
+        return sidecar
+    chunk = next(iter_dataset_chunks(path, chunk_rows=rows), None)
+    frame = chunk.head(rows) if chunk is not None else pd.DataFrame()
+    partial = sidecar.with_name(sidecar.name + ".part")
+    frame.to_csv(partial, index=False)
+    partial.replace(sidecar)
+    return sidecar
@@ -0,0 +1,210 @@
+import json
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_ESCAPES = {
+    '"': '"',
+    "'": "'",
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+# The body of a string up to its closing quote (or the end of the chunk): runs of plain
+# characters and complete two-character escapes.
+_STRING_BODIES = {
+    '"': re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL),
+    "'": re.compile(r"[^'\\]*(?:\\.[^'\\]*)*", re.DOTALL),
+}
+# A high surrogate at the end of a chunk may pair with a low one in the next.
+_HIGH_SURROGATE_TAIL = re.compile(r"\\u[dD][89abAB][0-9a-fA-F]{2}$")
+# Fields are read from the top-level object and one level down ({"output": {"code": ...}}).
+_MAX_FIELD_DEPTH = 2
+
+
+class JsonFieldStream:
+    """Single-pass extraction of string fields from a JSON object that arrives in chunks.
+
+    ``feed`` consumes the next chunk and returns the newly decoded text of each wanted
+    field, so callers can forward ``code`` as it is written. Anything before the first
+    ``{`` (prose, Markdown fences) is skipped, strings may use single quotes (Python
+    dict output), raw newlines inside strings are accepted, and escapes split across
+    chunks are held back until complete. An object that closes without a non-empty
+    wanted field is ignored and scanning moves on to the next one.
+    """
+
+    def __init__(self, fields: Iterable[str] = ("code", "reasoning")):
+        self.fields = frozenset(fields)
+        self.values: Dict[str, str] = {}
+        self.done = False
+        self._pending = ""
+        self._stack: List[str] = []
+        self._expect_key = False
+        self._key: Optional[str] = None
+        self._quote: Optional[str] = None
+        self._is_key = False
+        self._target: Optional[str] = None
+        self._parts: List[str] = []
+
+    def value(self, field: str) -> Optional[str]:
+        """The field's decoded value, including a partial one cut off by the end of input."""
+        if self._target == field and self._quote:
+            return "".join(self._parts)
+        return self.values.get(field)
+
+    def feed(self, chunk: str) -> Dict[str, str]:
+        deltas: Dict[str, List[str]] = {}
+        if self.done or not chunk:
+            return {}
+        text = self._pending + chunk if self._pending else chunk
+        self._pending = ""
+        index, end = 0, len(text)
+        stack = self._stack
+        while index < end and not self.done:
+            if self._quote:
+                index = self._scan_string(text, index, deltas)
+                continue
+            if not stack:
+                start = text.find("{", index)
+                if start < 0:
+                    break
+                stack.append("{")
+                self._expect_key = True
+                index = start + 1
+                continue
+            char = text[index]
+            if char == '"' or char == "'":
+                self._open_string(char)
+            elif char == "{" or char == "[":
+                stack.append(char)
+                self._expect_key = char == "{"
+            elif char == "}" or char == "]":
+                stack.pop()
+                self._expect_key = False
+                if not stack:
+                    if any(value.strip() for value in self.values.values()):
+                        self.done = True
+                    else:
+                        self.values.clear()
+            elif char == ":":
+                self._expect_key = False
+            elif char == ",":
+                self._expect_key = stack[-1] == "{"
+            index += 1
+        return {field: "".join(parts) for field, parts in deltas.items()}
+
+    def finish(self) -> Dict[str, str]:
+        """Flush an escape sequence left incomplete by the end of the stream."""
+        deltas: Dict[str, List[str]] = {}
+        if self._pending and self._quote:
+            self._append(self._pending, deltas)
+        self._pending = ""
+        return {field: "".join(parts) for field, parts in deltas.items()}
+
+    def _open_string(self, quote: str) -> None:
+        self._quote = quote
+        self._parts = []
+        in_object = self._stack[-1] == "{"
+        self._is_key = in_object and self._expect_key
+        self._target = None
+        if (
+            in_object
+            and not self._is_key
+            and self._key in self.fields
+            and len(self._stack) <= _MAX_FIELD_DEPTH
+            and not (self.values.get(self._key) or "").strip()
+        ):
+            self._target = self._key
+
+    def _close_string(self) -> None:
+        value = "".join(self._parts)
+        if self._is_key:
+            self._key = value
+        elif self._target:
+            self.values[self._target] = value
+        self._quote = None
+        self._target = None
+        self._parts = []
+
+    def _append(self, text: str, deltas: Dict[str, List[str]]) -> None:
+        self._parts.append(text)
+        if self._target:
+            deltas.setdefault(self._target, []).append(text)
+
+    def _scan_string(self, text: str, index: int, deltas: Dict[str, List[str]]) -> int:
+        stop = _STRING_BODIES[self._quote].match(text, index).end()  # type: ignore[index, union-attr]
+        if stop > index:
+            self._decode(text[index:stop], deltas)
+        if stop >= len(text):
+            return stop
+        if text[stop] == "\\":
+            # A trailing backslash: wait for the character it escapes.
+            self._pending += text[stop:]
+            return len(text)
+        self._close_string()
+        return stop + 1
+
+    def _decode(self, segment: str, deltas: Dict[str, List[str]]) -> None:
+        if "\\" not in segment:
+            self._append(segment, deltas)
+            return
+        if self._quote == '"' and not _HIGH_SURROGATE_TAIL.search(segment):
+            try:
+                # The C decoder handles the common case; it rejects a \u escape cut off
+                # at the chunk boundary, which the loop below holds back instead.
+                self._append(json.loads(f'"{segment}"', strict=False), deltas)
+                return
+            except ValueError:
+                pass
+        self._append(self._decode_escapes(segment), deltas)
+
+    def _decode_escapes(self, segment: str) -> str:
+        decoded: List[str] = []
+        index, end = 0, len(segment)
+        while index < end:
+            position = segment.find("\\", index)
+            if position < 0:
+                decoded.append(segment[index:])
+                break
+            decoded.append(segment[index:position])
+            escape = segment[position + 1]
+            if escape != "u":
+                decoded.append(_ESCAPES.get(escape, "\\" + escape))
+                index = position + 2
+                continue
+            text, consumed = self._decode_unicode(segment, position)
+            if consumed == 0:
+                self._pending = segment[position:]
+                break
+            decoded.append(text)
+            index = position + consumed
+        return "".join(decoded)
+
+    @staticmethod
+    def _decode_unicode(text: str, position: int) -> Tuple[str, int]:
+        """Decode ``\\uXXXX`` (and a following low surrogate) at ``position``.
+
+        Returns the text and the number of characters used, or ``("", 0)`` when more
+        input is needed.
+        """
+        end = len(text)
+        if position + 6 > end:
+            return "", 0
+        try:
+            code = int(text[position + 2 : position + 6], 16)
+        except ValueError:
+            return text[position : position + 2], 2
+        if 0xD800 <= code < 0xDC00:
+            if position + 12 > end:
+                return "", 0
+            if text[position + 6 : position + 8] == "\\u":
+                try:
+                    low = int(text[position + 8 : position + 12], 16)
+                except ValueError:
+                    low = 0
+                if 0xDC00 <= low < 0xE000:
+                    return chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)), 12
+        return chr(code), 6
@@ -0,0 +1,185 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import unicodedata
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from databases import Database
+from sqlalchemy import delete, func, select, update
+
+from ..config import get_settings
+from ..database import upsert_insert
+from ..models.llm_cache import llm_response_cache
+
+logger = logging.getLogger(__name__)
+
+_metrics: Dict[str, Any] = {
+    "hits": 0,
+    "misses": 0,
+    "bypassed": 0,
+    "stores": 0,
+    "evicted": 0,
+    "errors": 0,
+    "latency_saved_ms": 0.0,
+}
+_pruner_task: Optional[asyncio.Task] = None
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Canonicalize Unicode, line endings, trailing whitespace and blank lines for keying."""
+    text = unicodedata.normalize("NFC", prompt).replace("\r\n", "\n").replace("\r", "\n")
+    return "\n".join(line.rstrip() for line in text.split("\n") if line.strip())
+
+
+def build_cache_key(
+    *, prompt: str, model: str, params: Dict[str, Any], user_id: Optional[int]
+) -> str:
+    settings = get_settings()
+    material = {
+        "prompt": normalize_prompt(prompt),
+        "model": model.strip().lower(),
+        "params": params,
+        "scope": user_id if settings.llm_cache_scope == "user" else None,
+    }
+    encoded = json.dumps(material, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def record_bypass() -> None:
+    _metrics["bypassed"] += 1
+
+
+async def lookup(db: Database, cache_key: str) -> Optional[Dict[str, Any]]:
+    """Return the cached adapter result for ``cache_key`` and refresh its LRU position.
+
+    The cache fails open: a database error is logged and treated as a miss.
+    """
+    try:
+        return await _lookup(db, cache_key)
+    except Exception:
+        _metrics["errors"] += 1
+        logger.exception("LLM cache lookup failed")
+        return None
+
+
+async def _lookup(db: Database, cache_key: str) -> Optional[Dict[str, Any]]:
+    now = datetime.utcnow()
+    row = await db.fetch_one(
+        select(llm_response_cache.c.response, llm_response_cache.c.latency_ms)
+        .where(llm_response_cache.c.cache_key == cache_key)
+        .where(llm_response_cache.c.expires_at > now)
+    )
+    if row is None:
+        _metrics["misses"] += 1
+        return None
+    await db.execute(
+        update(llm_response_cache)
+        .where(llm_response_cache.c.cache_key == cache_key)
+        .values(
+            last_accessed_at=now,
+            hit_count=llm_response_cache.c.hit_count + 1,
+        )
+    )
+    _metrics["hits"] += 1
+    _metrics["latency_saved_ms"] += row["latency_ms"] or 0.0
+    return json.loads(row["response"])
+
+
+async def store(
+    db: Database,
+    cache_key: str,
+    *,
+    user_id: Optional[int],
+    model: str,
+    result: Dict[str, Any],
+    latency_ms: float,
+) -> None:
+    """Upsert the result for ``cache_key``; a database error is logged, never raised."""
+    settings = get_settings()
+    now = datetime.utcnow()
+    values = dict(
+        user_id=user_id if settings.llm_cache_scope == "user" else None,
+        model=model,
+        response=json.dumps(
+            {"code": result.get("code", ""), "usage": result.get("usage")},
+            ensure_ascii=False,
+        ),
+        latency_ms=latency_ms,
+        last_accessed_at=now,
+        expires_at=now + timedelta(hours=settings.llm_cache_ttl_hours),
+    )
+    query = (
+        upsert_insert(db, llm_response_cache)
+        .values(cache_key=cache_key, hit_count=0, created_at=now, **values)
+        .on_conflict_do_update(index_elements=[llm_response_cache.c.cache_key], set_=values)
+    )
+    try:
+        await db.execute(query)
+    except Exception:
+        _metrics["errors"] += 1
+        logger.exception("LLM cache store failed")
+        return
+    _metrics["stores"] += 1
+
+
+async def prune(db: Database) -> None:
+    """Drop expired rows, then least recently used rows beyond ``llm_cache_max_entries``."""
+    await db.execute(
+        delete(llm_response_cache).where(llm_response_cache.c.expires_at <= datetime.utcnow())
+    )
+    max_entries = get_settings().llm_cache_max_entries
+    if max_entries <= 0:
+        return
+    count = await db.fetch_val(select(func.count()).select_from(llm_response_cache))
+    excess = (count or 0) - max_entries
+    if excess <= 0:
+        return
+    oldest = (
+        select(llm_response_cache.c.id)
+        .order_by(llm_response_cache.c.last_accessed_at.asc())
+        .limit(excess)
+        .scalar_subquery()
+    )
+    await db.execute(delete(llm_response_cache).where(llm_response_cache.c.id.in_(oldest)))
+    _metrics["evicted"] += excess
+    logger.debug("Evicted %d LLM cache entries", excess)
+
+
+async def _prune_forever(db: Database, interval: float) -> None:
+    while True:
+        try:
+            await prune(db)
+        except Exception:  # pragma: no cover - keep the pruner alive
+            _metrics["errors"] += 1
+            logger.exception("LLM cache prune failed")
+        await asyncio.sleep(interval)
+
+
+def start_pruner(db: Database) -> None:
+    global _pruner_task
+    interval = get_settings().llm_cache_prune_interval_seconds
+    if interval <= 0 or (_pruner_task and not _pruner_task.done()):
+        return
+    _pruner_task = asyncio.create_task(_prune_forever(db, interval))
+
+
+async def stop_pruner() -> None:
+    global _pruner_task
+    if _pruner_task is None:
+        return
+    _pruner_task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await _pruner_task
+    _pruner_task = None
+
+
+def get_metrics() -> Dict[str, Any]:
+    lookups = _metrics["hits"] + _metrics["misses"]
+    return {
+        **_metrics,
+        "latency_saved_ms": round(_metrics["latency_saved_ms"], 1),
+        "hit_rate": round(_metrics["hits"] / lookups, 4) if lookups else None,
+    }
@@ -0,0 +1,233 @@
+import ast
+import difflib
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+_HUNK_HEADER = re.compile(r"^@@ -(?P<start>\d+)(?:,(?P<length>\d+))? \+\d+(?:,\d+)? @@")
+_FILE_HEADERS = ("diff ", "index ", "new file", "deleted file", "similarity ", "rename ")
+
+# Line comparisons tried in order: exact, then ignoring trailing whitespace, then ignoring
+# indentation too (models often re-indent the context they quote).
+_MATCHERS: Tuple[Callable[[str], str], ...] = (
+    lambda line: line,
+    lambda line: line.rstrip(),
+    lambda line: line.strip(),
+)
+
+_OUTCOMES = ("applied", "fuzzy", "regenerated", "syntax_error", "failed")
+_metrics: Dict[str, Any] = {"by_model": {}}
+
+
+class PatchApplyError(ValueError):
+    """Raised when a unified diff does not fit the code it is applied to."""
+
+
+@dataclass
+class Hunk:
+    # 0-based index of the first old line (or of the insertion point for pure additions).
+    at: int
+    lines: List[Tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def source(self) -> List[str]:
+        return [text for tag, text in self.lines if tag != "+"]
+
+    def target(self, context: List[str]) -> List[str]:
+        """The hunk's new lines, keeping the file's own text for context lines."""
+        result: List[str] = []
+        remaining = iter(context)
+        for tag, text in self.lines:
+            if tag == " ":
+                result.append(next(remaining))
+            elif tag == "-":
+                next(remaining)
+            else:
+                result.append(text)
+        return result
+
+
+@dataclass
+class PatchOutcome:
+    status: str
+    patch: Optional[str]
+    code: Optional[str] = None
+    error: Optional[str] = None
+
+
+def parse_unified_diff(patch: str) -> List[Hunk]:
+    hunks: List[Hunk] = []
+    current: Optional[Hunk] = None
+    lines = patch.rstrip("\n").splitlines()
+    for index, line in enumerate(lines):
+        header = _HUNK_HEADER.match(line)
+        if header:
+            start = int(header["start"])
+            current = Hunk(at=start if header["length"] == "0" else max(start - 1, 0))
+            hunks.append(current)
+        elif line.startswith(_FILE_HEADERS) or (
+            line.startswith("--- ") and index + 1 < len(lines) and lines[index + 1].startswith("+++ ")
+        ):
+            current = None
+        elif current is None or line.startswith("\\"):
+            continue
+        elif line[:1] in ("+", "-", " "):
+            current.lines.append((line[:1], line[1:]))
+        elif not line.strip():
+            # Models often drop the space that marks an empty context line.
+            current.lines.append((" ", ""))
+        else:
+            current = None
+    if not hunks:
+        raise PatchApplyError("No hunks found in the patch.")
+    return hunks
+
+
+def _matches(lines: List[str], position: int, source: List[str], normalize: Callable[[str], str]) -> bool:
+    if position < 0 or position + len(source) > len(lines):
+        return False
+    return all(normalize(lines[position + i]) == normalize(text) for i, text in enumerate(source))
+
+
+def _locate(lines: List[str], source: List[str], expected: int, start: int) -> Optional[Tuple[int, int]]:
+    """Find ``source`` at or after ``start``, nearest to ``expected`` first.
+
+    Returns the position and the index of the comparison that matched.
+    """
+    last = len(lines) - len(source)
+    if last < start:
+        return None
+    expected = min(max(expected, start), last)
+    for level, normalize in enumerate(_MATCHERS):
+        for distance in range(max(expected - start, last - expected) + 1):
+            for position in (expected - distance, expected + distance):
+                if start <= position <= last and _matches(lines, position, source, normalize):
+                    return position, level
+    return None
+
+
+def _trim_context(hunk: Hunk, fuzz: int) -> Hunk:
+    """Drop up to ``fuzz`` context lines from each end of ``hunk``."""
+    lines = list(hunk.lines)
+    leading = 0
+    while leading < fuzz and lines and lines[0][0] == " ":
+        lines.pop(0)
+        leading += 1
+    for _ in range(fuzz):
+        if not lines or lines[-1][0] != " ":
+            break
+        lines.pop()
+    return Hunk(at=hunk.at + leading, lines=lines)
+
+
+def apply_patch(base: str, patch: str, *, fuzz: int = 2) -> Tuple[str, bool]:
+    """Apply a unified diff to ``base`` the way ``patch --fuzz`` would.
+
+    Hunks may have drifted from their line numbers, differ in whitespace, or (with
+    ``fuzz``) carry up to that many context lines at either end that no longer match.
+    Returns the new text and whether any hunk needed more than an exact match at its
+    stated position.
+    """
+    lines = base.splitlines()
+    offset = 0
+    start = 0
+    inexact = False
+    for hunk in parse_unified_diff(patch):
+        for level in range(fuzz + 1):
+            candidate = _trim_context(hunk, level) if level else hunk
+            located = _locate(lines, candidate.source, candidate.at + offset, start)
+            if located is not None:
+                break
+        else:
+            first = next(iter(hunk.source), "")
+            raise PatchApplyError(f"Hunk at line {hunk.at + 1} does not match the code ({first.strip()!r}).")
+        position, matcher = located
+        size = len(candidate.source)
+        replacement = candidate.target(lines[position : position + size])
+        inexact = inexact or level > 0 or matcher > 0 or position != candidate.at + offset
+        lines[position : position + size] = replacement
+        offset = position - candidate.at + len(replacement) - size
+        start = position + len(replacement)
+    text = "\n".join(lines)
+    if base.endswith("\n") or not base:
+        text += "\n"
+    return text, inexact
+
+
+def is_valid_python(code: str) -> Optional[str]:
+    """``None`` when ``code`` parses, otherwise a short description of the syntax error."""
+    try:
+        ast.parse(code)
+    except SyntaxError as exc:
+        return f"Syntax error on line {exc.lineno}: {exc.msg}"
+    return None
+
+
+def keeps_most_of(base: str, candidate: str, *, share: float = 0.5) -> bool:
+    """Whether ``candidate`` keeps at least ``share`` of ``base``'s lines, i.e. is a full
+    rewrite of the script rather than a snippet of it."""
+    base_lines = base.splitlines()
+    matcher = difflib.SequenceMatcher(None, base_lines, candidate.splitlines(), autojunk=False)
+    kept = sum(block.size for block in matcher.get_matching_blocks())
+    return kept >= share * len(base_lines)
+
+
+def resolve_patch(
+    base: str,
+    patch: Optional[str],
+    *,
+    model: str,
+    candidates: Iterable[str] = (),
+    build_diff: Callable[[str, str], str],
+    fuzz: int = 2,
+) -> PatchOutcome:
+    """Apply ``patch`` to ``base`` and check the result parses.
+
+    When the diff does not apply (or yields invalid Python), the first full-script
+    candidate that parses and differs from ``base`` is diffed against it instead. A base
+    that does not parse itself is not held against the patch.
+    """
+    error: Optional[str] = None
+    base_valid = is_valid_python(base) is None
+    if patch:
+        try:
+            code, inexact = apply_patch(base, patch, fuzz=fuzz)
+        except PatchApplyError as exc:
+            error = str(exc)
+        else:
+            error = is_valid_python(code) if base_valid else None
+            if error is None:
+                outcome = PatchOutcome("fuzzy" if inexact else "applied", patch, code)
+                _record(model, outcome.status)
+                return outcome
+    for candidate in candidates:
+        if not candidate.strip() or candidate.strip() == base.strip():
+            continue
+        if base_valid and is_valid_python(candidate) is not None:
+            continue
+        rebuilt = build_diff(base, candidate)
+        if rebuilt.strip():
+            outcome = PatchOutcome("regenerated", rebuilt, candidate, error)
+            _record(model, outcome.status)
+            return outcome
+    status = "syntax_error" if error and error.startswith("Syntax error") else "failed"
+    _record(model, status)
+    return PatchOutcome(status, patch, None, error or "The patch could not be applied.")
+
+
+def _record(model: str, status: str) -> None:
+    stats = _metrics["by_model"].setdefault(model, {"attempts": 0, **{name: 0 for name in _OUTCOMES}})
+    stats["attempts"] += 1
+    stats[status] += 1
+
+
+def get_metrics() -> Dict[str, Any]:
+    by_model = {}
+    for model, stats in _metrics["by_model"].items():
+        usable = stats["applied"] + stats["fuzzy"] + stats["regenerated"]
+        by_model[model] = {
+            **stats,
+            "apply_rate": round((stats["applied"] + stats["fuzzy"]) / stats["attempts"], 4),
+            "usable_rate": round(usable / stats["attempts"], 4),
+        }
+    return {"by_model": by_model}
@@ -34,6 +34,8 @@ def build_analysis_prompt(
 
     intent_text = intent_guidance.get(task_type, intent_guidance["analysis"])
 
+    # Stable instructions and the dataset context come first and the task text last, so
+    # repeated requests share a long prefix that providers can serve from their cache.
     sections = [
         "You are a senior research data scientist and Python expert.",
         "Write executable Python 3 code that uses pandas and other scientific libraries.",
@@ -41,7 +43,14 @@ def build_analysis_prompt(
         "- Do not include explanatory prose outside of comments (except for designated summary output).",
         "- Prefer functions with docstrings.",
         "- If the environment variable DATASET_PATH is set, use it as the primary dataset source.",
-        f"The requested task is: {task_description}",
+        "- Pick the pandas reader from the dataset file extension (read_csv, read_excel, read_parquet, read_feather).",
+        dedent(
+            """
+            Return the final answer as a JSON object with keys:
+            - "code": Python source string.
+            - "reasoning": Short explanation of analysis strategy.
+            """
+        ).strip(),
         f"Primary intent: {task_type}.",
         "Guidance for this intent:",
         intent_text,
@@ -49,14 +58,6 @@ def build_analysis_prompt(
     if dataset_context:
         sections.append("Dataset context:\n" + dataset_context)
 
-    sections.append(
-        dedent(
-            """
-            Return the final answer as a JSON object with keys:
-            - "code": Python source string.
-            - "reasoning": Short explanation of analysis strategy.
-            """
-        ).strip()
-    )
+    sections.append(f"The requested task is: {task_description}")
 
     return "\n\n".join(sections)
@@ -1,16 +1,45 @@
 import json
-from typing import Dict, Optional
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
 
 from databases import Database
 from sqlalchemy import select
 from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
+from ..config import get_settings
 from ..models.provider_credential import provider_credentials
 from ..schemas import ProviderCredentialPayload, ProviderOverride
 from ..security import decrypt_secret, encrypt_secret
 
 
+_CREDENTIALS_CACHE_SIZE = 512
+# Decrypted credentials per user with the monotonic time they were loaded. The TTL
+# bounds staleness when another worker process updates the same user's credentials.
+_credentials_cache: "OrderedDict[int, Tuple[float, Dict[str, ProviderCredentialPayload]]]" = OrderedDict()
+
+
+def invalidate_cached_credentials(user_id: int) -> None:
+    _credentials_cache.pop(user_id, None)
+
+
 async def get_credentials_map(db: Database, user_id: int) -> Dict[str, ProviderCredentialPayload]:
+    """Return the user's decrypted credentials, served from memory when recently loaded."""
+    ttl = get_settings().provider_credentials_cache_ttl_seconds
+    cached = _credentials_cache.get(user_id)
+    if cached is not None and time.monotonic() - cached[0] < ttl:
+        _credentials_cache.move_to_end(user_id)
+        return dict(cached[1])
+    result = await _load_credentials_map(db, user_id)
+    if ttl > 0:
+        _credentials_cache[user_id] = (time.monotonic(), result)
+        _credentials_cache.move_to_end(user_id)
+        while len(_credentials_cache) > _CREDENTIALS_CACHE_SIZE:
+            _credentials_cache.popitem(last=False)
+    return dict(result)
+
+
+async def _load_credentials_map(db: Database, user_id: int) -> Dict[str, ProviderCredentialPayload]:
     rows = await db.fetch_all(
         select(provider_credentials).where(provider_credentials.c.user_id == user_id)
     )
@@ -59,6 +88,7 @@ async def upsert_credentials(
         await db.execute(query)
 
     # reload to ensure decrypted values are returned fresh
+    invalidate_cached_credentials(user_id)
     return await get_credentials_map(db, user_id)
 
 
@@ -67,12 +97,13 @@ async def delete_missing_credentials(db: Database, user_id: int, keep_providers:
         await db.execute(
             provider_credentials.delete().where(provider_credentials.c.user_id == user_id)
         )
-        return
-    await db.execute(
-        provider_credentials.delete().where(provider_credentials.c.user_id == user_id).where(
-            provider_credentials.c.provider_id.notin_(keep_providers)
+    else:
+        await db.execute(
+            provider_credentials.delete().where(provider_credentials.c.user_id == user_id).where(
+                provider_credentials.c.provider_id.notin_(keep_providers)
+            )
         )
-    )
+    invalidate_cached_credentials(user_id)
 
 
 def credential_payloads_to_overrides(payload: Dict[str, ProviderCredentialPayload]) -> Dict[str, ProviderOverride]:
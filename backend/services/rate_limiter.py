@@ -0,0 +1,189 @@
+import asyncio
+import contextlib
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from ..config import get_settings
+from .tokens import estimate_tokens, usage_total_tokens
+
+# Limits are expressed per minute; a bucket holds up to one minute of budget so short
+# bursts pass immediately while the sustained rate stays at the configured limit.
+_KINDS = ("rpm", "tpm")
+
+_metrics: Dict[str, Dict[str, float]] = {}
+
+
+class RateLimitExceeded(RuntimeError):
+    """Raised when a request would have to queue past the configured deadline."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Token bucket that may go into debt, so queued callers are served in arrival order.
+
+    ``reserve`` takes the amount immediately and returns how long the caller must wait
+    for the balance to climb back to zero.
+    """
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.rate = per_minute / 60.0
+        self.balance = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.balance = min(self.per_minute, self.balance + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        # A single request bigger than the whole bucket is admitted once it is full.
+        deficit = min(amount, self.per_minute) - self.balance
+        return deficit / self.rate if deficit > 0 else 0.0
+
+    def take(self, amount: float) -> None:
+        self.balance -= amount
+
+    def give_back(self, amount: float) -> None:
+        self.balance = min(self.per_minute, self.balance + amount)
+
+
+_buckets: Dict[Tuple[str, str, str], TokenBucket] = {}
+
+
+def _limits_for(table: Dict[str, Dict[str, float]], provider: str) -> Dict[str, float]:
+    return {**table.get("default", {}), **table.get(provider, {})}
+
+
+def _user_limits(user_id: int, provider: str) -> Dict[str, float]:
+    settings = get_settings()
+    limits = _limits_for(settings.rate_limit_user_limits, provider)
+    override = settings.rate_limit_user_overrides.get(str(user_id))
+    if override:
+        limits.update(_limits_for(override, provider))
+    return limits
+
+
+def _bucket(scope: str, provider: str, kind: str, per_minute: float) -> TokenBucket:
+    key = (scope, provider, kind)
+    bucket = _buckets.get(key)
+    if bucket is None or bucket.per_minute != per_minute:
+        bucket = _buckets[key] = TokenBucket(per_minute)
+    return bucket
+
+
+def _applicable_buckets(user_id: int, provider: str) -> List[Tuple[TokenBucket, str]]:
+    settings = get_settings()
+    scoped = [
+        (f"user:{user_id}", _user_limits(user_id, provider)),
+        ("global", _limits_for(settings.rate_limit_provider_limits, provider)),
+    ]
+    buckets = []
+    for scope, limits in scoped:
+        for kind in _KINDS:
+            per_minute = limits.get(kind) or 0
+            if per_minute > 0:
+                buckets.append((_bucket(scope, provider, kind, per_minute), kind))
+    return buckets
+
+
+def _provider_metrics(provider: str) -> Dict[str, float]:
+    return _metrics.setdefault(
+        provider, {"admitted": 0, "queued": 0, "rejected": 0, "wait_seconds": 0.0}
+    )
+
+
+@dataclass
+class Reservation:
+    provider: str
+    estimated_tokens: int
+    token_buckets: List[TokenBucket] = field(default_factory=list)
+    request_buckets: List[TokenBucket] = field(default_factory=list)
+    settled: bool = False
+
+    def settle(self, usage: Optional[Dict[str, Any]]) -> None:
+        """Correct the token buckets once the provider reports actual usage."""
+        self.settled = True
+        actual = usage_total_tokens(usage)
+        if actual is None:
+            return
+        difference = actual - self.estimated_tokens
+        for bucket in self.token_buckets:
+            if difference > 0:
+                bucket.take(difference)
+            else:
+                bucket.give_back(-difference)
+        self.estimated_tokens = actual
+
+    def release(self) -> None:
+        """Return the whole reservation, request slot included, for a call that is not charged."""
+        self.settle({"total_tokens": 0})
+        for bucket in self.request_buckets:
+            bucket.give_back(1)
+        self.request_buckets = []
+
+    def release_unsettled(self) -> None:
+        """Release the reservation unless the call was already settled or released."""
+        if not self.settled:
+            self.release()
+
+    @contextlib.contextmanager
+    def released_on_error(self) -> Iterator[None]:
+        """Release the reservation if the provider call in the block fails or is cancelled."""
+        try:
+            yield
+        except BaseException:
+            self.release()
+            raise
+
+
+def estimate_request_tokens(prompt_text: str) -> int:
+    return estimate_tokens(prompt_text) + get_settings().rate_limit_completion_token_estimate
+
+
+async def acquire(user_id: int, provider: str, *, estimated_tokens: int) -> Reservation:
+    """Reserve one request and ``estimated_tokens`` for ``user_id`` against ``provider``.
+
+    Waits while the buckets refill if that fits in ``rate_limit_max_wait_seconds``;
+    otherwise nothing is reserved and ``RateLimitExceeded`` is raised straight away.
+    """
+    settings = get_settings()
+    reservation = Reservation(provider=provider, estimated_tokens=estimated_tokens)
+    if not settings.rate_limit_enabled:
+        return reservation
+    stats = _provider_metrics(provider)
+    buckets = _applicable_buckets(user_id, provider)
+    now = time.monotonic()
+    amounts = [1 if kind == "rpm" else estimated_tokens for _, kind in buckets]
+    wait = max(
+        (bucket.wait_time(amount, now) for (bucket, _), amount in zip(buckets, amounts)),
+        default=0.0,
+    )
+    if wait > settings.rate_limit_max_wait_seconds:
+        stats["rejected"] += 1
+        raise RateLimitExceeded(
+            f"Rate limit for {provider} reached; retry in {math.ceil(wait)}s.", retry_after=wait
+        )
+    for (bucket, kind), amount in zip(buckets, amounts):
+        bucket.take(amount)
+        (reservation.token_buckets if kind == "tpm" else reservation.request_buckets).append(bucket)
+    stats["admitted"] += 1
+    if wait > 0:
+        stats["queued"] += 1
+        stats["wait_seconds"] += wait
+        # A caller that goes away while queued (disconnect, cancelled race) takes nothing.
+        with reservation.released_on_error():
+            await asyncio.sleep(wait)
+    return reservation
+
+
+def get_metrics() -> Dict[str, Any]:
+    return {
+        provider: {**stats, "wait_seconds": round(stats["wait_seconds"], 3)}
+        for provider, stats in _metrics.items()
+    }
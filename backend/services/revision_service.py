@@ -0,0 +1,209 @@
+import asyncio
+import difflib
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from databases import Database
+from sqlalchemy import func, insert, select, update
+
+from ..config import get_settings
+from ..models.revision import code_revisions
+from ..models.task import analysis_tasks
+
+# Reconstructed scripts by revision id; rows never change once written.
+_CODE_CACHE_SIZE = 128
+_code_cache: "OrderedDict[int, str]" = OrderedDict()
+# Revision numbers are assigned read-then-insert.
+_write_lock = asyncio.Lock()
+
+_metrics: Dict[str, Any] = {
+    "recorded": 0,
+    "unchanged": 0,
+    "snapshots": 0,
+    "deltas": 0,
+    "code_bytes": 0,
+    "stored_bytes": 0,
+    "reconstructions": 0,
+    "reconstructed_deltas": 0,
+    "reconstruct_ms": 0.0,
+    "cache_hits": 0,
+}
+
+DeltaOp = Union[int, str]
+
+
+def encode_delta(old: str, new: str) -> str:
+    """Line edits turning ``old`` into ``new``, as compact JSON.
+
+    A positive integer copies that many lines of ``old``, a negative one skips them and a
+    string is inserted as is.
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    ops: List[DeltaOp] = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(i1 - i2)
+        if j2 > j1:
+            ops.append("".join(new_lines[j1:j2]))
+    return json.dumps(ops, ensure_ascii=False, separators=(",", ":"))
+
+
+def apply_delta(old: str, delta: str) -> str:
+    lines = old.splitlines(keepends=True)
+    parts: List[str] = []
+    position = 0
+    for op in json.loads(delta):
+        if isinstance(op, str):
+            parts.append(op)
+        elif op > 0:
+            parts.extend(lines[position : position + op])
+            position += op
+        else:
+            position -= op
+    return "".join(parts)
+
+
+def _hash(code: str) -> str:
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+def _remember(revision_id: int, code: str) -> None:
+    _code_cache[revision_id] = code
+    _code_cache.move_to_end(revision_id)
+    while len(_code_cache) > _CODE_CACHE_SIZE:
+        _code_cache.popitem(last=False)
+
+
+def _public(row: Any) -> Dict[str, Any]:
+    return {
+        key: row[key]
+        for key in ("id", "task_id", "revision", "kind", "code_size", "source", "created_at")
+    }
+
+
+async def _fetch(db: Database, revision_id: int, user_id: int) -> Optional[Any]:
+    return await db.fetch_one(
+        select(code_revisions)
+        .where(code_revisions.c.id == revision_id)
+        .where(code_revisions.c.user_id == user_id)
+    )
+
+
+async def _reconstruct(db: Database, row: Any) -> str:
+    cached = _code_cache.get(row["id"])
+    if cached is not None:
+        _metrics["cache_hits"] += 1
+        _code_cache.move_to_end(row["id"])
+        return cached
+    started = time.perf_counter()
+    chain = await db.fetch_all(
+        select(code_revisions.c.content)
+        .where(code_revisions.c.task_id == row["task_id"])
+        .where(code_revisions.c.revision >= row["base_revision"])
+        .where(code_revisions.c.revision <= row["revision"])
+        .order_by(code_revisions.c.revision)
+    )
+    code = chain[0]["content"]
+    for link in chain[1:]:
+        code = apply_delta(code, link["content"])
+    _metrics["reconstructions"] += 1
+    _metrics["reconstructed_deltas"] += len(chain) - 1
+    _metrics["reconstruct_ms"] += (time.perf_counter() - started) * 1000
+    _remember(row["id"], code)
+    return code
+
+
+async def get_revision(
+    db: Database, revision_id: int, *, user_id: int, task_id: Optional[int] = None
+) -> Optional[Tuple[Dict[str, Any], str]]:
+    """A revision's metadata and full script, or ``None`` if the user has no such revision."""
+    row = await _fetch(db, revision_id, user_id)
+    if row is None or (task_id is not None and row["task_id"] != task_id):
+        return None
+    return _public(row), await _reconstruct(db, row)
+
+
+async def list_revisions(db: Database, task_id: int, user_id: int) -> List[Dict[str, Any]]:
+    rows = await db.fetch_all(
+        select(code_revisions)
+        .where(code_revisions.c.task_id == task_id)
+        .where(code_revisions.c.user_id == user_id)
+        .order_by(code_revisions.c.revision)
+    )
+    return [_public(row) for row in rows]
+
+
+async def record_revision(
+    db: Database, task_id: int, *, user_id: int, code: str, source: str
+) -> Dict[str, Any]:
+    """Store ``code`` as the task's next revision and make it the task's current script.
+
+    Returns the latest revision unchanged when the script matches it. A full snapshot is
+    written for the first revision, every ``code_revision_snapshot_interval`` revisions,
+    and whenever the delta would not be smaller than the script itself.
+    """
+    code_hash = _hash(code)
+    async with _write_lock:
+        latest = await db.fetch_one(
+            select(code_revisions)
+            .where(code_revisions.c.task_id == task_id)
+            .order_by(code_revisions.c.revision.desc())
+            .limit(1)
+        )
+        if latest is not None and latest["code_hash"] == code_hash:
+            _metrics["unchanged"] += 1
+            return _public(latest)
+
+        number = 1 if latest is None else latest["revision"] + 1
+        kind, content, base_revision = "snapshot", code, number
+        interval = get_settings().code_revision_snapshot_interval
+        if latest is not None and number - latest["base_revision"] < interval:
+            delta = encode_delta(await _reconstruct(db, latest), code)
+            if len(delta) < len(code):
+                kind, content, base_revision = "delta", delta, latest["base_revision"]
+
+        values = {
+            "task_id": task_id,
+            "user_id": user_id,
+            "revision": number,
+            "base_revision": base_revision,
+            "kind": kind,
+            "content": content,
+            "code_hash": code_hash,
+            "code_size": len(code),
+            "source": source,
+            "created_at": datetime.utcnow(),
+        }
+        revision_id = await db.execute(
+            insert(code_revisions).values(**values).returning(code_revisions.c.id)
+        )
+        await db.execute(
+            update(analysis_tasks)
+            .where(analysis_tasks.c.id == task_id)
+            .where(analysis_tasks.c.user_id == user_id)
+            .values(generated_code=code, updated_at=func.now())
+        )
+    _remember(revision_id, code)
+    _metrics["recorded"] += 1
+    _metrics["snapshots" if kind == "snapshot" else "deltas"] += 1
+    _metrics["code_bytes"] += len(code)
+    _metrics["stored_bytes"] += len(content)
+    return _public({**values, "id": revision_id})
+
+
+def get_metrics() -> Dict[str, Any]:
+    code_bytes = _metrics["code_bytes"]
+    return {
+        **_metrics,
+        "reconstruct_ms": round(_metrics["reconstruct_ms"], 3),
+        "storage_ratio": round(_metrics["stored_bytes"] / code_bytes, 4) if code_bytes else None,
+    }
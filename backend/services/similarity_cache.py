@@ -0,0 +1,250 @@
+import hashlib
+import logging
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from ..config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# 64 MinHash permutations split into 16 LSH bands of 4 rows: two prompts with Jaccard
+# similarity s share at least one band with probability 1 - (1 - s^4)^16, which is
+# ~0.5 at s=0.5 and >0.99 at s=0.8, so candidates above useful thresholds are not missed.
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+SHINGLE_SIZE = 3
+# Numbers and identifier-like words (single letters, names with digits or underscores)
+# usually name columns, variables or values. "y on x" and "y on x and z" share most
+# shingles yet ask for different models, so these tokens must match exactly.
+_KEY_TOKEN = re.compile(r"[a-z_][a-z0-9_]*|\d+(?:\.\d+)?")
+
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+_rng = np.random.default_rng(20240601)
+_PERM_A = _rng.integers(1, (1 << 31) - 1, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.integers(0, (1 << 31) - 1, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+_metrics: Dict[str, Any] = {
+    "lookups": 0,
+    "fires": 0,
+    "stores": 0,
+    "evicted": 0,
+    "last_similarity": None,
+    "last_evaluation": None,
+}
+
+
+def normalize_text(text: str) -> str:
+    """Fold case/width and drop whitespace and punctuation, which rarely change intent."""
+    folded = unicodedata.normalize("NFKC", text).lower()
+    return "".join(ch for ch in folded if not unicodedata.category(ch).startswith(("P", "Z", "C")))
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> FrozenSet[str]:
+    normalized = normalize_text(text)
+    if len(normalized) <= size:
+        return frozenset([normalized]) if normalized else frozenset()
+    return frozenset(normalized[i : i + size] for i in range(len(normalized) - size + 1))
+
+
+def key_tokens(text: str) -> FrozenSet[str]:
+    folded = unicodedata.normalize("NFKC", text).lower()
+    return frozenset(
+        token
+        for token in _KEY_TOKEN.findall(folded)
+        if len(token) == 1 or token[0].isdigit() or any(ch.isdigit() or ch == "_" for ch in token)
+    )
+
+
+def jaccard(left: FrozenSet[str], right: FrozenSet[str]) -> float:
+    if not left and not right:
+        return 1.0
+    return len(left & right) / len(left | right)
+
+
+def minhash(shingle_set: Iterable[str]) -> np.ndarray:
+    """MinHash signature using universal hashing ``(a*x + b) mod p`` over 31-bit shingle hashes."""
+    hashes = np.fromiter(
+        (
+            int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=4).digest(), "little")
+            for item in shingle_set
+        ),
+        dtype=np.uint64,
+    )
+    if hashes.size == 0:
+        return np.full(NUM_PERMUTATIONS, _MERSENNE_PRIME, dtype=np.uint64)
+    hashes %= _MERSENNE_PRIME
+    permuted = (_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]) % _MERSENNE_PRIME
+    return permuted.min(axis=1)
+
+
+def _band_keys(signature: np.ndarray) -> List[Tuple[int, bytes]]:
+    return [
+        (band, signature[band * LSH_ROWS : (band + 1) * LSH_ROWS].tobytes())
+        for band in range(LSH_BANDS)
+    ]
+
+
+@dataclass
+class _Entry:
+    scope: str
+    shingles: FrozenSet[str]
+    key_tokens: FrozenSet[str]
+    bands: List[Tuple[int, bytes]]
+    result: Dict[str, Any]
+    created_at: float = field(default_factory=time.time)
+
+
+class SimilarityIndex:
+    """Bounded in-process LSH index of generations, partitioned by scope.
+
+    A scope combines everything that must match exactly (dataset schema, model, task
+    type, user) so only the free-text task description is compared fuzzily.
+    """
+
+    def __init__(self) -> None:
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, int, bytes], Set[int]] = {}
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _drop(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        for band, key in entry.bands:
+            bucket = self._buckets.get((entry.scope, band, key))
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[(entry.scope, band, key)]
+
+    def add(self, scope: str, text: str, result: Dict[str, Any], *, max_entries: int) -> None:
+        shingle_set = shingles(text)
+        if not shingle_set:
+            return
+        entry_id = self._next_id
+        self._next_id += 1
+        bands = _band_keys(minhash(shingle_set))
+        self._entries[entry_id] = _Entry(scope, shingle_set, key_tokens(text), bands, result)
+        for band, key in bands:
+            self._buckets.setdefault((scope, band, key), set()).add(entry_id)
+        while max_entries > 0 and len(self._entries) > max_entries:
+            self._drop(next(iter(self._entries)))
+            _metrics["evicted"] += 1
+
+    def query(
+        self, scope: str, text: str, *, threshold: float, ttl_seconds: float
+    ) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """Best cached result whose exact shingle Jaccard similarity reaches ``threshold``
+        and whose numbers and identifiers are the same as ``text``'s."""
+        shingle_set = shingles(text)
+        if not shingle_set:
+            return None
+        tokens = key_tokens(text)
+        candidates: Set[int] = set()
+        for band, key in _band_keys(minhash(shingle_set)):
+            candidates |= self._buckets.get((scope, band, key), set())
+        now = time.time()
+        best: Optional[Tuple[float, int]] = None
+        for entry_id in candidates:
+            entry = self._entries[entry_id]
+            if ttl_seconds > 0 and now - entry.created_at > ttl_seconds:
+                continue
+            if entry.key_tokens != tokens:
+                continue
+            score = jaccard(shingle_set, entry.shingles)
+            if score >= threshold and (best is None or score > best[0]):
+                best = (score, entry_id)
+        if best is None:
+            return None
+        self._entries.move_to_end(best[1])
+        return best[0], self._entries[best[1]].result
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._buckets.clear()
+
+
+_index = SimilarityIndex()
+
+
+def build_scope(*, schema_fingerprint: str, model: str, task_type: str, user_id: Optional[int]) -> str:
+    owner = user_id if get_settings().llm_cache_scope == "user" else None
+    return f"{schema_fingerprint}|{model.strip().lower()}|{task_type}|{owner}"
+
+
+def lookup(scope: str, task_description: str) -> Optional[Dict[str, Any]]:
+    settings = get_settings()
+    _metrics["lookups"] += 1
+    match = _index.query(
+        scope,
+        task_description,
+        threshold=settings.llm_similarity_threshold,
+        ttl_seconds=settings.llm_cache_ttl_hours * 3600,
+    )
+    if match is None:
+        return None
+    score, result = match
+    _metrics["fires"] += 1
+    _metrics["last_similarity"] = round(score, 4)
+    return result
+
+
+def store(scope: str, task_description: str, result: Dict[str, Any]) -> None:
+    _index.add(
+        scope,
+        task_description,
+        {"code": result.get("code", ""), "usage": result.get("usage")},
+        max_entries=get_settings().llm_similarity_cache_max_entries,
+    )
+    _metrics["stores"] += 1
+
+
+def evaluate_precision(
+    pairs: Iterable[Tuple[str, str, bool]], *, threshold: Optional[float] = None
+) -> Dict[str, Any]:
+    """Score the cache on labelled ``(prompt_a, prompt_b, same_intent)`` pairs.
+
+    A pair "fires" when its similarity reaches the threshold and its numbers and
+    identifiers match, as in ``SimilarityIndex.query``; precision is the share of
+    fired pairs labelled as the same intent, i.e. how often a cache hit would be correct.
+    """
+    threshold = get_settings().llm_similarity_threshold if threshold is None else threshold
+    fired = true_positive = positives = total = 0
+    for left, right, same_intent in pairs:
+        total += 1
+        positives += bool(same_intent)
+        if (
+            key_tokens(left) == key_tokens(right)
+            and jaccard(shingles(left), shingles(right)) >= threshold
+        ):
+            fired += 1
+            true_positive += bool(same_intent)
+    report = {
+        "pairs": total,
+        "threshold": threshold,
+        "fired": fired,
+        "fire_rate": round(fired / total, 4) if total else None,
+        "precision": round(true_positive / fired, 4) if fired else None,
+        "recall": round(true_positive / positives, 4) if positives else None,
+    }
+    _metrics["last_evaluation"] = report
+    return report
+
+
+def get_metrics() -> Dict[str, Any]:
+    settings = get_settings()
+    return {
+        **_metrics,
+        "enabled": settings.llm_similarity_cache_enabled,
+        "threshold": settings.llm_similarity_threshold,
+        "entries": len(_index),
+        "fire_rate": round(_metrics["fires"] / _metrics["lookups"], 4) if _metrics["lookups"] else None,
+    }
@@ -0,0 +1,81 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from ..config import get_settings
+
+T = TypeVar("T")
+
+_inflight: Dict[str, "asyncio.Future[Any]"] = {}
+_metrics: Dict[str, Any] = {
+    "calls": 0,
+    "leaders": 0,
+    "coalesced": 0,
+    "shared_failures": 0,
+    "by_kind": {},
+}
+
+
+def build_key(kind: str, *, user_id: Optional[int], model: str, payload: Any, params: Dict[str, Any]) -> str:
+    """Canonical key for one upstream call: who asked, which model, what was sent and how."""
+    material = {
+        "kind": kind,
+        "scope": user_id,
+        "model": model.strip().lower(),
+        "payload": payload,
+        "params": params,
+    }
+    encoded = json.dumps(material, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{kind}:{hashlib.sha256(encoded.encode('utf-8')).hexdigest()}"
+
+
+def _kind_metrics(key: str) -> Dict[str, int]:
+    kind = key.partition(":")[0]
+    return _metrics["by_kind"].setdefault(kind, {"leaders": 0, "coalesced": 0})
+
+
+async def run(key: str, call: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+    """Await ``call()``, or the identical call already running under ``key``.
+
+    Returns the result and whether it was shared from another request. The upstream
+    call runs as its own task, so a caller that disconnects does not cancel it for the
+    others; its exception, if any, is raised to every waiter.
+    """
+    _metrics["calls"] += 1
+    if not get_settings().llm_single_flight_enabled:
+        return await call(), False
+    running = _inflight.get(key)
+    if running is not None:
+        _metrics["coalesced"] += 1
+        _kind_metrics(key)["coalesced"] += 1
+        try:
+            return await asyncio.shield(running), True
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            _metrics["shared_failures"] += 1
+            raise
+
+    _metrics["leaders"] += 1
+    _kind_metrics(key)["leaders"] += 1
+    task = asyncio.ensure_future(call())
+    _inflight[key] = task
+
+    def _forget(done: "asyncio.Future[Any]") -> None:
+        if _inflight.get(key) is done:
+            del _inflight[key]
+        if not done.cancelled():
+            # Mark the exception retrieved when every waiter has gone away.
+            done.exception()
+
+    task.add_done_callback(_forget)
+    return await asyncio.shield(task), False
+
+
+def get_metrics() -> Dict[str, Any]:
+    return {
+        **_metrics,
+        "in_flight": len(_inflight),
+        "by_kind": {kind: dict(counts) for kind, counts in _metrics["by_kind"].items()},
+    }
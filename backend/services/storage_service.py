@@ -0,0 +1,306 @@
+import asyncio
+import contextlib
+import logging
+import os
+import re
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from ..config import get_settings
+from .dataset_service import PROFILE_SUFFIX, SAMPLE_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+# Eviction order: cheap-to-rebuild derived files first, then run artifacts, then the
+# datasets themselves. Within a kind the least recently accessed entry goes first.
+KIND_PRIORITY = {"derived": 0, "artifacts": 1, "dataset": 2}
+DERIVED_SUFFIXES = (PROFILE_SUFFIX, SAMPLE_SUFFIX)
+
+_USER_DIR = re.compile(r"^user_(\d+)$")
+_USER_ARTIFACTS = re.compile(r"^user_(\d+)_")
+_EPHEMERAL_RUN = re.compile(r"(^|_)run_[0-9a-f]+$")
+
+_metrics: Dict[str, Any] = {
+    "sweeps": 0,
+    "last_sweep_at": None,
+    "last_sweep_seconds": None,
+    "evicted_entries": 0,
+    "evicted_bytes": 0,
+    "evicted_by_kind": {kind: 0 for kind in KIND_PRIORITY},
+    "expired_run_artifacts": 0,
+    "usage_bytes": {kind: 0 for kind in KIND_PRIORITY},
+    "total_bytes": 0,
+}
+_sweeper_task: Optional[asyncio.Task] = None
+
+
+class StorageQuotaExceeded(RuntimeError):
+    """Raised when a new file cannot fit in the user's quota even after eviction."""
+
+
+@dataclass
+class StorageEntry:
+    path: Path
+    kind: str
+    user_id: Optional[int]
+    size: int
+    last_access: float
+
+    @property
+    def priority(self) -> int:
+        return KIND_PRIORITY[self.kind]
+
+
+def touch(path: Path) -> None:
+    """Record an access to a dataset file or artifact folder.
+
+    Files only get their atime bumped because profiles validate against mtime. Folder
+    atime changes whenever the sweeper lists it, so folders track access via mtime.
+    """
+    with contextlib.suppress(OSError):
+        if path.is_dir():
+            os.utime(path)
+            return
+        stat = path.stat()
+        os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+
+
+def _tree_size(path: Path) -> int:
+    if path.is_file():
+        return path.stat().st_size
+    total = 0
+    for item in path.rglob("*"):
+        with contextlib.suppress(OSError):
+            if item.is_file():
+                total += item.stat().st_size
+    return total
+
+
+def _upload_entries(upload_dir: Path, user_id: Optional[int] = None) -> Iterable[StorageEntry]:
+    if not upload_dir.exists():
+        return
+    for user_dir in upload_dir.iterdir():
+        match = _USER_DIR.match(user_dir.name)
+        if not user_dir.is_dir() or not match:
+            continue
+        owner = int(match.group(1))
+        if user_id is not None and owner != user_id:
+            continue
+        for item in user_dir.iterdir():
+            try:
+                stat = item.stat()
+            except OSError:
+                continue
+            if not item.is_file():
+                continue
+            kind = "derived" if item.name.endswith(DERIVED_SUFFIXES) else "dataset"
+            yield StorageEntry(item, kind, owner, stat.st_size, max(stat.st_atime, stat.st_mtime))
+
+
+def _artifact_entries(artifacts_dir: Path, user_id: Optional[int] = None) -> Iterable[StorageEntry]:
+    if not artifacts_dir.exists():
+        return
+    for folder in artifacts_dir.iterdir():
+        if not folder.is_dir():
+            continue
+        match = _USER_ARTIFACTS.match(folder.name)
+        owner = int(match.group(1)) if match else None
+        if user_id is not None and owner != user_id:
+            continue
+        try:
+            stat = folder.stat()
+        except OSError:
+            continue
+        yield StorageEntry(folder, "artifacts", owner, _tree_size(folder), stat.st_mtime)
+
+
+def scan(user_id: Optional[int] = None) -> List[StorageEntry]:
+    settings = get_settings()
+    return [
+        *_upload_entries(settings.upload_dir, user_id),
+        *_artifact_entries(settings.artifacts_dir, user_id),
+    ]
+
+
+def summarize(entries: Iterable[StorageEntry]) -> Dict[str, int]:
+    usage = {kind: 0 for kind in KIND_PRIORITY}
+    for entry in entries:
+        usage[entry.kind] += entry.size
+    return usage
+
+
+def _remove(entry: StorageEntry) -> None:
+    if entry.path.is_dir():
+        shutil.rmtree(entry.path, ignore_errors=True)
+    else:
+        entry.path.unlink(missing_ok=True)
+        if entry.kind == "dataset":
+            # A dataset's derived files are useless without it.
+            for suffix in DERIVED_SUFFIXES:
+                entry.path.with_name(entry.path.name + suffix).unlink(missing_ok=True)
+    _metrics["evicted_entries"] += 1
+    _metrics["evicted_bytes"] += entry.size
+    _metrics["evicted_by_kind"][entry.kind] += 1
+    logger.info("Evicted %s %s (%d bytes)", entry.kind, entry.path, entry.size)
+
+
+def _evict_until(
+    entries: List[StorageEntry],
+    limit_bytes: int,
+    *,
+    now: float,
+    protect: Optional[Path] = None,
+) -> List[StorageEntry]:
+    """Evict by (kind priority, last access) until ``entries`` fit in ``limit_bytes``."""
+    min_idle = get_settings().storage_min_idle_seconds
+    used = sum(entry.size for entry in entries)
+    evicted: List[StorageEntry] = []
+    for entry in sorted(entries, key=lambda item: (item.priority, item.last_access)):
+        if used <= limit_bytes:
+            break
+        if protect is not None and entry.path == protect:
+            continue
+        if not entry.path.exists():
+            # Already removed alongside its dataset.
+            used -= entry.size
+            continue
+        if now - entry.last_access < min_idle:
+            continue
+        _remove(entry)
+        evicted.append(entry)
+        used -= entry.size
+    return evicted
+
+
+def enforce_user_quota(user_id: int, *, protect: Optional[Path] = None) -> int:
+    """Evict the user's least valuable files to fit their quota and return bytes in use.
+
+    ``protect`` (typically a fresh upload) is never evicted; if it alone keeps the user
+    over quota, ``StorageQuotaExceeded`` is raised so the caller can reject it.
+    """
+    settings = get_settings()
+    entries = scan(user_id)
+    limit = settings.storage_user_quota_mb * 1024 * 1024
+    if limit <= 0:
+        return sum(entry.size for entry in entries)
+    protected_size = sum(entry.size for entry in entries if entry.path == protect)
+    if protected_size > limit:
+        # Evicting everything else would not help; fail before touching anything.
+        raise StorageQuotaExceeded(
+            f"File exceeds the storage quota of {settings.storage_user_quota_mb} MB."
+        )
+    evicted = _evict_until(entries, limit, now=time.time(), protect=protect)
+    evicted_paths = {entry.path for entry in evicted}
+    used = sum(entry.size for entry in entries if entry.path not in evicted_paths)
+    if used > limit:
+        raise StorageQuotaExceeded(
+            f"Storage quota of {settings.storage_user_quota_mb} MB exceeded "
+            f"({used // (1024 * 1024)} MB in use)."
+        )
+    return used
+
+
+def _expire_run_artifacts(entries: List[StorageEntry], now: float) -> List[StorageEntry]:
+    """Drop one-off run artifacts (``*_run_<id>``) older than the retention window."""
+    ttl_seconds = get_settings().storage_run_artifact_ttl_hours * 3600
+    if ttl_seconds <= 0:
+        return []
+    expired = [
+        entry
+        for entry in entries
+        if entry.kind == "artifacts"
+        and _EPHEMERAL_RUN.search(entry.path.name)
+        and now - entry.last_access > ttl_seconds
+    ]
+    for entry in expired:
+        _remove(entry)
+    _metrics["expired_run_artifacts"] += len(expired)
+    return expired
+
+
+def _remove_orphaned_derived(entries: List[StorageEntry]) -> List[StorageEntry]:
+    orphans = []
+    for entry in entries:
+        if entry.kind != "derived":
+            continue
+        suffix = next(suffix for suffix in DERIVED_SUFFIXES if entry.path.name.endswith(suffix))
+        source = entry.path.with_name(entry.path.name[: -len(suffix)])
+        if not source.exists():
+            _remove(entry)
+            orphans.append(entry)
+    return orphans
+
+
+def sweep() -> Dict[str, Any]:
+    """Run one full pass: expire stale run artifacts, then enforce user and global quotas."""
+    settings = get_settings()
+    started = time.monotonic()
+    now = time.time()
+    entries = scan()
+    removed = {entry.path for entry in _expire_run_artifacts(entries, now)}
+    removed |= {entry.path for entry in _remove_orphaned_derived(entries)}
+    entries = [entry for entry in entries if entry.path not in removed]
+
+    user_limit = settings.storage_user_quota_mb * 1024 * 1024
+    if user_limit > 0:
+        by_user: Dict[Optional[int], List[StorageEntry]] = {}
+        for entry in entries:
+            by_user.setdefault(entry.user_id, []).append(entry)
+        for owner, owned in by_user.items():
+            if owner is None:
+                continue
+            removed |= {entry.path for entry in _evict_until(owned, user_limit, now=now)}
+        entries = [entry for entry in entries if entry.path not in removed]
+
+    global_limit = settings.storage_global_quota_mb * 1024 * 1024
+    if global_limit > 0:
+        removed |= {entry.path for entry in _evict_until(entries, global_limit, now=now)}
+        entries = [entry for entry in entries if entry.path not in removed]
+
+    usage = summarize(entries)
+    _metrics["sweeps"] += 1
+    _metrics["last_sweep_at"] = now
+    _metrics["last_sweep_seconds"] = round(time.monotonic() - started, 4)
+    _metrics["usage_bytes"] = usage
+    _metrics["total_bytes"] = sum(usage.values())
+    return {"removed": len(removed), "usage_bytes": usage}
+
+
+def get_metrics() -> Dict[str, Any]:
+    settings = get_settings()
+    return {
+        **_metrics,
+        "evicted_by_kind": dict(_metrics["evicted_by_kind"]),
+        "user_quota_bytes": settings.storage_user_quota_mb * 1024 * 1024,
+        "global_quota_bytes": settings.storage_global_quota_mb * 1024 * 1024,
+    }
+
+
+async def _sweep_forever(interval: float) -> None:
+    while True:
+        try:
+            await asyncio.to_thread(sweep)
+        except Exception:  # pragma: no cover - keep the sweeper alive
+            logger.exception("Storage sweep failed")
+        await asyncio.sleep(interval)
+
+
+def start_sweeper() -> None:
+    global _sweeper_task
+    interval = get_settings().storage_sweep_interval_seconds
+    if interval <= 0 or (_sweeper_task and not _sweeper_task.done()):
+        return
+    _sweeper_task = asyncio.create_task(_sweep_forever(interval))
+
+
+async def stop_sweeper() -> None:
+    global _sweeper_task
+    if _sweeper_task is None:
+        return
+    _sweeper_task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await _sweeper_task
+    _sweeper_task = None
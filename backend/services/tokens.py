@@ -0,0 +1,82 @@
+import math
+import re
+
+# CJK ideographs, kana and hangul are roughly one token per character for the
+# tokenizers we target; everything else averages about four characters per token.
+_WIDE_CHARS = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+_CHARS_PER_TOKEN = 4.0
+
+
+def estimate_tokens(text: str | None) -> int:
+    """Cheap, provider-agnostic token estimate used for local budgeting."""
+    if not text:
+        return 0
+    wide = len(_WIDE_CHARS.findall(text))
+    narrow = len(text) - wide
+    return wide + math.ceil(narrow / _CHARS_PER_TOKEN)
+
+
+def match_model_budget(model: str, budgets: dict[str, int], fallback: int) -> tuple[str, int]:
+    """Map a ``provider:model`` string to a model family and its token budget.
+
+    The family is the longest key of ``budgets`` contained in the model string, falling
+    back to ``default`` (or ``fallback`` when ``budgets`` has no default).
+    """
+    lowered = model.lower()
+    matches = [key for key in budgets if key != "default" and key.lower() in lowered]
+    if matches:
+        family = max(matches, key=len)
+        return family, budgets[family]
+    return "default", budgets.get("default", fallback)
+
+
+def usage_total_tokens(usage: dict | None) -> int | None:
+    """Total tokens from a provider usage payload, whatever naming scheme it uses."""
+    if not usage:
+        return None
+    if isinstance(usage.get("total_tokens"), (int, float)):
+        return int(usage["total_tokens"])
+    total = 0
+    found = False
+    for key in ("prompt_tokens", "completion_tokens", "input_tokens", "output_tokens"):
+        value = usage.get(key)
+        if isinstance(value, (int, float)):
+            total += int(value)
+            found = True
+    return total if found else None
+
+
+def normalize_usage(usage: dict | None) -> tuple[int, int, int]:
+    """Return ``(prompt, completion, cached)`` token counts from any provider's usage payload.
+
+    ``prompt`` always includes cached prompt tokens, even for providers (Anthropic) that
+    report cache reads and writes separately from ``input_tokens``.
+    """
+    if not usage:
+        return 0, 0, 0
+
+    def count(*keys: str, source: dict | None = None) -> int:
+        source = usage if source is None else source
+        for key in keys:
+            value = source.get(key)
+            if isinstance(value, (int, float)):
+                return int(value)
+        return 0
+
+    prompt = count("prompt_tokens", "input_tokens")
+    completion = count("completion_tokens", "output_tokens")
+    cached = (
+        count("cached_tokens", "prompt_cache_hit_tokens", "cache_read_input_tokens")
+        or count("cached_tokens", source=usage.get("prompt_tokens_details") or {})
+    )
+    if "cache_read_input_tokens" in usage or "cache_creation_input_tokens" in usage:
+        prompt += count("cache_read_input_tokens") + count("cache_creation_input_tokens")
+    return prompt, completion, cached
+
+
+def with_cached_tokens(usage: dict | None) -> dict | None:
+    """Copy of ``usage`` with a top-level ``cached_tokens`` count, whatever the provider."""
+    if not usage:
+        return usage
+    _, _, cached = normalize_usage(usage)
+    return {**usage, "cached_tokens": cached}
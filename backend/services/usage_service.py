@@ -0,0 +1,253 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from databases import Database
+from sqlalchemy import func, insert, select
+
+from ..config import get_settings
+from ..database import upsert_insert
+from ..models.usage import llm_usage_events, llm_usage_rollups
+from .tokens import normalize_usage
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ("hour", "day")
+GROUP_BY_FIELDS = ("provider", "model", "endpoint")
+_ROLLUP_KEY = ("granularity", "user_id", "bucket_start", "provider", "model", "endpoint")
+_SUMMED = ("requests", "prompt_tokens", "completion_tokens", "cached_tokens", "latency_ms_sum")
+# A failed batch is retried after each delay (seconds) before its events count as lost.
+_RETRY_DELAYS = (0.5, 2.0)
+
+_queue: Optional[asyncio.Queue] = None
+_writer_task: Optional[asyncio.Task] = None
+_metrics: Dict[str, Any] = {
+    "recorded": 0,
+    "dropped": 0,
+    "written": 0,
+    "batches": 0,
+    "failed_batches": 0,
+    "retried_batches": 0,
+    "lost": 0,
+    "last_batch_ms": None,
+}
+
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def record(
+    *,
+    user_id: int,
+    provider: str,
+    model: str,
+    endpoint: str,
+    usage: Optional[Dict[str, Any]],
+    latency_ms: Optional[float] = None,
+) -> None:
+    """Queue one provider call for the ledger; never blocks or fails the request.
+
+    A hedged request also made a call whose result was discarded; it is recorded as a
+    request of its own under ``<endpoint>.hedge``, without tokens since none are reported.
+    """
+    hedged_call = (usage or {}).get("hedged_call")
+    if hedged_call:
+        model_name = hedged_call.get("model")
+        record(
+            user_id=user_id,
+            provider=hedged_call["provider"],
+            model=f"{hedged_call['provider']}:{model_name}" if model_name else hedged_call["provider"],
+            endpoint=f"{endpoint}.hedge",
+            usage=None,
+        )
+    prompt_tokens, completion_tokens, cached_tokens = normalize_usage(usage)
+    event = {
+        "user_id": user_id,
+        "provider": provider,
+        "model": model,
+        "endpoint": endpoint,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cached_tokens": cached_tokens,
+        "latency_ms": round(latency_ms, 1) if latency_ms is not None else None,
+        "created_at": datetime.utcnow(),
+    }
+    if _queue is None:
+        _metrics["dropped"] += 1
+        return
+    try:
+        _queue.put_nowait(event)
+    except asyncio.QueueFull:
+        _metrics["dropped"] += 1
+        return
+    _metrics["recorded"] += 1
+
+
+def _rollup(events: Sequence[Dict[str, Any]]) -> Dict[Tuple[Any, ...], Dict[str, Any]]:
+    totals: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+    for event in events:
+        for granularity in GRANULARITIES:
+            key = (
+                granularity,
+                event["user_id"],
+                bucket_start(event["created_at"], granularity),
+                event["provider"],
+                event["model"],
+                event["endpoint"],
+            )
+            row = totals.get(key)
+            if row is None:
+                row = totals[key] = {**dict(zip(_ROLLUP_KEY, key)), **{name: 0 for name in _SUMMED}}
+            row["requests"] += 1
+            row["prompt_tokens"] += event["prompt_tokens"]
+            row["completion_tokens"] += event["completion_tokens"]
+            row["cached_tokens"] += event["cached_tokens"]
+            row["latency_ms_sum"] += event["latency_ms"] or 0.0
+    return totals
+
+
+async def flush(db: Database, events: Sequence[Dict[str, Any]]) -> None:
+    """Write a batch of events and fold them into the rollups in one transaction."""
+    if not events:
+        return
+    async with db.transaction():
+        await db.execute_many(insert(llm_usage_events), list(events))
+        for row in _rollup(events).values():
+            statement = upsert_insert(db, llm_usage_rollups).values(**row)
+            await db.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[llm_usage_rollups.c[name] for name in _ROLLUP_KEY],
+                    set_={
+                        name: llm_usage_rollups.c[name] + statement.excluded[name] for name in _SUMMED
+                    },
+                )
+            )
+
+
+async def _write_batch(db: Database, batch: List[Dict[str, Any]]) -> None:
+    """Flush ``batch``, retrying with backoff; the flush is one transaction, so a retry
+    never double-counts. Events of a batch that keeps failing are counted as lost."""
+    started = time.perf_counter()
+    for delay in (*_RETRY_DELAYS, None):
+        try:
+            await flush(db, batch)
+            break
+        except Exception:  # pragma: no cover - keep the writer alive
+            if delay is None:
+                _metrics["failed_batches"] += 1
+                _metrics["lost"] += len(batch)
+                logger.exception("Failed to write %d usage events; giving up", len(batch))
+                return
+            _metrics["retried_batches"] += 1
+            logger.warning("Failed to write %d usage events; retrying in %.1fs", len(batch), delay)
+            await asyncio.sleep(delay)
+    _metrics["written"] += len(batch)
+    _metrics["batches"] += 1
+    _metrics["last_batch_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+
+async def _writer_loop(db: Database, queue: asyncio.Queue) -> None:
+    """Write events in batches of up to ``usage_flush_batch_size`` or every flush interval.
+
+    A ``None`` item is the shutdown sentinel: the current batch is written, then the loop ends.
+    """
+    settings = get_settings()
+    loop = asyncio.get_running_loop()
+    while True:
+        first = await queue.get()
+        if first is None:
+            return
+        batch = [first]
+        stopping = False
+        deadline = loop.time() + settings.usage_flush_interval_seconds
+        while len(batch) < settings.usage_flush_batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                stopping = True
+                break
+            batch.append(item)
+        await _write_batch(db, batch)
+        if stopping:
+            return
+
+
+def start_writer(db: Database) -> None:
+    global _queue, _writer_task
+    if _writer_task and not _writer_task.done():
+        return
+    _queue = asyncio.Queue(maxsize=get_settings().usage_queue_max_size)
+    _writer_task = asyncio.create_task(_writer_loop(db, _queue))
+
+
+async def stop_writer(db: Database) -> None:
+    """Drain queued events to the database and stop the writer."""
+    global _queue, _writer_task
+    queue, task = _queue, _writer_task
+    # Stop accepting new events first; record() counts them as dropped from here on.
+    _queue, _writer_task = None, None
+    if queue is None or task is None:
+        return
+    if not task.done():
+        await queue.put(None)
+        await task
+        return
+    # The writer died; salvage what is still queued.
+    remaining = []
+    while not queue.empty():
+        remaining.append(queue.get_nowait())
+    if remaining:
+        await _write_batch(db, remaining)
+
+
+async def query_usage(
+    db: Database,
+    *,
+    user_id: int,
+    start: datetime,
+    end: datetime,
+    granularity: str,
+    group_by: Sequence[str] = (),
+) -> List[Dict[str, Any]]:
+    """Aggregate the rollup table for ``user_id`` over ``[start, end)``.
+
+    Only rollup rows are read, so the cost depends on the number of buckets and groups
+    in range rather than on the number of underlying calls.
+    """
+    group_columns = [llm_usage_rollups.c[name] for name in group_by]
+    query = (
+        select(
+            llm_usage_rollups.c.bucket_start,
+            *group_columns,
+            *[func.sum(llm_usage_rollups.c[name]).label(name) for name in _SUMMED],
+        )
+        .where(llm_usage_rollups.c.granularity == granularity)
+        .where(llm_usage_rollups.c.user_id == user_id)
+        .where(llm_usage_rollups.c.bucket_start >= bucket_start(start, granularity))
+        .where(llm_usage_rollups.c.bucket_start < end)
+        .group_by(llm_usage_rollups.c.bucket_start, *group_columns)
+        .order_by(llm_usage_rollups.c.bucket_start, *group_columns)
+    )
+    rows = await db.fetch_all(query)
+    names = ["bucket_start", *group_by, *_SUMMED]
+    return [{name: row[name] for name in names} for row in rows]
+
+
+def default_window(granularity: str, now: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    now = now or datetime.utcnow()
+    span = timedelta(hours=48) if granularity == "hour" else timedelta(days=30)
+    return now - span, now
+
+
+def get_metrics() -> Dict[str, Any]:
+    return {**_metrics, "queued": _queue.qsize() if _queue is not None else 0}
@@ -0,0 +1,135 @@
+import asyncio
+import time
+
+import pytest
+import pytest_asyncio
+from databases import Database
+from sqlalchemy import create_engine
+
+from backend import models  # noqa: F401 - registers the tables on the metadata
+from backend.config import get_settings
+from backend.database import metadata
+from backend.devtools import stub_llm_server
+from backend.llm_adapters.http_client import http_pool
+from backend.schemas import ProviderOverride
+from backend.services import batch_service
+
+USER_ID = 1
+PROMPTS = [("a", "Sum column x."), ("b", "Plot column y."), ("c", "Count rows.")]
+
+
+@pytest_asyncio.fixture
+async def db(tmp_path):
+    path = tmp_path / "batch.db"
+    metadata.create_all(bind=create_engine(f"sqlite:///{path}"))
+    database = Database(f"sqlite+aiosqlite:///{path}")
+    await database.connect()
+    yield database
+    await database.disconnect()
+    await http_pool.aclose()
+
+
+@pytest.fixture(autouse=True)
+def batch_settings(monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "rate_limit_enabled", False)
+    stub_llm_server.faults.update(latency_ms=0, error_rate=0, fail_next=0, batch_latency_ms=50)
+    yield settings
+    stub_llm_server.faults.update(latency_ms=50, batch_latency_ms=500)
+
+
+async def _create_job(db: Database, base_url: str, mode: str = "provider") -> int:
+    return await batch_service.create_job(
+        db,
+        user_id=USER_ID,
+        model="siliconflow:stub-chat",
+        mode=mode,
+        request_kwargs={"model": "stub-chat"},
+        items=PROMPTS,
+        override=ProviderOverride(api_key="stub", base_url=base_url),
+    )
+
+
+async def _run_until_finished(db: Database, job_id: int) -> dict:
+    deadline = time.monotonic() + 10
+    while True:
+        await batch_service.run_pending(db)
+        job = await batch_service.get_job(db, job_id, user_id=USER_ID)
+        if job["status"] not in batch_service.ACTIVE_STATUSES:
+            return job
+        assert time.monotonic() < deadline, f"job still {job['status']}"
+        await asyncio.sleep(0.05)
+
+
+@pytest.mark.asyncio
+async def test_provider_batch_is_submitted_polled_and_read_back(stub_url, db):
+    job_id = await _create_job(db, stub_url)
+
+    await batch_service.run_pending(db)
+    job = await batch_service.get_job(db, job_id, user_id=USER_ID)
+    assert job["status"] == "running"
+    assert job["provider_batch_id"] in stub_llm_server.batches
+
+    job = await _run_until_finished(db, job_id)
+    assert (job["status"], job["completed"], job["failed"]) == ("completed", 3, 0)
+    items = await batch_service.list_items(db, job_id)
+    assert [item["custom_id"] for item in items] == ["a", "b", "c"]
+    assert all(item["content"] == stub_llm_server.REPLY for item in items)
+    assert all(item["usage"]["total_tokens"] > 0 for item in items)
+
+
+@pytest.mark.asyncio
+async def test_expired_provider_batch_fails_pending_items(stub_url, db, batch_settings):
+    stub_llm_server.faults["batch_latency_ms"] = 5000
+    job_id = await _create_job(db, stub_url)
+    await batch_service.run_pending(db)
+    job = await batch_service.get_job(db, job_id, user_id=USER_ID)
+    stub_llm_server.batches[job["provider_batch_id"]]["status"] = "expired"
+
+    job = await _run_until_finished(db, job_id)
+    assert (job["status"], job["completed"], job["failed"]) == ("failed", 0, 3)
+    items = await batch_service.list_items(db, job_id)
+    assert {item["error"] for item in items} == {"Provider batch expired."}
+
+
+@pytest.mark.asyncio
+async def test_cancel_job_cancels_the_provider_batch(stub_url, db):
+    stub_llm_server.faults["batch_latency_ms"] = 5000
+    job_id = await _create_job(db, stub_url)
+    await batch_service.run_pending(db)
+    job = await batch_service.get_job(db, job_id, user_id=USER_ID)
+
+    cancelled = await batch_service.cancel_job(db, job_id, user_id=USER_ID)
+    assert cancelled["status"] == "cancelled"
+    assert stub_llm_server.batches[job["provider_batch_id"]]["status"] == "cancelled"
+    items = await batch_service.list_items(db, job_id)
+    assert {item["status"] for item in items} == {"cancelled"}
+
+    # A later pass leaves the cancelled job alone.
+    await batch_service.run_pending(db)
+    job = await batch_service.get_job(db, job_id, user_id=USER_ID)
+    assert job["status"] == "cancelled"
+
+
+@pytest.mark.asyncio
+async def test_worker_mode_generates_each_item(stub_url, db):
+    job_id = await _create_job(db, stub_url, mode="worker")
+
+    job = await _run_until_finished(db, job_id)
+    assert (job["status"], job["completed"], job["failed"]) == ("completed", 3, 0)
+    assert job["provider_batch_id"] is None
+
+
+@pytest.mark.asyncio
+async def test_failed_submission_falls_back_to_the_worker(db, batch_settings, monkeypatch):
+    # Nothing listens there, so both the batch upload and the worker's calls fail.
+    monkeypatch.setattr(batch_settings, "llm_retry_max_attempts", 1)
+    job_id = await _create_job(db, "http://127.0.0.1:9")
+
+    await batch_service.run_pending(db)
+    job = await batch_service.get_job(db, job_id, user_id=USER_ID)
+    assert job["mode"] == "worker"
+    assert job["error"].startswith("Provider batch submission failed")
+
+    job = await _run_until_finished(db, job_id)
+    assert (job["status"], job["failed"]) == ("completed", 3)
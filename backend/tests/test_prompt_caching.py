@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from backend.api.chat import _build_prompt_messages
+from backend.config import get_settings
+from backend.devtools import stub_llm_server
+from backend.llm_adapters.anthropic_adapter import AnthropicAdapter
+from backend.llm_adapters.http_client import http_pool
+from backend.llm_adapters.resilience import ResilientAdapter
+from backend.llm_adapters.siliconflow_adapter import SiliconFlowAdapter
+from backend.schemas import ChatMessagePayload
+from backend.services import chat_context, usage_service
+from backend.services.tokens import with_cached_tokens
+
+# Long enough to pass OpenAI's 1024-token minimum for automatic prefix caching.
+SCRIPT = "\n".join(f"df['c{index}'] = df['a'] * {index}" for index in range(300))
+QUESTIONS = ["Describe the dataset.", "Now plot column c3."]
+
+
+@pytest.fixture
+def ledger(monkeypatch):
+    monkeypatch.setattr(get_settings(), "llm_prompt_caching", True)
+    stub_llm_server.faults.update(latency_ms=0, error_rate=0, fail_next=0)
+    stub_llm_server._prefix_cache.clear()
+    queue: asyncio.Queue = asyncio.Queue()
+    monkeypatch.setattr(usage_service, "_queue", queue)
+    yield queue
+    stub_llm_server.faults.update(latency_ms=50)
+
+
+async def _two_turns(adapter, queue: asyncio.Queue, api: str) -> list[dict]:
+    """Run two chat turns the way /chat/send does and return each turn's request,
+    response usage and ledger event."""
+    history: list[ChatMessagePayload] = []
+    turns = []
+    for question in QUESTIONS:
+        history.append(ChatMessagePayload(role="user", content=question))
+        messages, _ = _build_prompt_messages(
+            history, None, SCRIPT, model=f"{adapter.name}:stub-chat"
+        )
+        result = await adapter.chat(messages, model="stub-chat")
+        usage = with_cached_tokens(result.get("usage"))
+        chat_context.record_usage(usage)
+        usage_service.record(
+            user_id=1, provider=adapter.name, model="stub-chat", endpoint="chat.send", usage=usage
+        )
+        turns.append(
+            {
+                "request": stub_llm_server.last_requests[api],
+                "usage": usage,
+                "event": queue.get_nowait(),
+            }
+        )
+        history.append(ChatMessagePayload(role="assistant", content=result["message"]["content"]))
+    return turns
+
+
+@pytest.mark.asyncio
+async def test_anthropic_breakpoints_and_cached_tokens(stub_url, ledger):
+    adapter = ResilientAdapter(AnthropicAdapter(api_key="stub", base_url=stub_url))
+    cached_before = chat_context.get_metrics()["cached_prompt_tokens"]
+    try:
+        first, second = await _two_turns(adapter, ledger, "messages")
+    finally:
+        await http_pool.aclose()
+
+    system = second["request"]["system"]
+    assert "cache_control" in system[-1]
+    assert all("cache_control" not in block for block in system[:-1])
+    turns = second["request"]["messages"]
+    assert [turn["role"] for turn in turns] == ["user", "assistant", "user"]
+    marked = [
+        (index, position)
+        for index, turn in enumerate(turns)
+        for position, block in enumerate(turn["content"])
+        if "cache_control" in block
+    ]
+    # The turn before the latest one, on its last block.
+    assert marked == [(1, len(turns[1]["content"]) - 1)]
+
+    assert first["usage"]["cached_tokens"] == 0
+    cached = second["usage"]["cached_tokens"]
+    assert cached == second["usage"]["cache_read_input_tokens"] > 0
+    assert second["event"]["cached_tokens"] == cached
+    assert chat_context.get_metrics()["cached_prompt_tokens"] - cached_before == cached
+
+
+@pytest.mark.asyncio
+async def test_openai_compatible_prefix_reports_cached_tokens(stub_url, ledger):
+    adapter = ResilientAdapter(SiliconFlowAdapter(api_key="stub", base_url=stub_url))
+    try:
+        first, second = await _two_turns(adapter, ledger, "chat")
+    finally:
+        await http_pool.aclose()
+
+    # The stable prefix (instructions and the task script) comes first on both turns.
+    assert second["request"]["messages"][:2] == first["request"]["messages"][:2]
+    assert first["usage"]["cached_tokens"] == 0
+    cached = second["usage"]["cached_tokens"]
+    assert cached == second["usage"]["prompt_tokens_details"]["cached_tokens"] >= 1024
+    assert second["event"]["cached_tokens"] == cached
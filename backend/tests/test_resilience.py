@@ -0,0 +1,133 @@
+import asyncio
+import contextlib
+
+import pytest
+
+from backend.config import get_settings
+from backend.devtools import stub_llm_server
+from backend.llm_adapters.http_client import http_pool
+from backend.llm_adapters.resilience import CircuitOpenError, ResilientAdapter, provider_health
+from backend.llm_adapters.siliconflow_adapter import SiliconFlowAdapter
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+@pytest.fixture
+def breaker_settings(monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "llm_circuit_failure_threshold", 1)
+    monkeypatch.setattr(settings, "llm_circuit_reset_seconds", 0)
+    monkeypatch.setattr(settings, "llm_retry_max_attempts", 1)
+    monkeypatch.setattr(settings, "llm_hedge_enabled", False)
+    stub_llm_server.faults.update(latency_ms=0, slow_rate=0, fail_next=0, error_rate=0)
+    provider_health("siliconflow").breaker.record_success()
+    yield settings
+    stub_llm_server.faults.update(latency_ms=50, slow_rate=0, fail_next=0)
+    provider_health("siliconflow").breaker.record_success()
+
+
+async def _open_breaker(adapter: ResilientAdapter) -> None:
+    stub_llm_server.faults["fail_next"] = 1
+    with pytest.raises(Exception):
+        await adapter.chat(MESSAGES)
+    assert adapter.health.breaker.state == "open"
+
+
+@pytest.mark.asyncio
+async def test_cancelled_half_open_trial_reopens_breaker(stub_url, breaker_settings):
+    adapter = ResilientAdapter(SiliconFlowAdapter(api_key="stub", base_url=stub_url))
+    try:
+        await _open_breaker(adapter)
+
+        # The trial call hangs on a slow response and is cancelled, as a hedge loser or
+        # a disconnected client would be.
+        stub_llm_server.faults.update(slow_rate=1, slow_ms=5000)
+        trial = asyncio.create_task(adapter.chat(MESSAGES))
+        await asyncio.sleep(0.2)
+        assert adapter.health.breaker.state == "half_open"
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        assert adapter.health.breaker.state == "open"
+
+        # The next call is admitted as a new trial and closes the breaker.
+        stub_llm_server.faults.update(slow_rate=0)
+        result = await adapter.chat(MESSAGES)
+        assert result["message"]["content"]
+        assert adapter.health.breaker.state == "closed"
+    finally:
+        await http_pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_stream_closed_early_releases_trial(stub_url, breaker_settings):
+    adapter = ResilientAdapter(SiliconFlowAdapter(api_key="stub", base_url=stub_url))
+    try:
+        await _open_breaker(adapter)
+
+        stream = adapter.stream_chat(MESSAGES)
+        await stream.__anext__()
+        await stream.aclose()
+        assert adapter.health.breaker.state == "open"
+
+        async for _ in adapter.stream_chat(MESSAGES):
+            pass
+        assert adapter.health.breaker.state == "closed"
+    finally:
+        await http_pool.aclose()
+
+
+def test_calls_outside_the_trial_do_not_release_it(breaker_settings):
+    breaker = provider_health("siliconflow").breaker
+    breaker.record_failure()
+    assert breaker.before_call("siliconflow") is True
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call("siliconflow")
+    breaker.record_abandoned(False)
+    assert breaker.state == "half_open"
+    with contextlib.suppress(CircuitOpenError):
+        breaker.before_call("siliconflow")
+    breaker.record_abandoned(True)
+    assert breaker.state == "open"
+
+
+@pytest.mark.asyncio
+async def test_client_errors_leave_the_failure_count_alone(stub_url, breaker_settings):
+    breaker_settings.llm_circuit_failure_threshold = 2
+    adapter = ResilientAdapter(SiliconFlowAdapter(api_key="stub", base_url=stub_url))
+    try:
+        stub_llm_server.faults["fail_next"] = 1
+        with pytest.raises(Exception):
+            await adapter.chat(MESSAGES)
+        stub_llm_server.faults.update(fail_next=1, error_status=400)
+        with pytest.raises(Exception):
+            await adapter.chat(MESSAGES)
+        assert adapter.health.breaker.consecutive_failures == 1
+
+        stub_llm_server.faults.update(fail_next=1, error_status=503)
+        with pytest.raises(Exception):
+            await adapter.chat(MESSAGES)
+        assert adapter.health.breaker.state == "open"
+    finally:
+        stub_llm_server.faults["error_status"] = 503
+        await http_pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_client_error_on_the_trial_keeps_the_breaker_half_open(stub_url, breaker_settings):
+    adapter = ResilientAdapter(SiliconFlowAdapter(api_key="stub", base_url=stub_url))
+    try:
+        await _open_breaker(adapter)
+
+        stub_llm_server.faults.update(fail_next=1, error_status=401)
+        with pytest.raises(Exception):
+            await adapter.chat(MESSAGES)
+        assert adapter.health.breaker.state == "half_open"
+
+        # The trial is released, so the next call is admitted as a new one.
+        result = await adapter.chat(MESSAGES)
+        assert result["message"]["content"]
+        assert adapter.health.breaker.state == "closed"
+    finally:
+        stub_llm_server.faults["error_status"] = 503
+        await http_pool.aclose()
@@ -11,6 +11,9 @@ export interface WorkspaceChatMessage {
   content: string;
   reasoning?: string | null;
   patch?: string | null;
+  // The server's result of applying `patch` to `patchBase`, the script sent with the turn.
+  patchedCode?: string | null;
+  patchBase?: string | null;
   usage?: Record<string, unknown> | null;
 }
 
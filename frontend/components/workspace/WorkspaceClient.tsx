@@ -273,6 +273,9 @@ export function WorkspaceClient() {
 
   const [chatMessages, setChatMessages] = useState<WorkspaceChatMessage[]>([]);
   const [chatSessionId, setChatSessionId] = useState<number | null>(null);
+  const [chatRevision, setChatRevision] = useState<{ id: number; taskId: number; code: string } | null>(
+    null
+  );
   const [isChatting, setIsChatting] = useState(false);
   const [chatError, setChatError] = useState<string | null>(null);
 
@@ -480,6 +483,7 @@ export function WorkspaceClient() {
         model,
         taskType,
         datasetContext,
+        datasetFilename: dataset?.filename,
       });
       setCode(response.code ?? "");
 
@@ -563,10 +567,17 @@ export function WorkspaceClient() {
       setIsChatting(true);
       setChatError(null);
 
-      const payloadMessages: ChatMessagePayload[] = pendingHistory.map((message) => ({
-        role: message.role,
-        content: message.content,
-      }));
+      // Once the session exists the server keeps its history; send only the new turn.
+      const payloadMessages: ChatMessagePayload[] | undefined = chatSessionId
+        ? undefined
+        : pendingHistory.map((message) => ({
+            role: message.role,
+            content: message.content,
+          }));
+
+      // The server already stores this script as a revision; refer to it instead of resending it.
+      const knownRevision =
+        chatRevision && chatRevision.taskId === taskId && chatRevision.code === code ? chatRevision.id : null;
 
       try {
         const response = await sendChat({
@@ -574,20 +585,27 @@ export function WorkspaceClient() {
           sessionId: chatSessionId ?? undefined,
           taskId: taskId ?? undefined,
           messages: payloadMessages,
+          message: chatSessionId ? input : undefined,
           context: {
-            code_snapshot: code,
+            code_snapshot: knownRevision ? null : code,
+            revision_id: knownRevision,
             stdout: executionResult?.stdout ?? null,
             stderr: executionResult?.stderr ?? null,
           },
         });
 
         setChatSessionId(response.session_id);
+        if (response.revision_id && taskId) {
+          setChatRevision({ id: response.revision_id, taskId, code });
+        }
         const assistantMessage: WorkspaceChatMessage = {
           id: createMessageId(),
           role: "assistant",
           content: response.message.content,
           reasoning: response.reasoning ?? null,
           patch: response.patch ?? null,
+          patchedCode: response.patched_code ?? null,
+          patchBase: code,
           usage: response.usage ?? undefined,
         };
         setChatMessages((prev) => [...prev, assistantMessage]);
@@ -601,6 +619,7 @@ export function WorkspaceClient() {
       chatMessages,
       model,
       chatSessionId,
+      chatRevision,
       taskId,
       code,
       executionResult,
@@ -615,6 +634,11 @@ export function WorkspaceClient() {
     const patchText = message.patch;
     setChatError(null);
     setCode((prev) => {
+      // The server already applied and checked the patch against this exact script.
+      if (message.patchedCode && message.patchBase === prev) {
+        return message.patchedCode;
+      }
+
       let patchBody = patchText.trim();
 
       if (patchBody.startsWith("```")) {
@@ -801,7 +825,7 @@ export function WorkspaceClient() {
                 <input
                   ref={fileInputRef}
                   type="file"
-                  accept=".csv,.xlsx,.xls"
+                  accept=".csv,.xlsx,.xls,.gz,.zst,.parquet,.feather"
                   onChange={(event) => {
                     void handleFileChange(event.target.files?.[0]);
                   }}
@@ -11,6 +11,7 @@ export interface LLMGeneratePayload {
   model: string;
   taskType?: TaskType;
   datasetContext?: string;
+  datasetFilename?: string;
   providerOverrides?: ProviderOverrideMap;
 }
 
@@ -124,6 +125,7 @@ export interface ChatMessagePayload {
 
 export interface ChatContext {
   code_snapshot?: string | null;
+  revision_id?: number | null;
   stdout?: string | null;
   stderr?: string | null;
 }
@@ -132,7 +134,8 @@ export interface ChatSendRequest {
   model: string;
   sessionId?: number;
   taskId?: number;
-  messages: ChatMessagePayload[];
+  messages?: ChatMessagePayload[];
+  message?: string;
   context?: ChatContext;
   providerOverrides?: ProviderOverrideMap;
 }
@@ -142,7 +145,10 @@ export interface ChatMessageResponse {
   message: ChatMessagePayload;
   reasoning?: string | null;
   patch?: string | null;
+  patched_code?: string | null;
+  patch_status?: "applied" | "fuzzy" | "regenerated" | "syntax_error" | "failed" | null;
   usage?: Record<string, unknown> | null;
+  revision_id?: number | null;
 }
 
 export interface ChatSessionSummary {
@@ -236,6 +242,7 @@ export function generateCode(payload: LLMGeneratePayload) {
       model: payload.model,
       task_type: payload.taskType ?? "analysis",
       dataset_context: payload.datasetContext,
+      dataset_filename: payload.datasetFilename,
       provider_overrides: serializeProviderOverrides(payload.providerOverrides),
     }),
   });
@@ -311,6 +318,7 @@ export function sendChat(payload: ChatSendRequest) {
       session_id: payload.sessionId,
       task_id: payload.taskId,
       messages: payload.messages,
+      message: payload.message,
       context: payload.context,
       provider_overrides: serializeProviderOverrides(payload.providerOverrides),
     }),
@@ -54,7 +54,7 @@ export const workspaceTexts = {
     uploaded: "已上传：",
     rowsLabel: "行",
     colsLabel: "列",
-    csvSupport: "支持 CSV / Excel 文件",
+    csvSupport: "支持 CSV（含 .gz/.zst 压缩）/ Excel / Parquet / Feather 文件",
     generating: "生成中...",
     genCode: "生成 Python 代码",
     taskIdLbl: "任务 ID：",
@@ -98,7 +98,7 @@ export const workspaceTexts = {
     uploaded: "Uploaded:",
     rowsLabel: "rows",
     colsLabel: "columns",
-    csvSupport: "CSV / Excel supported",
+    csvSupport: "CSV (incl. .gz/.zst) / Excel / Parquet / Feather supported",
     generating: "Generating...",
     genCode: "Generate Python code",
     taskIdLbl: "Task ID:",